@@ -29,6 +29,9 @@ for node in doc.nodes.nodes:
     # Set the attribute on the node element
     node.elem.set("target_length", f"{random_length:.6g}")
 
+# Split long and merge short wall segments toward the <nodes> target_length
+# doc.remesh()
+
 # ── housekeeping and save ────────────────────────────────────────────────
 objectify.deannotate(doc.root, cleanup_namespaces=True)
 etree.indent(doc.tree, space="   ")
@@ -0,0 +1,266 @@
+"""
+render_frames.py
+Headless renderer of stored VirtualLeaf snapshots (leaf.NNNNNN.xml) to PNG.
+
+The cell polygons are rasterised with a vectorized scanline fill (NumPy only,
+the PNG encoder uses zlib), coloured by cell type or by the concentration of
+one chemical.  Frames are rendered in parallel worker processes, so batch runs
+can switch off the PNG export of the simulator and pictures are made later,
+only for the frames that are needed::
+
+    python render_frames.py /path/to/datadir -o frames --chem 0 --workers 8
+"""
+from __future__ import annotations
+import argparse
+import glob
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from snapshot_series import find_snapshots as find_series, snapshot_step
+from virtualleaf_xml_model import VirtualLeaf_XML
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Colours
+# ─────────────────────────────────────────────────────────────────────────────
+CELL_TYPE_COLORS = np.array([
+    (0xd9, 0xd9, 0xd9), (0x66, 0xc2, 0xa5), (0xfc, 0x8d, 0x62), (0x8d, 0xa0, 0xcb),
+    (0xe7, 0x8a, 0xc3), (0xa6, 0xd8, 0x54), (0xff, 0xd9, 0x2f), (0xe5, 0xc4, 0x94),
+], dtype=np.uint8)
+
+# a few stops of the viridis colour map, low to high concentration
+CHEM_RAMP = np.array([
+    (0x44, 0x01, 0x54), (0x3b, 0x52, 0x8b), (0x21, 0x90, 0x8c),
+    (0x5d, 0xc8, 0x63), (0xfd, 0xe7, 0x25),
+], dtype=float)
+
+BACKGROUND = (255, 255, 255)
+OUTLINE = (0, 0, 0)
+
+
+def ramp_colors(values: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Map *values* linearly from [low, high] onto :data:`CHEM_RAMP`."""
+    span = high - low if high > low else 1.0
+    t = np.clip((values - low) / span, 0.0, 1.0) * (len(CHEM_RAMP) - 1)
+    i = np.minimum(t.astype(int), len(CHEM_RAMP) - 2)
+    f = (t - i)[:, None]
+    return np.rint(CHEM_RAMP[i] * (1 - f) + CHEM_RAMP[i + 1] * f).astype(np.uint8)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Snapshot geometry
+# ─────────────────────────────────────────────────────────────────────────────
+def read_snapshot(path: str, chem: Optional[int] = None
+                  ) -> Tuple[np.ndarray, List[np.ndarray], np.ndarray]:
+    """
+    Return the node coordinates (N, 2), the ring of every living cell and one
+    value per cell: the cell type, or the concentration of chemical *chem*.
+    """
+    doc = VirtualLeaf_XML(path, objectified=False)
+    coords = np.array([(n.x, n.y) for n in doc.nodes.nodes], dtype=float).reshape(-1, 2)
+    rings, values = [], []
+    for cell in doc.cells.cells:
+        if cell.attributes.get("dead", "false") == "true" or len(cell.vertices) < 3:
+            continue
+        rings.append(np.asarray(cell.vertices, dtype=int))
+        if chem is None:
+            values.append(cell.cell_type)
+        else:
+            chems = cell.elem.xpath("./chem/val/@v")
+            values.append(float(chems[chem]) if chem < len(chems) else 0.0)
+    return coords, rings, np.asarray(values, dtype=float)
+
+
+def ring_edges(coords: np.ndarray, rings: Sequence[np.ndarray]
+               ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Start and end points of all ring edges and the cell of every edge."""
+    if not rings:
+        empty = np.zeros((0, 2))
+        return empty, empty, np.zeros(0, dtype=int)
+    a = np.concatenate(rings)
+    b = np.concatenate([np.roll(r, -1) for r in rings])
+    cell = np.repeat(np.arange(len(rings)), [len(r) for r in rings])
+    return coords[a], coords[b], cell
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Rasterisation
+# ─────────────────────────────────────────────────────────────────────────────
+def scanline_fill(p0: np.ndarray, p1: np.ndarray, cell: np.ndarray,
+                  width: int, height: int) -> np.ndarray:
+    """
+    Label image (height, width) of the polygons given by their edges in pixel
+    coordinates; -1 where no cell covers the pixel centre.
+
+    Every edge is intersected with the pixel-centre rows it crosses, all at
+    once.  Sorting the crossings by (cell, row, x) pairs them into spans
+    (even-odd rule) and the spans are written in one scatter.
+    """
+    labels = np.full(height * width, -1, dtype=np.int64)
+    y0, y1 = p0[:, 1], p1[:, 1]
+    lo, hi = np.minimum(y0, y1), np.maximum(y0, y1)
+    # rows r with lo <= r + 0.5 < hi, clipped to the image
+    first = np.clip(np.ceil(lo - 0.5), 0, height).astype(np.int64)
+    last = np.clip(np.ceil(hi - 0.5), 0, height).astype(np.int64)
+    count = np.maximum(last - first, 0)
+    edge = np.repeat(np.arange(len(p0)), count)
+    if len(edge) == 0:
+        return labels.reshape(height, width)
+    row = first[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(count) - count, count)
+    y = row + 0.5
+    x = p0[edge, 0] + (y - y0[edge]) * (p1[edge, 0] - p0[edge, 0]) / (y1[edge] - y0[edge])
+
+    order = np.lexsort((x, row, cell[edge]))
+    x, row, owner = x[order].reshape(-1, 2), row[order][::2], cell[edge][order][::2]
+    start = np.clip(np.ceil(x[:, 0] - 0.5), 0, width).astype(np.int64)
+    stop = np.clip(np.ceil(x[:, 1] - 0.5), 0, width).astype(np.int64)
+    length = np.maximum(stop - start, 0)
+    span = np.repeat(np.arange(len(start)), length)
+    pixel = row[span] * width + start[span] + np.arange(len(span)) - np.repeat(np.cumsum(length) - length, length)
+    labels[pixel] = owner[span]
+    return labels.reshape(height, width)
+
+
+def draw_lines(image: np.ndarray, p0: np.ndarray, p1: np.ndarray, color) -> None:
+    """One pixel wide lines, every segment sampled at pixel steps."""
+    height, width = image.shape[:2]
+    steps = np.ceil(np.abs(p1 - p0).max(axis=1)).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(p0)), steps)
+    t = (np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.maximum(steps - 1, 1)[segment]
+    points = p0[segment] + (p1[segment] - p0[segment]) * t[:, None]
+    i = np.floor(points[:, 1]).astype(np.int64)
+    j = np.floor(points[:, 0]).astype(np.int64)
+    inside = (i >= 0) & (i < height) & (j >= 0) & (j < width)
+    image[i[inside], j[inside]] = color
+
+
+def render(coords: np.ndarray, rings: Sequence[np.ndarray], colors: np.ndarray,
+           width: int = 800, height: int = 800, margin: int = 10,
+           bounds: Optional[Sequence[float]] = None, outline: bool = True) -> np.ndarray:
+    """
+    RGB image (height, width, 3) of the cells, cell *k* filled with
+    ``colors[k]``.  *bounds* (xmin, ymin, xmax, ymax) fixes the view, by
+    default the tissue fills the frame.  The y axis points down, as on screen
+    in VirtualLeaf.
+    """
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[...] = BACKGROUND
+    p0, p1, cell = ring_edges(coords, rings)
+    if len(cell) == 0:
+        return image
+    if bounds is None:
+        used = np.concatenate([p0, p1])
+        bounds = (*used.min(axis=0), *used.max(axis=0))
+    xmin, ymin, xmax, ymax = map(float, bounds)
+    scale = min((width - 2 * margin) / max(xmax - xmin, 1e-12),
+                (height - 2 * margin) / max(ymax - ymin, 1e-12))
+    offset = np.array([(width - scale * (xmax - xmin)) / 2 - scale * xmin,
+                       (height - scale * (ymax - ymin)) / 2 - scale * ymin])
+    p0, p1 = p0 * scale + offset, p1 * scale + offset
+
+    labels = scanline_fill(p0, p1, cell, width, height)
+    covered = labels >= 0
+    image[covered] = colors[labels[covered]]
+    if outline:
+        draw_lines(image, p0, p1, OUTLINE)
+    return image
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PNG output
+# ─────────────────────────────────────────────────────────────────────────────
+def write_png(path: str, image: np.ndarray) -> None:
+    """Write an RGB uint8 image as an 8 bit PNG."""
+    height, width = image.shape[:2]
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = np.zeros((height, 1 + 3 * width), dtype=np.uint8)      # filter type 0
+    raw[:, 1:] = image.reshape(height, 3 * width)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Frames
+# ─────────────────────────────────────────────────────────────────────────────
+def render_frame(path: str, outfile: str, chem: Optional[int] = None,
+                 value_range: Optional[Sequence[float]] = None, **options) -> str:
+    """Render one snapshot XML to *outfile*; returns *outfile*."""
+    coords, rings, values = read_snapshot(path, chem)
+    if chem is None:
+        colors = CELL_TYPE_COLORS[values.astype(int) % len(CELL_TYPE_COLORS)]
+    else:
+        if value_range is not None:
+            low, high = value_range
+        else:
+            low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+        colors = ramp_colors(values, low, high)
+    write_png(outfile, render(coords, rings, colors, **options))
+    return outfile
+
+
+def find_snapshots(inputs: Sequence[str]) -> List[str]:
+    """
+    Snapshot XMLs of directories, glob patterns or files, in frame order:
+    sorted by step number (see :func:`snapshot_series.find_snapshots`), so
+    ``leaf.1000000.xml`` comes after ``leaf.999999.xml``.
+    """
+    paths = set()
+    for pattern in inputs:
+        paths.update(find_series(pattern) if os.path.isdir(pattern) else glob.glob(pattern))
+    return sorted(paths, key=lambda p: (snapshot_step(p), p))
+
+
+def render_frames(paths: Sequence[str], outdir: str, workers: Optional[int] = None,
+                  **options) -> List[str]:
+    """
+    Render every snapshot in *paths* to ``outdir/<name>.png`` in parallel
+    worker processes; returns the PNG names in the order of *paths*.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    outfiles = [os.path.join(outdir, os.path.splitext(os.path.basename(p))[0] + ".png") for p in paths]
+    if workers == 1:
+        return [render_frame(p, o, **options) for p, o in zip(paths, outfiles)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_frame, p, o, **options) for p, o in zip(paths, outfiles)]
+        return [future.result() for future in futures]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Render leaf.NNNNNN.xml snapshots to PNG frames")
+    parser.add_argument("inputs", nargs="+", help="snapshot directories, xml files or glob patterns")
+    parser.add_argument("-o", "--outdir", default="frames", help="directory of the PNG frames")
+    parser.add_argument("--chem", type=int, default=None,
+                        help="colour by the concentration of this chemical instead of the cell type")
+    parser.add_argument("--range", dest="value_range", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        help="fixed concentration range, default: the range of each frame")
+    parser.add_argument("--bounds", type=float, nargs=4, metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+                        help="fixed view of the tissue, default: fit each frame")
+    parser.add_argument("--size", type=int, nargs=2, default=(800, 800), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--every", type=int, default=1, help="render every n-th snapshot only")
+    parser.add_argument("--no-outline", action="store_true", help="do not draw the cell walls")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes")
+    args = parser.parse_args(argv)
+
+    paths = find_snapshots(args.inputs)[::max(args.every, 1)]
+    if not paths:
+        parser.error("no snapshots found")
+    outfiles = render_frames(paths, args.outdir, args.workers, chem=args.chem,
+                             value_range=args.value_range, width=args.size[0],
+                             height=args.size[1], bounds=args.bounds,
+                             outline=not args.no_outline)
+    print(f"Rendered {len(outfiles)} frames to {args.outdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+run_archive.py
+Packed single-file archive of the leaf.NNNNNN.xml snapshots of a run.
+
+Every snapshot is split into typed streams and a *skeleton*: the XML with the
+values of those streams replaced by placeholders.
+
+    coords    node x/y                 float64, float32 or delta encoded
+    topology  cell rings, cell walls,  int32, stored only when it changes
+              wall end points and cells
+    chem      chemical values          float64, per cell
+    numbers   every other number       float64, zlib (ints are marked as such)
+
+The skeleton is zlib compressed and, like the topology, stored only when it
+differs from the one of the previous snapshot; it holds the parameter block,
+the settings and all text values verbatim.  An offset index at the end of the
+file gives O(1) access to any step through a memory map, and
+:meth:`RunArchive.to_leafml` rebuilds the LeafML of a stored step.  With
+float64 or delta coordinates the export is lossless: it parses to the same
+values as the original (numbers are written in their shortest exact form).
+
+Delta coordinates are the float64 bit patterns XOR-ed with those of the last
+keyframe and zlib compressed; decoding a step reads the keyframe and one
+record, never a chain of deltas::
+
+    python run_archive.py pack /path/to/datadir -o run.vla --coords delta
+    python run_archive.py info run.vla
+    python run_archive.py export run.vla 1200 -o leaf.001200.xml
+"""
+from __future__ import annotations
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from lxml import etree
+
+from snapshot_series import Snapshot, find_snapshots, imap_ordered, snapshot_step
+
+
+MAGIC = b"VLARC\x00\x01\x00"
+END_MAGIC = b"VLARCEND"
+INDEX_DTYPE = np.dtype([("step", "<i8"), ("simtime", "<f8"), ("offset", "<u8"), ("size", "<u8")])
+COORD_MODES = ("float64", "float32", "delta")
+
+_INT = re.compile(r"[-+]?\d+\Z")
+_FLOAT = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\Z")
+_VERBATIM = ("parameter", "settings")                     # kept as text
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Snapshot ⇄ skeleton + streams
+# ─────────────────────────────────────────────────────────────────────────────
+def _stream(tag: str, parent: str, attr: str) -> Optional[str]:
+    """The typed stream of an attribute, None for the generic numbers."""
+    if tag == "node":
+        if parent == "nodes" and attr in ("x", "y"):
+            return "coords"
+        if parent in ("cell", "boundary_polygon") and attr == "n":
+            return "ring_nodes"
+    elif tag == "wall":
+        if parent == "cell" and attr == "w":
+            return "cell_walls"
+        if parent == "walls" and attr in ("n1", "n2", "c1", "c2"):
+            return "wall_ends"
+    elif tag == "val" and parent == "chem" and attr == "v":
+        return "chem"
+    return None
+
+
+def _walk(root) -> Iterator[Tuple[Any, str]]:
+    """Elements with their parent tag in document order, without the verbatim blocks."""
+    yield root, ""
+    stack = [(child, root.tag) for child in reversed(root) if child.tag not in _VERBATIM]
+    while stack:
+        elem, parent = stack.pop()
+        if not isinstance(elem.tag, str):                   # comments, PIs
+            continue
+        yield elem, parent
+        stack.extend((child, elem.tag) for child in reversed(elem))
+
+
+def split_snapshot(path: str) -> Dict[str, Any]:
+    """
+    Skeleton bytes and streams of one snapshot file.  Placeholders are ``#``
+    (typed streams), ``#i`` and ``#f`` (numbers); text values starting with
+    ``#`` are escaped as ``##…``.
+    """
+    root = etree.parse(path).getroot()
+    simtime = float(root.attrib.get("simtime", "nan"))
+    streams: Dict[str, List[float]] = {"coords": [], "ring_nodes": [], "cell_walls": [],
+                                       "wall_ends": [], "chem": [], "numbers": []}
+    ring_counts, ring_is_cell, chem_counts = [], [], []
+    for elem, parent in _walk(root):
+        tag = elem.tag
+        if tag in ("cell", "boundary_polygon") and parent == "cells":
+            ring_counts.append(0)
+            ring_is_cell.append(tag == "cell")
+            chem_counts.append(0)
+        attrib = elem.attrib
+        for attr, value in attrib.items():
+            stream = _stream(tag, parent, attr)
+            if stream in ("ring_nodes", "chem") and not ring_counts:
+                stream = None                               # outside <cells>
+            if stream is not None and (_INT if stream in ("ring_nodes", "cell_walls", "wall_ends") else _FLOAT).match(value):
+                streams[stream].append(float(value))
+                attrib[attr] = "#"
+                if stream == "ring_nodes":
+                    ring_counts[-1] += 1
+                elif stream == "chem":
+                    chem_counts[-1] += 1
+            elif stream is None and _INT.match(value) and abs(int(value)) < 2**53:
+                streams["numbers"].append(float(value))
+                attrib[attr] = "#i"
+            elif stream is None and _FLOAT.match(value):
+                streams["numbers"].append(float(value))
+                attrib[attr] = "#f"
+            elif value.startswith("#"):
+                attrib[attr] = "#" + value
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in streams.items()}
+    for name in ("ring_nodes", "cell_walls", "wall_ends"):
+        arrays[name] = arrays[name].astype(np.int32)
+    arrays["ring_counts"] = np.asarray(ring_counts, dtype=np.int32)
+    arrays["ring_is_cell"] = np.asarray(ring_is_cell, dtype=np.int8)
+    arrays["chem_counts"] = np.asarray(chem_counts, dtype=np.int32)
+    parameter = root.find("parameter")
+    return {
+        "step": snapshot_step(path),
+        "simtime": simtime,
+        "parameter": etree.tostring(parameter, encoding="unicode", with_tail=False) if parameter is not None else "",
+        "skeleton": etree.tostring(root, encoding="UTF-8"),
+        "arrays": arrays,
+    }
+
+
+def join_snapshot(skeleton: bytes, arrays: Dict[str, np.ndarray]) -> bytes:
+    """LeafML bytes of a skeleton with its placeholders filled from *arrays*."""
+    root = etree.fromstring(skeleton)
+    streams = {name: iter(arrays[name].tolist()) for name in
+               ("coords", "ring_nodes", "cell_walls", "wall_ends", "chem", "numbers")}
+    for elem, parent in _walk(root):
+        attrib = elem.attrib
+        for attr, value in attrib.items():
+            if not value.startswith("#"):
+                continue
+            if value == "#":
+                stream = _stream(elem.tag, parent, attr)
+                number = next(streams[stream])
+                attrib[attr] = str(int(number)) if stream in ("ring_nodes", "cell_walls", "wall_ends") else repr(number)
+            elif value == "#i":
+                attrib[attr] = str(int(next(streams["numbers"])))
+            elif value == "#f":
+                attrib[attr] = repr(next(streams["numbers"]))
+            else:
+                attrib[attr] = value[1:]
+    return etree.tostring(root, encoding="UTF-8", xml_declaration=True)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Records
+# ─────────────────────────────────────────────────────────────────────────────
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _encode_record(meta: Dict[str, Any], blocks: Dict[str, Tuple[np.ndarray, bool]]) -> bytes:
+    """u32 JSON length, JSON, then the 8-byte aligned blocks."""
+    meta = dict(meta, blocks={})
+    payload = []
+    offset = 0
+    for name, (array, compress) in blocks.items():
+        data = np.ascontiguousarray(array).tobytes()
+        if compress:
+            data = zlib.compress(data, 6)
+        meta["blocks"][name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                                "offset": offset, "size": len(data), "zlib": compress}
+        payload.append(data + b"\0" * _pad(len(data)))
+        offset += len(data) + _pad(len(data))
+    text = json.dumps(meta, separators=(",", ":")).encode()
+    head = struct.pack("<I", len(text)) + text
+    return head + b"\0" * _pad(len(head)) + b"".join(payload)
+
+
+class ArchiveWriter:
+    """Writes records one by one and the offset index on :meth:`close`."""
+
+    def __init__(self, path: str, coords: str = "float64", keyframe: int = 64, header: Optional[Dict] = None):
+        if coords not in COORD_MODES:
+            raise ValueError(f"coords must be one of {COORD_MODES}")
+        self.path = path
+        self.coords = coords
+        self.keyframe = max(keyframe, 1)
+        self.file = open(path, "wb")
+        self.index: List[Tuple[int, float, int, int]] = []
+        self.header = dict(header or {}, format="vlarc", version=1, coords=coords, keyframe=self.keyframe)
+        text = json.dumps(self.header).encode()
+        self.file.write(MAGIC + struct.pack("<Q", len(text)) + text + b"\0" * _pad(len(text)))
+        self.last_skeleton: Optional[bytes] = None
+        self.skeleton_record = -1
+        self.last_topology: Optional[List[np.ndarray]] = None
+        self.topology_record = -1
+        self.key_coords: Optional[np.ndarray] = None
+        self.key_record = -1
+
+    def add(self, snapshot: Dict[str, Any]) -> None:
+        k = len(self.index)
+        arrays = snapshot["arrays"]
+        blocks: Dict[str, Tuple[np.ndarray, bool]] = {}
+
+        if snapshot["skeleton"] != self.last_skeleton:
+            self.last_skeleton, self.skeleton_record = snapshot["skeleton"], k
+            blocks["skeleton"] = (np.frombuffer(snapshot["skeleton"], dtype=np.uint8), True)
+
+        topology = [arrays[name] for name in ("ring_counts", "ring_is_cell", "ring_nodes",
+                                               "cell_walls", "wall_ends", "chem_counts")]
+        if self.last_topology is None or any(a.shape != b.shape or not np.array_equal(a, b)
+                                             for a, b in zip(topology, self.last_topology)):
+            self.last_topology, self.topology_record = topology, k
+            for name, array in zip(("ring_counts", "ring_is_cell", "ring_nodes",
+                                    "cell_walls", "wall_ends", "chem_counts"), topology):
+                blocks[name] = (array, False)
+
+        coords = arrays["coords"]
+        key = self.key_record
+        if self.coords == "float32":
+            blocks["coords"] = (coords.astype(np.float32), False)
+        elif self.coords == "float64":
+            blocks["coords"] = (coords, False)
+        elif (self.key_coords is None or self.key_coords.shape != coords.shape
+              or k - self.key_record >= self.keyframe):
+            self.key_coords, self.key_record = coords, k
+            key = k
+            blocks["coords"] = (coords, False)
+        else:
+            delta = coords.view(np.uint64) ^ self.key_coords.view(np.uint64)
+            blocks["coords_xor"] = (delta, True)
+
+        blocks["chem"] = (arrays["chem"], False)
+        blocks["numbers"] = (arrays["numbers"], True)             # only read by exports
+        meta = {"step": snapshot["step"], "simtime": snapshot["simtime"],
+                "skeleton": self.skeleton_record, "topology": self.topology_record,
+                "keyframe": key if self.coords == "delta" else k}
+        record = _encode_record(meta, blocks)
+        offset = self.file.tell()
+        self.file.write(record)
+        self.index.append((snapshot["step"], snapshot["simtime"], offset, len(record)))
+
+    def close(self) -> None:
+        index = np.array(self.index, dtype=INDEX_DTYPE)
+        offset = self.file.tell()
+        self.file.write(index.tobytes())
+        self.file.write(struct.pack("<QQ", offset, len(index)) + END_MAGIC)
+        self.file.close()
+
+
+def pack_run(source: Union[str, Sequence[str]], archive: str, coords: str = "float64",
+             keyframe: int = 64, stride: int = 1, workers: Optional[int] = None) -> int:
+    """
+    Pack the snapshots of a datadir (or list of files) into *archive*; the
+    snapshots are split in parallel worker processes.  Returns the number of
+    records written.
+
+    The archive is written to ``archive + ".part"`` and only renamed into
+    place once it is complete; if a snapshot fails, the partial file is
+    removed and *archive* is left as it was.
+    """
+    paths = find_snapshots(source, stride)
+    if not paths:
+        raise FileNotFoundError(f"no leaf.NNNNNN.xml snapshots in {source}")
+    part = archive + ".part"
+    writer = None
+    try:
+        for snapshot in imap_ordered(split_snapshot, paths, workers):
+            if writer is None:
+                writer = ArchiveWriter(part, coords, keyframe,
+                                       {"source": str(source), "parameter": snapshot["parameter"]})
+            writer.add(snapshot)
+        writer.close()
+        os.replace(part, archive)
+    except BaseException:
+        if writer is not None:
+            writer.file.close()
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return len(paths)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reading
+# ─────────────────────────────────────────────────────────────────────────────
+class RunArchive:
+    """
+    Memory-mapped reader of a run archive::
+
+        >>> with RunArchive("run.vla") as run:
+        ...     run.steps                      # step of every record
+        ...     snap = run.snapshot(step=1200) # Snapshot arrays, O(1)
+        ...     run.to_leafml(1200, "leaf.001200.xml")
+
+    Uncompressed blocks are NumPy views on the map, nothing is copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:8] != MAGIC:
+            raise ValueError(f"{path} is not a run archive")
+        length = struct.unpack_from("<Q", self.map, 8)[0]
+        self.header = json.loads(self.map[16:16 + length].decode())
+        if self.map[-8:] != END_MAGIC:
+            raise ValueError(f"{path} is incomplete (no index)")
+        offset, count = struct.unpack_from("<QQ", self.map, len(self.map) - 24)
+        self.index = np.frombuffer(self.map, dtype=INDEX_DTYPE, count=count, offset=offset)
+        self.by_step = {int(step): k for k, step in enumerate(self.index["step"])}
+        self._meta: Dict[int, Tuple[Dict[str, Any], int]] = {}
+
+    # ─── container behaviour ─────────────────────────────────────────────
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __enter__(self) -> "RunArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.index = None
+        self._meta.clear()
+        try:
+            self.map.close()
+        except BufferError:
+            pass                     # arrays still refer to the map, closed when they are gone
+        self.file.close()
+
+    @property
+    def steps(self) -> np.ndarray:
+        return self.index["step"]
+
+    @property
+    def simtimes(self) -> np.ndarray:
+        return self.index["simtime"]
+
+    @property
+    def parameter(self) -> str:
+        """The ``<parameter>`` block of the run, from the header."""
+        return self.header.get("parameter", "")
+
+    def record(self, step: int) -> int:
+        """Record number of a step (KeyError if it is not stored)."""
+        return self.by_step[int(step)]
+
+    # ─── blocks ──────────────────────────────────────────────────────────
+    def _record_meta(self, k: int) -> Tuple[Dict[str, Any], int]:
+        if k not in self._meta:
+            offset = int(self.index["offset"][k])
+            length = struct.unpack_from("<I", self.map, offset)[0]
+            meta = json.loads(self.map[offset + 4:offset + 4 + length].decode())
+            self._meta[k] = (meta, offset + 4 + length + _pad(4 + length))
+        return self._meta[k]
+
+    def _block(self, k: int, name: str) -> np.ndarray:
+        meta, base = self._record_meta(k)
+        block = meta["blocks"][name]
+        start = base + block["offset"]
+        if block["zlib"]:
+            data = zlib.decompress(self.map[start:start + block["size"]])
+            return np.frombuffer(data, dtype=block["dtype"]).reshape(block["shape"])
+        count = int(np.prod(block["shape"], dtype=np.int64))
+        return np.frombuffer(self.map, dtype=block["dtype"], count=count, offset=start).reshape(block["shape"])
+
+    def arrays(self, k: int) -> Dict[str, np.ndarray]:
+        """All streams of record *k* (coordinates decoded to float64)."""
+        meta, _ = self._record_meta(k)
+        topology = meta["topology"]
+        arrays = {name: self._block(topology, name) for name in
+                  ("ring_counts", "ring_is_cell", "ring_nodes", "cell_walls", "wall_ends", "chem_counts")}
+        if "coords_xor" in meta["blocks"]:
+            key = self._block(meta["keyframe"], "coords")
+            arrays["coords"] = (self._block(k, "coords_xor") ^ key.view(np.uint64)).view(np.float64)
+        else:
+            arrays["coords"] = self._block(k, "coords").astype(np.float64, copy=False)
+        arrays["chem"] = self._block(k, "chem")
+        arrays["numbers"] = self._block(k, "numbers")
+        return arrays
+
+    # ─── snapshots ───────────────────────────────────────────────────────
+    def snapshot(self, k: Optional[int] = None, step: Optional[int] = None) -> Snapshot:
+        """
+        Snapshot arrays of record *k* (or of *step*); the cell attribute table
+        is empty, export the step with :meth:`to_leafml` for all attributes.
+        """
+        if step is not None:
+            k = self.record(step)
+        meta, _ = self._record_meta(k)
+        a = self.arrays(k)
+        counts, is_cell = a["ring_counts"], a["ring_is_cell"].astype(bool)
+        owner_start = np.cumsum(counts) - counts
+        cell_counts = counts[is_cell]
+        take = np.repeat(owner_start[is_cell], cell_counts) + \
+            np.arange(int(cell_counts.sum())) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+        chem_counts = a["chem_counts"][is_cell]
+        chem_values = a["chem"][np.repeat(is_cell, a["chem_counts"])]
+        chem = np.zeros((len(chem_counts), int(chem_counts.max(initial=0))))
+        chem_start = np.cumsum(chem_counts) - chem_counts
+        rows = np.repeat(np.arange(len(chem_counts)), chem_counts)
+        chem[rows, np.arange(len(rows)) - np.repeat(chem_start, chem_counts)] = chem_values
+        return Snapshot(
+            path=f"{self.path}#{meta['step']}",
+            step=int(meta["step"]),
+            simtime=float(meta["simtime"]),
+            coords=a["coords"].reshape(-1, 2),
+            ring_offsets=np.concatenate([[0], np.cumsum(cell_counts)]).astype(np.int32),
+            ring_nodes=a["ring_nodes"][take],
+            cell_table={},
+            chem=chem,
+        )
+
+    def __iter__(self) -> Iterator[Snapshot]:
+        for k in range(len(self)):
+            yield self.snapshot(k)
+
+    def to_leafml(self, step: int, outfile: Optional[str] = None) -> bytes:
+        """LeafML of a stored step, written to *outfile* if given."""
+        k = self.record(step)
+        meta, _ = self._record_meta(k)
+        skeleton = self._block(meta["skeleton"], "skeleton").tobytes()
+        data = join_snapshot(skeleton, self.arrays(k))
+        if outfile is not None:
+            with open(outfile, "wb") as f:
+                f.write(data)
+        return data
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Pack a run's snapshots into one archive, or read it back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="pack the leaf.NNNNNN.xml files of a datadir")
+    pack.add_argument("datadir")
+    pack.add_argument("-o", "--output", required=True, help="archive file")
+    pack.add_argument("--coords", choices=COORD_MODES, default="float64",
+                      help="coordinate encoding (float32 is lossy)")
+    pack.add_argument("--keyframe", type=int, default=64, help="records between delta keyframes")
+    pack.add_argument("--every", type=int, default=1, help="pack every n-th snapshot only")
+    pack.add_argument("-w", "--workers", type=int, default=None)
+    info = commands.add_parser("info", help="list the stored steps")
+    info.add_argument("archive")
+    export = commands.add_parser("export", help="write the LeafML of a stored step")
+    export.add_argument("archive")
+    export.add_argument("step", type=int)
+    export.add_argument("-o", "--output", default=None, help="default: leaf.NNNNNN.xml")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        count = pack_run(args.datadir, args.output, args.coords, args.keyframe, args.every, args.workers)
+        print(f"Packed {count} snapshots into {args.output}")
+    elif args.command == "info":
+        with RunArchive(args.archive) as run:
+            print(f"{args.archive}: {len(run)} snapshots, coords {run.header['coords']}")
+            if len(run):
+                print(f"steps {run.steps[0]} … {run.steps[-1]}, simtime {run.simtimes[0]:g} … {run.simtimes[-1]:g}")
+    else:
+        with RunArchive(args.archive) as run:
+            outfile = args.output or f"leaf.{args.step:06d}.xml"
+            run.to_leafml(args.step, outfile)
+            print(f"Wrote step {args.step} to {outfile}")
+
+
+if __name__ == "__main__":
+    main()
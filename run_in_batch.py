@@ -1,43 +1,195 @@
-import xml.etree.ElementTree as ET
 from pathlib import Path
+import argparse
+import math
+import os
+import re
+import shutil
 import subprocess
 import numpy as np
 import time
 
+from virtualleaf_xml_model import LeafMLParameters
+from snapshot_series import find_snapshots, snapshot_step
+
 class MyXML:
-    """Utility to clone a LeafML file and tweak simple <par name="…"> entries."""
+    """Utility to clone a LeafML file and tweak simple <par name="…"> entries.
+
+    Only the <parameter> and <settings> blocks are parsed; the tissue is
+    copied byte for byte when the variant is written (LeafMLParameters).
+    """
 
     def __init__(self, templatefile: str):
-        self.tree = ET.parse(templatefile)
-        self.root = self.tree.getroot()
-        self.parameters = self.root.find("parameter")
+        self.leaf = LeafMLParameters(templatefile)
+        self.parameters = self.leaf.parameter
 
     def set_simple_param(self, name: str, value) -> None:
         """Change the ‘val’ attribute of <par name='…'>."""
-        par = self.parameters.find(f"./par[@name='{name}']")
-        if par is None:
+        if name not in self.parameters:
             raise KeyError(f"Parameter '{name}' not found in XML")
-        par.set("val", str(value))
+        self.parameters[name] = value
     def set_setting(self, name: str, value) -> None:
         """Change the 'val' attribute of <setting name='...'>."""
-        settings = self.root.find("settings")
-        if settings is None:
-            raise KeyError("Settings section not found in XML")
-
-        setting = settings.find(f"./setting[@name='{name}']")
-        if setting is None:
+        if name not in self.leaf.settings:
             raise KeyError(f"Setting '{name}' not found in XML")
 
         # Convert boolean values to lowercase strings (true/false)
-        setting.set("val", str(value).lower() if isinstance(value, bool) else str(value))
+        self.leaf.settings[name] = str(value).lower() if isinstance(value, bool) else str(value)
 
     def write(self, filename: str) -> None:
-        """Write a full XML document in UTF‑8."""
-        # ①  simply pass the *path* to ElementTree; it opens the file in 'wb'
-        self.tree.write(filename, encoding="utf-8", xml_declaration=True)
+        """Write the variant; everything but the two blocks is copied verbatim."""
+        self.leaf.write(filename)
 
 
 # -----------------------------------------------------------------------------
+# Checkpoint and resume
+# -----------------------------------------------------------------------------
+_SIMTIME = re.compile(rb"<leaf\b[^>]*\bsimtime=\"([^\"]*)\"")
+
+
+def snapshot_simtime(path) -> float:
+    """simtime attribute of a LeafML file (read from its first few kB)."""
+    with open(path, "rb") as f:
+        m = _SIMTIME.search(f.read(4096))
+    return float(m.group(1)) if m else 0.0
+
+
+def is_complete(path) -> bool:
+    """A snapshot is complete when it ends with </leaf> (not cut off mid-write)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(os.path.getsize(path) - 64, 0))
+            return f.read().rstrip().endswith(b"</leaf>")
+    except OSError:
+        return False
+
+
+def latest_checkpoint(datadir: str):
+    """Newest complete leaf.NNNNNN.xml in datadir, or None."""
+    if not os.path.isdir(datadir):
+        return None
+    for path in reversed(find_snapshots(datadir)):
+        if is_complete(path):
+            return path
+    return None
+
+
+def set_up_variant(xml: MyXML, parameters: dict, settings: dict) -> None:
+    """Apply the run's parameters and settings to a fresh input or a checkpoint."""
+    for name, value in parameters.items():
+        xml.set_simple_param(name, value)
+    for name, value in settings.items():
+        xml.set_setting(name, value)
+
+
+def retire_frames_after(datadir: str, step: int) -> int:
+    """
+    Move the files of the interrupted run written after the checkpoint
+    (leaf.NNNNNN.png/.xml/.pdf with NNNNNN > step) to datadir/superseded, so
+    the resumed run continues a gap-free series. Returns the number moved.
+    """
+    stale = [p for p in Path(datadir).glob("leaf.*.*")
+             if p.suffix in (".png", ".xml", ".pdf") and snapshot_step(p.with_suffix(".xml")) > step]
+    if stale:
+        superseded = Path(datadir) / "superseded"
+        superseded.mkdir(exist_ok=True)
+        for p in stale:
+            shutil.move(str(p), superseded / p.name)
+    return len(stale)
+
+
+# may differ between a checkpoint and the run it belongs to
+RESUME_IGNORED = ("maxt", "datadir", "rseed")
+
+
+def same_value(a, b) -> bool:
+    """Parameter values as read back; VirtualLeaf writes numbers with 6 digits."""
+    if isinstance(a, list) or isinstance(b, list):
+        return isinstance(a, list) and isinstance(b, list) and len(a) == len(b) \
+            and all(same_value(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=1e-5, abs_tol=1e-12)
+    return str(a).strip() == str(b).strip()
+
+
+def parameter_mismatches(leaf_file, checkpoint) -> list:
+    """
+    Names of the parameters of leaf_file (the run's input) whose value differs
+    in checkpoint, apart from RESUME_IGNORED. Parameters missing on either
+    side are not compared: VirtualLeaf writes its own complete list.
+    """
+    wanted = LeafMLParameters(leaf_file).parameter
+    stored = LeafMLParameters(checkpoint).parameter
+    return [p.name for p in wanted
+            if p.name not in RESUME_IGNORED and p.name in stored
+            and not same_value(p.value, stored[p.name])]
+
+
+def run_simulation(leaf_out: Path, datadir: str, model: str, parameters: dict, settings: dict,
+                   attempts: int = 3, fresh: bool = False) -> None:
+    """
+    Run ./bin/VirtualLeaf -b on leaf_out, resuming from the newest complete
+    snapshot in datadir when an earlier run (or attempt) was interrupted.
+
+    VirtualLeaf restores its clock from the simtime of the file it loads and
+    stops at the absolute time maxt, so a checkpoint is relaunched with the
+    same maxt and runs only the remaining maxt - simtime; its frames are named
+    by simulation time and continue the numbering of the interrupted run.
+    The random number state is not stored, the resumed part is reseeded with
+    the run's rseed.
+
+    A checkpoint is only used when its parameters match those of leaf_out
+    (see parameter_mismatches); snapshots of a different run in datadir raise
+    RuntimeError. With fresh=True they are moved to datadir/superseded and
+    the run starts from leaf_out.
+    """
+    maxt = float(parameters["maxt"])
+    if fresh:
+        moved = retire_frames_after(datadir, -1) if os.path.isdir(datadir) else 0
+        if moved:
+            print(f"Fresh start: {moved} files of an earlier run moved to {datadir}/superseded")
+    for attempt in range(attempts):
+        checkpoint = latest_checkpoint(datadir)
+        if checkpoint is None:
+            leaf_in = leaf_out
+        else:
+            mismatches = parameter_mismatches(leaf_out, checkpoint)
+            if mismatches:
+                raise RuntimeError(
+                    f"{checkpoint} belongs to a run with other parameters ({', '.join(mismatches)}); "
+                    f"use another datadir or start over with --fresh")
+            simtime = snapshot_simtime(checkpoint)
+            if simtime >= maxt:
+                print(f"{datadir} is complete (simtime {simtime:g} >= maxt {maxt:g})")
+                return
+            step = snapshot_step(checkpoint)
+            moved = retire_frames_after(datadir, step)
+            leaf_in = leaf_out.with_name(f"{leaf_out.stem}_resume.xml")
+            xml = MyXML(checkpoint)
+            set_up_variant(xml, parameters, settings)
+            xml.write(leaf_in)
+            print(f"Resuming from {checkpoint} at simtime {simtime:g}, {maxt - simtime:g} to go"
+                  + (f" ({moved} later files moved to superseded/)" if moved else ""))
+
+        print(f"Running {leaf_in} (attempt {attempt + 1} of {attempts})")
+        try:
+            subprocess.run([
+                "./bin/VirtualLeaf",
+                "-b",
+                "-l", str(leaf_in),
+                "-m", model
+            ], check=True)
+            return
+        except subprocess.CalledProcessError as error:
+            print(f"VirtualLeaf stopped with exit status {error.returncode}")
+    raise RuntimeError(f"{leaf_out} did not finish after {attempts} attempts")
+
+
+# -----------------------------------------------------------------------------
+parser = argparse.ArgumentParser(description="Run the VirtualLeaf batch simulations, resuming interrupted runs")
+parser.add_argument("--fresh", action="store_true",
+                    help="ignore the snapshots already in the datadirs (moved to superseded/) and start over")
+args = parser.parse_args()
+
 simulation_start_time = time.time()
 leaf_in = Path("data/leaves/cambium.xml")
 model = "libcambium.so"
@@ -50,29 +202,30 @@ for r in number_of_runs:
     leaf_out = leaf_in.with_name(leaf_in.stem + output_suffix + ".xml")
 
     # Create and modify XML
+    parameters = {
+        "maxt": 5000,
+        "datadir": datadir,
+        "rseed": 1,  # set seed to 1 for reproducibility
+        "mc_stepsize": 0.2,
+        "mc_cell_stepsize": 0.1,
+        "compatibility_level": 1,
+    }
+    settings = {
+        "show_nodes": False,
+        "show_node_numbers": False,
+        "show_cell_numbers": False,
+        "show_cell_centers": False,
+    }
     xml = MyXML(leaf_in)
-    xml.set_simple_param("maxt", 5000)
-    xml.set_simple_param("datadir", datadir)
-    xml.set_simple_param("rseed", 1) #set seed to 1 for reproducibility
-    xml.set_simple_param("mc_stepsize", 0.2)
-    xml.set_simple_param("mc_cell_stepsize", 0.1)
-    xml.set_simple_param("compatibility_level", 1)
-    xml.set_setting("show_nodes", False)
-    xml.set_setting("show_node_numbers", False)
-    xml.set_setting("show_cell_numbers", False)
-    xml.set_setting("show_cell_centers", False)
+    set_up_variant(xml, parameters, settings)
 
     # Write XML file
     xml.write(leaf_out)
 
-    # Run simulation
+    # Run simulation, resuming from the last snapshot in datadir if a
+    # previous run of this script was interrupted
     print(f"Running simulation with number {r} and output {leaf_out}")
-    subprocess.run([
-        "./bin/VirtualLeaf",
-        "-b",
-        "-l", str(leaf_out),
-        "-m", model
-    ], check=True)
+    run_simulation(leaf_out, datadir, model, parameters, settings, fresh=args.fresh)
 
     # here i want to ran this bash script in the same directory to animate the pngs
     # Animate the PNGs generated in the simulation
@@ -80,9 +233,9 @@ for r in number_of_runs:
     # Get directory name for the output file name
     dir_name=$(basename "$(pwd)")
 
-    # 1. Make numbered links
+    # 1. Make numbered links, in step order (leaf.1000000.png after leaf.999999.png)
     i=0
-    for f in $(ls leaf.[0-9][0-9][0-9][0-9][0-9][0-9].png | sort); do
+    for f in $(ls leaf.[0-9]*.png | sort -t. -k2,2n); do
         printf -v link "link_%06d.png" "$i"
         ln -s "$f" "$link"
         ((i++))
@@ -98,8 +251,6 @@ for r in number_of_runs:
     rm link_*.png
     """
     # Create the script file in the data directory
-    import os
-
     script_path = os.path.join(datadir, "animate.sh")
 
     # Write the script
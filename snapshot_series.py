@@ -0,0 +1,159 @@
+"""
+snapshot_series.py
+Parallel loader of the leaf.NNNNNN.xml snapshots a run writes into its datadir.
+
+The snapshots are discovered and sorted by their step number, parsed in a
+process pool into compact arrays (:class:`Snapshot`) and handed out in time
+order as they are ready.  Only a bounded window of snapshots is in flight, so
+runs with thousands of snapshots are analysed in constant memory::
+
+    >>> for snap in load_series("/path/to/datadir", workers=8):
+    ...     print(snap.step, snap.simtime, snap.coords.shape, snap.chem.mean(axis=0))
+"""
+from __future__ import annotations
+import glob
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from lxml import etree
+
+from virtualleaf_xml_model import TissueArrays
+
+
+_STEP = re.compile(r"leaf\.(\d+)\.xml$")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Discovery
+# ─────────────────────────────────────────────────────────────────────────────
+def snapshot_step(path: str) -> int:
+    """Step number of a ``leaf.NNNNNN.xml`` file name (-1 if it has none)."""
+    m = _STEP.search(os.path.basename(path))
+    return int(m.group(1)) if m else -1
+
+
+def find_snapshots(source: Union[str, Sequence[str]], stride: int = 1) -> List[str]:
+    """
+    Snapshot files of a datadir (or of a list of files), sorted by step
+    number, not by name: ``leaf.1000000.xml`` comes after ``leaf.999999.xml``.
+    Every *stride*-th snapshot is kept.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source = os.fspath(source)
+        paths = glob.glob(os.path.join(source, "leaf.*.xml")) if os.path.isdir(source) else glob.glob(source)
+    else:
+        paths = [os.fspath(p) for p in source]
+    paths = [p for p in paths if snapshot_step(p) >= 0]
+    paths.sort(key=lambda p: (snapshot_step(p), p))
+    return paths[::max(stride, 1)]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-snapshot arrays
+# ─────────────────────────────────────────────────────────────────────────────
+@dataclass
+class Snapshot:
+    """
+    One snapshot as compact arrays: node coordinates (N, 2) float64, the cell
+    rings in CSR form (int32), the cell attributes (name → column, see
+    :class:`TissueArrays`) and the chemicals (C, nchem) float64.
+    """
+    path: str
+    step: int
+    simtime: float
+    coords: np.ndarray = field(repr=False)
+    ring_offsets: np.ndarray = field(repr=False)
+    ring_nodes: np.ndarray = field(repr=False)
+    cell_table: Dict[str, np.ndarray] = field(repr=False)
+    chem: np.ndarray = field(repr=False)
+
+    @property
+    def n_cells(self) -> int:
+        return len(self.ring_offsets) - 1
+
+    def ring(self, k: int) -> np.ndarray:
+        """Node indices of cell *k*."""
+        return self.ring_nodes[self.ring_offsets[k]:self.ring_offsets[k + 1]]
+
+
+def load_snapshot(path: str) -> Snapshot:
+    """Parse one snapshot (plain lxml, no objectify, no dataclass per element)."""
+    root = etree.parse(path).getroot()
+    arrays = TissueArrays.from_root(root)
+    cells = root.find("cells")
+    chems = [c.xpath("./chem/val/@v") for c in cells.iterchildren("cell")] if cells is not None else []
+    nchem = max((len(v) for v in chems), default=0)
+    chem = np.zeros((len(chems), nchem))
+    for k, values in enumerate(chems):
+        chem[k, :len(values)] = np.asarray(values, dtype=np.float64)
+    index = np.int32 if len(arrays.ring_nodes) < 2**31 else np.int64
+    return Snapshot(
+        path=path,
+        step=snapshot_step(path),
+        simtime=float(root.attrib.get("simtime", "nan")),
+        coords=arrays.coords,
+        ring_offsets=arrays.ring_offsets.astype(index),
+        ring_nodes=arrays.ring_nodes.astype(index),
+        cell_table=arrays.cell_table,
+        chem=chem,
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Series
+# ─────────────────────────────────────────────────────────────────────────────
+def imap_ordered(function: Callable[[Any], Any], items: Sequence[Any],
+                 workers: Optional[int] = None, window: Optional[int] = None) -> Iterator[Any]:
+    """
+    ``function(item)`` for every item, computed in *workers* processes
+    (default: all cores; ``1``: in this process) and yielded in the order of
+    *items*.  At most *window* results (default: twice the number of workers)
+    are computed ahead of the consumer, which bounds the memory.
+    """
+    if workers == 1:
+        for item in items:
+            yield function(item)
+        return
+    workers = workers or os.cpu_count() or 1
+    window = max(window or 2 * workers, 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        remaining = iter(items)
+        for item in remaining:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for item in remaining:
+                pending.append(pool.submit(function, item))
+                break
+            yield result
+
+
+def load_series(source: Union[str, Sequence[str]], workers: Optional[int] = None,
+                stride: int = 1, window: Optional[int] = None) -> Iterator[Snapshot]:
+    """
+    Yield the snapshots of *source* (a datadir, a glob pattern or a list of
+    files) in time order, parsed in *workers* processes (default: all cores;
+    ``1`` parses in this process).
+
+    At most *window* snapshots (default: twice the number of workers) are
+    parsed ahead of the consumer, which bounds the memory of the series.
+    """
+    return imap_ordered(load_snapshot, find_snapshots(source, stride), workers, window)
+
+
+def series_table(source: Union[str, Sequence[str]], **options) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Step, simtime and cell count of every snapshot, as three arrays; a quick
+    overview that keeps no snapshot in memory.
+    """
+    rows = [(s.step, s.simtime, s.n_cells) for s in load_series(source, **options)]
+    rows = np.array(rows, dtype=float).reshape(-1, 3)
+    return rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2].astype(np.int64)
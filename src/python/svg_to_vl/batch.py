@@ -0,0 +1,62 @@
+import os
+import io
+import glob
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from . import readsvg
+
+# Converting many svg files in parallel, each file in its own worker process.
+
+def findSvgFiles(inputs):
+    # inputs are directories, glob patterns or svg files (with or without extension),
+    # the result are the svg names without extension as convertSVG expects them
+    svgFileNames = list()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.svg')))
+        elif os.path.isfile(pattern) or os.path.isfile(pattern + '.svg'):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern))
+        for match in matches:
+            if match.endswith('.svg'):
+                match = match[:-len('.svg')]
+            if match not in svgFileNames:
+                svgFileNames.append(match)
+    return svgFileNames
+
+def convertOne(svgFileName, template, scaleFactor, colormap, compact=False, cache=None, profile=False, stream=False):
+    start = time.perf_counter()
+    try:
+        # the progress prints of the conversion would interleave between workers
+        with contextlib.redirect_stdout(io.StringIO()):
+            readsvg.convertSVG(svgFileName, template, scaleFactor, colormap, compact, cache, profile, stream)
+        error = None
+    except Exception as e:
+        error = type(e).__name__ + ': ' + str(e)
+    return (svgFileName, error, time.perf_counter() - start)
+
+def convertBatch(svgFileNames, template, scaleFactor, colormap, workers=None, compact=False, cache=None, profile=False, stream=False):
+    results = list()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convertOne, svgFileName, template, scaleFactor, colormap, compact, cache, profile, stream) for svgFileName in svgFileNames]
+        for svgFileName, future in zip(svgFileNames, futures):
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                # a worker was killed (out of memory, segfault), the pool fails
+                # this file and every file that was still waiting for it
+                results.append((svgFileName, type(e).__name__ + ': ' + str(e), 0.0))
+    return results
+
+def printSummary(results):
+    width = max([len(result[0]) for result in results] + [len('file')])
+    print('file'.ljust(width) + '  status  seconds  error')
+    for svgFileName, error, seconds in results:
+        status = 'ok' if error is None else 'FAILED'
+        print(svgFileName.ljust(width) + '  ' + status.ljust(6) + '  ' + ('%7.2f' % seconds) + '  ' + (error or ''))
+    failed = len([result for result in results if not (result[1] is None)])
+    print(str(len(results)) + ' files, ' + str(len(results) - failed) + ' converted, ' + str(failed) + ' failed')
+    return failed
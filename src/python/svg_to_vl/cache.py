@@ -0,0 +1,149 @@
+import os
+import stat
+import shutil
+import hashlib
+
+# On disk cache of converted files.
+# An entry is the resulting xml file stored under the hash of everything the
+# conversion depends on: the svg bytes, the template bytes, the scale factor,
+# the colormap and the version of the converter. A hit copies (or hardlinks)
+# the stored xml next to the svg without reading the svg at all.
+# The modification time of an entry is its last use, the least recently used
+# entries are removed when the cache grows over its size limit.
+# Entries are read-only: with hardlinks the xml next to the svg is the entry
+# itself, a tool editing it in place then fails instead of changing the cache.
+
+converterVersion = "2.0.2"
+
+defaultMaxBytes = 512*1024*1024
+
+def defaultDirectory():
+    directory = os.environ.get("SVG_TO_VL_CACHE")
+    if directory:
+        return directory
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "svg_to_vl")
+
+def hashFile(digest, fileName):
+    digest.update(str(os.path.getsize(fileName)).encode() + b"\0")
+    with open(fileName, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+def partName(fileName):
+    # unique per process, workers of a batch may write the same entry at the same time
+    return fileName + "." + str(os.getpid()) + ".part"
+
+def cacheKey(svgFileName, template, scaleFactor, colormap, stream=False, compact=False):
+    digest = hashlib.sha256()
+    digest.update(converterVersion.encode() + b"\0")
+    hashFile(digest, svgFileName + ".svg")
+    hashFile(digest, template)
+    # "2" and "2.0" give the same conversion
+    scale = "" if scaleFactor is None else repr(float(scaleFactor))
+    digest.update(scale.encode() + b"\0")
+    digest.update(("" if colormap is None else colormap).encode() + b"\0")
+    if stream:
+        # the streaming reader applies transforms, its result differs
+        digest.update(b"stream\0")
+    if compact:
+        # the array based mesh is a different implementation, its bytes are
+        # not guaranteed to be the same
+        digest.update(b"compact\0")
+    return digest.hexdigest()
+
+def removeEntry(entry):
+    try:
+        os.remove(entry)
+    except PermissionError:
+        # read-only files can not be removed on windows
+        os.chmod(entry, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(entry)
+
+
+class ConversionCache:
+
+    def __init__(self, directory=None, maxBytes=defaultMaxBytes, link=False):
+        self.directory = directory or defaultDirectory()
+        self.maxBytes = maxBytes
+        self.link = link
+
+    def entryName(self, key):
+        return os.path.join(self.directory, key + ".xml")
+
+    def entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".xml")]
+
+    def place(self, source, target):
+        # through a temporary file next to the target, so the target is replaced at once
+        tempName = partName(target)
+        try:
+            if self.link:
+                try:
+                    os.link(source, tempName)
+                except OSError:
+                    shutil.copyfile(source, tempName)
+            else:
+                shutil.copyfile(source, tempName)
+            os.replace(tempName, target)
+        except BaseException:
+            if os.path.exists(tempName):
+                os.remove(tempName)
+            raise
+
+    def lookup(self, key, target):
+        entry = self.entryName(key)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        try:
+            self.place(entry, target)
+        except FileNotFoundError:
+            # evicted by another process in between
+            return False
+        return True
+
+    def store(self, key, source):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = self.entryName(key)
+        tempName = partName(entry)
+        try:
+            shutil.copyfile(source, tempName)
+            os.chmod(tempName, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tempName, entry)
+        except BaseException:
+            if os.path.exists(tempName):
+                os.remove(tempName)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = list()
+        for entry in self.entries():
+            try:
+                status = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, entry))
+        total = sum(entry[1] for entry in entries)
+        for mtime, size, entry in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                removeEntry(entry)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        removed = 0
+        for entry in self.entries():
+            try:
+                removeEntry(entry)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,110 @@
+# Half-edge view of the cells of a mesh, used to group walls into cell walls.
+#
+# Every cell ring is a cycle of half-edges, one per wall of the ring, directed
+# along the ring from origin to target. A half-edge knows the next and
+# previous half-edge of its cell and its twin, the half-edge of the
+# neighbouring cell on the same wall (None on the border of the tissue).
+# All lookups below are built in a single pass over the rings.
+
+class HalfEdge:
+    __slots__ = ('cell', 'wall', 'origin', 'target', 'index', 'next', 'prev', 'twin')
+
+    def __init__(self, cell, wall, origin, target, index):
+        self.cell = cell
+        self.wall = wall
+        self.origin = origin
+        self.target = target
+        self.index = index
+        self.next = None
+        self.prev = None
+        self.twin = None
+
+
+class HalfEdges:
+
+    def __init__(self, cells):
+        self.cellEdges = dict()
+        self.wallEdges = dict()
+        wallEdges = self.wallEdges
+        for cell in cells:
+            edges = list()
+            nextNode = cell.firstNode
+            prev = None
+            for wall in cell.walls:
+                origin = nextNode
+                if wall.node1 == nextNode:
+                    nextNode = wall.node2
+                else:
+                    nextNode = wall.node1
+                edge = HalfEdge(cell, wall, origin, nextNode, len(edges))
+                edge.prev = prev
+                if not (prev is None):
+                    prev.next = edge
+                prev = edge
+                edges.append(edge)
+                if wall in wallEdges:
+                    wallEdges[wall].append(edge)
+                else:
+                    wallEdges[wall] = [edge]
+            if len(edges) > 0:
+                edges[0].prev = edges[-1]
+                edges[-1].next = edges[0]
+            self.cellEdges[cell] = edges
+        for edges in self.wallEdges.values():
+            if len(edges) == 2:
+                edges[0].twin = edges[1]
+                edges[1].twin = edges[0]
+        self.pairs = None
+
+    def edges(self, cell):
+        return self.cellEdges.get(cell, ())
+
+    def sharedWalls(self, cell1, cell2):
+        # the walls of cell1 that are also walls of cell2, in the ring order of cell1
+        if self.pairs is None:
+            self.pairs = dict()
+            for cell, edges in self.cellEdges.items():
+                for edge in edges:
+                    if not (edge.twin is None):
+                        # the common case, a wall between exactly two rings
+                        others = (edge.twin.cell,)
+                    else:
+                        others = dict.fromkeys(other.cell for other in self.wallEdges[edge.wall])
+                    for other in others:
+                        if other != cell:
+                            key = (cell, other)
+                            if key in self.pairs:
+                                self.pairs[key].append(edge.wall)
+                            else:
+                                self.pairs[key] = [edge.wall]
+        return list(self.pairs.get((cell1, cell2), ()))
+
+    def borderWalls(self, cell):
+        # the walls of the cell without a neighbour, in ring order
+        return [edge.wall for edge in self.edges(cell) if len(edge.wall.cells) == 1]
+
+
+def walkWalls(currentNode, nodeWalls, used, walls):
+    # follows the unused walls from currentNode, at every node the first wall in
+    # the original order is taken, and returns the node where the walk ends
+    nextNode = None
+    while nextNode != currentNode:
+        nextNode = currentNode
+        for wall in nodeWalls.get(currentNode, ()):
+            if not (wall in used):
+                used.add(wall)
+                walls.append(wall)
+                if wall.node1 == currentNode:
+                    currentNode = wall.node2
+                else:
+                    currentNode = wall.node1
+                break
+    return currentNode
+
+def wallsByNode(sharedWalls):
+    nodeWalls = dict()
+    for wall in sharedWalls:
+        nodeWalls.setdefault(wall.node1, list()).append(wall)
+        if wall.node2 != wall.node1:
+            nodeWalls.setdefault(wall.node2, list()).append(wall)
+    return nodeWalls
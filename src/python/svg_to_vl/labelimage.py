@@ -0,0 +1,317 @@
+import os
+import numpy as np
+from . import cellmodel
+from . import leafwriter
+from .cellmodel import ColorSpec
+
+# Label images (segmentation masks) as input instead of an svg drawing.
+#
+# Every pixel holds the label of the cell it belongs to, 0 is outside of the
+# tissue. The outlines run along the pixel edges: an edge between two pixels
+# with different labels is a boundary edge, a pixel corner where more than two
+# boundary edges meet is a junction. The boundary edges between two junctions
+# form a chain, it is thinned out to one node every segmentLength pixels and
+# is used by both cells on its sides, so neighbouring cells share exactly the
+# same nodes. The rings of the cells are then read into a mesh the same way
+# the paths of an svg are, and converted with the same stages.
+#
+# Corners are numbered on the grid of the label image padded by one pixel of
+# background, corner (i, j) is the top left corner of padded pixel (i, j).
+# Directed edges are 2*edge (right or down) and 2*edge+1 (left or up), the
+# label on the left of a directed edge is the cell it belongs to.
+
+RIGHT, DOWN, LEFT, UP = 0, 1, 2, 3
+
+defaultLabelmap = "*,1,2.251808,0.481961"
+
+class LabelSpec(ColorSpec):
+    # like ColorSpec, but for a label: "label,celltype,chem,..." where label is a number or * for any label
+
+    def __init__(self, label):
+        ColorSpec.__init__(self, label)
+        self.label = label.split(',')[0]
+
+    def isType(self, other):
+        return self.label == '*' or self.label == str(other)
+
+    def boundary(self):
+        return 0
+
+def setLabelmap(mesh, labelmap):
+    # the catch all entries first, the last matching entry wins
+    specs = [LabelSpec(label) for label in labelmap.split(':') if label != '']
+    mesh.colorSpecs = [ColorSpec("000000,0")]
+    mesh.colorSpecs.extend([spec for spec in specs if spec.label == '*'])
+    mesh.colorSpecs.extend([spec for spec in specs if spec.label != '*'])
+
+def readLabels(fileName):
+    if fileName.endswith('.npy'):
+        labels = np.load(fileName)
+    else:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError("reading " + fileName + " needs Pillow (pip install pillow), or save the labels as .npy")
+        labels = np.asarray(Image.open(fileName))
+        if labels.ndim == 3:
+            # colour images, every colour is a label
+            channels = labels.astype(np.int64)
+            labels = np.zeros(labels.shape[:2], dtype=np.int64)
+            for channel in range(channels.shape[2]):
+                labels = labels*256 + channels[:,:,channel]
+    if labels.ndim != 2:
+        raise ValueError(fileName + " is not a 2-D label image")
+    return labels.astype(np.int64)
+
+
+class LabelBoundaries:
+
+    def __init__(self, labels):
+        padded = np.zeros((labels.shape[0]+2, labels.shape[1]+2), dtype=np.int64)
+        padded[1:-1,1:-1] = labels
+        self.padded = padded
+        self.columns = padded.shape[1]+1
+        rows = padded.shape[0]+1
+        # horizontal edges (i, j)-(i, j+1) between padded[i-1, j] and padded[i, j]
+        horizontal = np.zeros((rows, self.columns-1), dtype=bool)
+        horizontal[1:-1,:] = padded[:-1,:] != padded[1:,:]
+        # vertical edges (i, j)-(i+1, j) between padded[i, j-1] and padded[i, j]
+        vertical = np.zeros((rows-1, self.columns), dtype=bool)
+        vertical[:,1:-1] = padded[:,:-1] != padded[:,1:]
+        hi, hj = np.nonzero(horizontal)
+        vi, vj = np.nonzero(vertical)
+        self.horizontalCount = len(hi)
+        self.edgeCount = len(hi) + len(vi)
+        # the edge at a position, -1 if there is none
+        self.horizontalId = np.full(horizontal.shape, -1, dtype=np.int64)
+        self.horizontalId[hi, hj] = np.arange(len(hi))
+        self.verticalId = np.full(vertical.shape, -1, dtype=np.int64)
+        self.verticalId[vi, vj] = len(hi) + np.arange(len(vi))
+        # corners of the edges, from (right or down) to
+        self.edgeFrom = np.concatenate([hi*self.columns + hj, vi*self.columns + vj])
+        self.edgeTo = np.concatenate([hi*self.columns + hj + 1, (vi+1)*self.columns + vj])
+        # labels on the left of the directed edges, right is up for a horizontal edge and east for a vertical one going down
+        left = np.empty(2*self.edgeCount, dtype=np.int64)
+        left[0:2*len(hi):2] = padded[hi-1, hj]
+        left[1:2*len(hi):2] = padded[hi, hj]
+        left[2*len(hi)::2] = padded[vi, vj]
+        left[2*len(hi)+1::2] = padded[vi, vj-1]
+        self.left = left
+        self.degree = np.bincount(np.concatenate([self.edgeFrom, self.edgeTo]), minlength=rows*self.columns)
+
+    def tail(self, directed):
+        return np.where(directed % 2 == 0, self.edgeFrom[directed//2], self.edgeTo[directed//2])
+
+    def head(self, directed):
+        return np.where(directed % 2 == 0, self.edgeTo[directed//2], self.edgeFrom[directed//2])
+
+    def direction(self, directed):
+        vertical = directed//2 >= self.horizontalCount
+        return np.where(vertical, DOWN, RIGHT) + 2*(directed % 2)
+
+    def edgeAt(self, corner, direction):
+        # the directed edge leaving corner in direction, -1 if there is none
+        i = corner // self.columns
+        j = corner % self.columns
+        result = np.full(len(corner), -1, dtype=np.int64)
+        for value, ids, di, dj, reverse in ((RIGHT, self.horizontalId, 0, 0, 0), (LEFT, self.horizontalId, 0, -1, 1), \
+                                            (DOWN, self.verticalId, 0, 0, 0), (UP, self.verticalId, -1, 0, 1)):
+            mask = direction == value
+            ii = i[mask] + di
+            jj = j[mask] + dj
+            inside = (ii >= 0) & (jj >= 0) & (ii < ids.shape[0]) & (jj < ids.shape[1])
+            edge = np.full(len(ii), -1, dtype=np.int64)
+            edge[inside] = ids[ii[inside], jj[inside]]
+            result[mask] = np.where(edge >= 0, 2*edge + reverse, -1)
+        return result
+
+    def pixel(self, corner, di, dj):
+        return self.padded[corner // self.columns + di, corner % self.columns + dj]
+
+    def nextAlongBoundary(self, directed):
+        # the directed edge that follows, keeping the label on the left:
+        # turn left when the pixel ahead on the left is not the label, turn right
+        # when both pixels ahead are the label and go straight otherwise
+        corner = self.head(directed)
+        direction = self.direction(directed)
+        label = self.left[directed]
+        # the pixels around a corner, relative to its top left pixel
+        nw = self.pixel(corner, -1, -1)
+        ne = self.pixel(corner, -1, 0)
+        sw = self.pixel(corner, 0, -1)
+        se = self.pixel(corner, 0, 0)
+        aheadLeft = np.choose(direction, [ne, se, sw, nw])
+        aheadRight = np.choose(direction, [se, sw, nw, ne])
+        turn = np.where(aheadLeft != label, -1, np.where(aheadRight == label, 1, 0))
+        return self.edgeAt(corner, (direction + turn) % 4)
+
+    def chains(self, anchors=None):
+        # the chains as (directed edges in order) per chain, between junctions
+        directed = np.arange(2*self.edgeCount)
+        junction = (self.degree > 2)
+        if not (anchors is None):
+            junction[anchors] = True
+        following = self.nextAlongBoundary(directed)
+        terminal = junction[self.head(directed)]
+        successor = np.where(terminal, directed, following)
+        distance = np.where(terminal, 0, 1)
+        # pointer jumping, every round doubles the distance that is looked ahead
+        for round in range(int(np.ceil(np.log2(max(2, len(directed))))) + 1):
+            distance = distance + distance[successor]
+            successor = successor[successor]
+        loops = ~terminal[successor]
+        if loops.any():
+            # closed outlines without any junction get one, at their lowest corner
+            return None, self.loopAnchors(np.nonzero(loops)[0], following, self.tail(directed))
+        # a chain starts after a junction, of its two directions the one with the lower start is kept
+        starts = directed[junction[self.tail(directed)]]
+        reverseStarts = successor[starts] ^ 1
+        chainStarts = starts[starts < reverseStarts]
+        chainEnds = successor[chainStarts]
+        # the edges of a chain share its end, ordered by their distance to the end
+        isChainEnd = np.zeros(len(directed), dtype=bool)
+        isChainEnd[chainEnds] = True
+        members = directed[isChainEnd[successor]]
+        chainOfEnd = np.full(len(directed), -1, dtype=np.int64)
+        chainOfEnd[chainEnds] = np.arange(len(chainEnds))
+        chain = chainOfEnd[successor[members]]
+        order = np.lexsort((-distance[members], chain))
+        members = members[order]
+        bounds = np.searchsorted(chain[order], np.arange(len(chainStarts)+1))
+        return (members, bounds), None
+
+    def loopAnchors(self, loopEdges, following, tails):
+        anchors = list()
+        seen = set()
+        for start in loopEdges.tolist():
+            if start in seen:
+                continue
+            corners = list()
+            edge = start
+            while not (edge in seen):
+                seen.add(edge)
+                seen.add(edge ^ 1)
+                corners.append(int(tails[edge]))
+                edge = int(following[edge])
+            anchors.append(min(corners))
+        return np.array(anchors, dtype=np.int64)
+
+
+def chainNodes(boundaries, members, bounds, segmentLength):
+    # the corners kept of every chain: its ends, every segmentLength-th corner and the middle one,
+    # a chain that returns to its start keeps the corners at a third and two thirds instead
+    count = len(bounds)-1
+    lengths = np.diff(bounds)
+    tails = boundaries.tail(members)
+    ends = boundaries.head(members[bounds[1:]-1])
+    position = np.arange(len(members)) - np.repeat(bounds[:-1], lengths)
+    length = np.repeat(lengths, lengths)
+    closed = np.repeat(tails[bounds[:-1]] == ends, lengths)
+    keep = (position % segmentLength == 0)
+    keep |= ~closed & (position == length//2)
+    keep |= closed & ((position == length//3) | (position == (2*length)//3))
+    nodes = list()
+    kept = np.split(tails[keep], np.searchsorted(np.nonzero(keep)[0], bounds[1:-1]))
+    for chain in range(count):
+        nodes.append(kept[chain].tolist() + [int(ends[chain])])
+    return nodes
+
+def cellRings(boundaries, segmentLength):
+    result, anchors = boundaries.chains()
+    if result is None:
+        result, anchors = boundaries.chains(anchors)
+    members, bounds = result
+    nodes = chainNodes(boundaries, members, bounds, segmentLength)
+    firsts = members[bounds[:-1]]
+    lasts = members[bounds[1:]-1]
+    # both directions of every chain: 2*chain along, 2*chain+1 against its edges
+    startEdge = dict()
+    for chain, first in enumerate(firsts.tolist()):
+        startEdge[first] = 2*chain
+    for chain, last in enumerate(lasts.tolist()):
+        startEdge[last ^ 1] = 2*chain+1
+    afterFirst = boundaries.nextAlongBoundary(lasts)
+    afterLast = boundaries.nextAlongBoundary(firsts ^ 1)
+    following = dict()
+    for chain in range(len(firsts)):
+        following[2*chain] = startEdge[int(afterFirst[chain])]
+        following[2*chain+1] = startEdge[int(afterLast[chain])]
+    labels = boundaries.left
+    rings = list()
+    done = set()
+    for directedChain in range(2*len(firsts)):
+        chain = directedChain//2
+        label = int(labels[firsts[chain]] if directedChain % 2 == 0 else labels[lasts[chain] ^ 1])
+        if label == 0 or directedChain in done:
+            continue
+        ring = list()
+        chains = list()
+        current = directedChain
+        while not (current in done):
+            done.add(current)
+            chains.append(current)
+            chainCorners = nodes[current//2] if current % 2 == 0 else nodes[current//2][::-1]
+            ring.extend(chainCorners[:-1])
+            current = following[current]
+        rings.append((label, ring, chains))
+    return rings
+
+def ringArea(boundaries, ring):
+    columns = boundaries.columns
+    total = 0
+    for index in range(len(ring)):
+        i1, j1 = divmod(ring[index-1], columns)
+        i2, j2 = divmod(ring[index], columns)
+        total += j1*i2 - j2*i1
+    return total
+
+def readNodesFromLabels(labels, mesh, segmentLength=8):
+    boundaries = LabelBoundaries(labels)
+    # nodes are on pixel corners, only exactly equal corners are the same node
+    mesh.setScale(0.5)
+    columns = boundaries.columns
+    rings = cellRings(boundaries, segmentLength)
+    # the outline of a cell runs the other way around than the outline of a hole in it,
+    # the chains around a hole seen from the cells that fill it
+    holeSides = set()
+    for label, ring, chains in rings:
+        if ringArea(boundaries, ring) > 0:
+            holeSides.update(chain ^ 1 for chain in chains)
+    count = 0
+    enclosed = list()
+    for label, ring, chains in rings:
+        if ringArea(boundaries, ring) > 0:
+            continue
+        mcell = mesh.getCell()
+        mcell.setType(label)
+        for corner in ring:
+            i, j = divmod(corner, columns)
+            # padded corners, the image starts at corner (1, 1)
+            if mcell.addNode((j-1)*mesh.pixelScale, (i-1)*mesh.pixelScale):
+                break
+        mcell.addClosingWall()
+        count += 1
+        if holeSides.intersection(chains):
+            enclosed.append(mcell)
+    if count < 2:
+        raise ValueError("a label image needs at least two labelled cells, found " + str(count))
+    # cells inside a hole of another cell, their outline is not the outline of an inner cell
+    return enclosed
+
+def convertLabels(labelFileName, template, scaleFactor, labelmap, compact=False, segmentLength=8):
+    if compact:
+        from . import compactmesh
+        mesh = compactmesh.CompactMesh()
+    else:
+        mesh = cellmodel.Mesh()
+    if not (scaleFactor is None):
+        mesh.pixelScale = float(scaleFactor)
+    setLabelmap(mesh, defaultLabelmap if labelmap is None else labelmap)
+    enclosed = readNodesFromLabels(readLabels(labelFileName), mesh, segmentLength)
+    mesh.reduceParallelWalls()
+    mesh.defineInnerCells(enclosed)
+    mesh.defineCellWalls()
+    xmlFileName = os.path.splitext(labelFileName)[0]+'.xml'
+    leafwriter.writeLeaf(xmlFileName, template, mesh.xmlSections())
+    print ("virtual-leaf-file = "+xmlFileName, end='\n')
+    return mesh
@@ -0,0 +1,94 @@
+import json
+import time
+import tracemalloc
+import contextlib
+
+# Per stage report of a conversion: wall time, peak of the memory traced by
+# tracemalloc while the stage ran and the size of the mesh after the stage.
+# Stages may be nested (the xml sections are built while the file is written),
+# the peak of an outer stage includes the peaks of its inner stages.
+
+class StageProfiler:
+
+    def __init__(self, mesh=None):
+        self.mesh = mesh
+        self.stages = list()
+        self.open = list()
+        self.started = False
+        self.total = 0.0
+
+    def start(self):
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.begin = time.perf_counter()
+
+    def stop(self):
+        self.total = time.perf_counter() - self.begin
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def foldPeak(self):
+        # the peak so far belongs to every stage that is still open
+        peak = tracemalloc.get_traced_memory()[1]
+        for stage in self.open:
+            stage["peakBytes"] = max(stage["peakBytes"], peak - stage["startBytes"])
+
+    def resetPeak(self):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.foldPeak()
+        stage = {"name": name, "depth": len(self.open), "seconds": 0.0, \
+                 "startBytes": tracemalloc.get_traced_memory()[0], "peakBytes": 0}
+        self.stages.append(stage)
+        self.open.append(stage)
+        self.resetPeak()
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage["seconds"] = time.perf_counter() - start
+            self.foldPeak()
+            self.open.pop()
+            if not (self.mesh is None):
+                stage["counts"] = self.mesh.counts()
+
+    def wrapSections(self, sections):
+        # the section builders are called by the writer, each one is profiled on its own
+        def wrap(name, build):
+            def profiled():
+                with self.stage("toXml " + name):
+                    return build()
+            return profiled
+        return {name: wrap(name, build) for name, build in sections.items()}
+
+    def report(self):
+        stages = list()
+        for stage in self.stages:
+            stage = dict(stage)
+            del stage["startBytes"]
+            stages.append(stage)
+        return {"seconds": self.total, "stages": stages}
+
+    def writeJson(self, fileName):
+        with open(fileName, "w") as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def summary(self):
+        names = ["  "*stage["depth"] + stage["name"] for stage in self.stages]
+        width = max([len(name) for name in names] + [len("stage")])
+        columns = ["nodes", "walls", "cells", "cellWalls", "splitIterations"]
+        lines = ["stage".ljust(width) + "  seconds  peak MB  " + "  ".join(columns)]
+        for name, stage in zip(names, self.stages):
+            counts = stage.get("counts", {})
+            line = name.ljust(width) + "  " + ("%7.3f" % stage["seconds"]) + "  " + ("%7.1f" % (stage["peakBytes"]/1e6))
+            for column in columns:
+                line += "  " + str(counts.get(column, "")).rjust(len(column))
+            lines.append(line)
+        lines.append("total".ljust(width) + "  " + ("%7.3f" % self.total))
+        return "\n".join(lines)
@@ -0,0 +1,48 @@
+import re
+import numpy as np
+from math import radians, sin, cos, tan
+
+# Affine transforms of svg elements as 3x3 matrices, used by the streaming reader.
+
+transformPattern = re.compile(r'\s*,?\s*(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+
+def parseTransform(transform):
+    # the 3x3 affine matrix of an svg transform attribute
+    matrix = np.identity(3)
+    if transform is None:
+        return matrix
+    position = 0
+    while position < len(transform.strip()):
+        match = transformPattern.match(transform, position)
+        if match is None:
+            raise ValueError("invalid transform: " + transform)
+        position = match.end()
+        name = match.group(1)
+        args = [float(value) for value in re.split(r'[\s,]+', match.group(2).strip()) if value != '']
+        step = np.identity(3)
+        if name == 'matrix':
+            step[0,:] = [args[0], args[2], args[4]]
+            step[1,:] = [args[1], args[3], args[5]]
+        elif name == 'translate':
+            step[0,2] = args[0]
+            step[1,2] = args[1] if len(args) > 1 else 0.0
+        elif name == 'scale':
+            step[0,0] = args[0]
+            step[1,1] = args[1] if len(args) > 1 else args[0]
+        elif name == 'rotate':
+            angle = radians(args[0])
+            step[:2,:2] = [[cos(angle), -sin(angle)], [sin(angle), cos(angle)]]
+            if len(args) == 3:
+                # rotation around (cx, cy)
+                centre = np.array(args[1:3])
+                step[:2,2] = centre - step[:2,:2] @ centre
+        elif name == 'skewX':
+            step[0,1] = tan(radians(args[0]))
+        else:
+            step[1,0] = tan(radians(args[0]))
+        matrix = matrix @ step
+    return matrix
+
+def applyTransform(matrix, coordinates):
+    # coordinates is a list of (x, y), the result an (N,2) array
+    return np.array(coordinates, dtype=np.float64).reshape(-1, 2) @ matrix[:2,:2].T + matrix[:2,2]
@@ -20,8 +20,7 @@ setuptools.setup(
     ],
     python_requires='>=3.1',
     install_requires=[
-        'shapely>=1.8.0', 
-        'sympy>=1.9'
+        'numpy>=1.17'
     ],
     keywords='virtualleaf svg conversion',
     project_urls={
@@ -2,6 +2,14 @@ import os
 import argparse
 from . import readsvg
 
+def conversionCache(args):
+    # only the svg conversions use the cache, creating it makes its directory
+    # and may evict entries
+    if args.no_cache:
+        return None
+    from . import cache
+    return cache.ConversionCache(args.cache_dir, int(args.cache_size*1024*1024), args.cache_link)
+
 def main():
     parser=argparse.ArgumentParser(prog='svg-to-vl',
                     description='converting cells drawn in svg files to VirtualLeaf xml start files. The svg file should be specified without extension, the resulting xml file will be stored next to the svg file.',
@@ -10,18 +18,60 @@ def main():
     parser.add_argument("-t","--template-file")
     parser.add_argument("-s","--scale-factor")
     parser.add_argument("-c","--color-map")
-    
+    parser.add_argument("-l","--label-image", help="a label image (.npy, or .png with pillow) to convert instead of an svg file, every label is a cell and 0 is outside, the -c map then has the form label,celltype,chems:... with * for any label")
+    parser.add_argument("--segment-length", type=int, default=8, help="pixels between the nodes of a cell wall read from a label image (default: %(default)s)")
+    parser.add_argument("inputs", nargs='*', help="batch mode: directories, glob patterns or svg files to convert in parallel")
+    parser.add_argument("-j","--jobs", type=int, default=None, help="number of worker processes in batch mode (default: number of cpus)")
+    parser.add_argument("--compact", action="store_true", help="use the array based mesh, for drawings with very many cells")
+    parser.add_argument("--stream", action="store_true", help="stream the svg file, read paths at any depth and apply the transforms of their groups; the cells are numbered as without --stream (top level paths first), paths in nested groups follow in document order")
+    parser.add_argument("--profile", action="store_true", help="report time, peak memory and mesh size per conversion stage, also written as json next to the svg file")
+    parser.add_argument("--no-cache", action="store_true", help="always convert, do not read or write the conversion cache")
+    parser.add_argument("--clear-cache", action="store_true", help="remove all entries from the conversion cache")
+    parser.add_argument("--cache-dir", default=None, help="directory of the conversion cache (default: $SVG_TO_VL_CACHE or ~/.cache/svg_to_vl)")
+    # the default is cache.defaultMaxBytes, not imported here to keep the start up fast
+    parser.add_argument("--cache-size", type=float, default=512, help="size limit of the conversion cache in MB, least recently used entries are removed first (default: %(default)d)")
+    parser.add_argument("--cache-link", action="store_true", help="hardlink cached results instead of copying them; the xml file is then the read-only cache entry itself, it has to be copied before it is edited, and its modification time changes whenever the entry is used again")
+
     #ffffff,1,2,3,4:
     args=parser.parse_args()
-    if args.svg_file is None or args.template_file is None:
+    if args.clear_cache:
+        from . import cache
+        removed = cache.ConversionCache(args.cache_dir).clear()
+        print ("removed ", removed, " entries from the conversion cache", end='\n')
+        if args.svg_file is None and args.label_image is None and len(args.inputs) == 0:
+            return 0
+    if (args.svg_file is None and args.label_image is None and len(args.inputs) == 0) or args.template_file is None:
         parser.print_help()
+    elif not (args.label_image is None):
+        # numpy based, only loaded when it is used
+        from . import labelimage
+        print ("label-image = ", args.label_image, end='\n')
+        print ("template-file = ", args.template_file, end='\n')
+        print ("scale = ", args.scale_factor, end='\n')
+        print ("labelmap = ", args.color_map, end='\n')
+        labelimage.convertLabels(args.label_image, args.template_file, args.scale_factor, args.color_map, args.compact, args.segment_length)
+    elif len(args.inputs) > 0:
+        # the process pool is only loaded in batch mode
+        from . import batch
+        svgFileNames = batch.findSvgFiles(args.inputs)
+        if not (args.svg_file is None):
+            svgFileNames.insert(0, args.svg_file)
+        if len(svgFileNames) == 0:
+            print ("no svg files found in ", args.inputs, end='\n')
+            return 1
+        print ("template-file = ", args.template_file, end='\n')
+        print ("scale = ", args.scale_factor, end='\n')
+        print ("colormap = ", args.color_map, end='\n')
+        results = batch.convertBatch(svgFileNames, args.template_file, args.scale_factor, args.color_map, args.jobs, args.compact, conversionCache(args), args.profile, args.stream)
+        if batch.printSummary(results) > 0:
+            return 1
     else:
         print ("svg-file = ", args.svg_file, end='\n')
         print ("template-file = ", args.template_file, end='\n')
         print ("scale = ", args.scale_factor, end='\n')
         print ("colormap = ", args.color_map, end='\n')
-        readsvg.convertSVG(args.svg_file, args.template_file, args.scale_factor, args.color_map)
+        readsvg.convertSVG(args.svg_file, args.template_file, args.scale_factor, args.color_map, args.compact, conversionCache(args), args.profile, args.stream)
+    return 0
 
 if __name__ == "__main__":
-    main()
-    
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,353 @@
+import os
+import io
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from . import readsvg
+from . import cache
+
+# Scaling benchmark of the converter on generated drawings.
+# The drawings look like the ones made in Inkscape: one layer with a closed
+# path per cell, the cell type in the stroke colour. Three layouts are made:
+#   hex      regular hexagons
+#   voronoi  the Voronoi cells of a jittered triangular lattice
+#   brick    running bond bricks, with the joints of the next rows on their sides
+# Optionally some sides are drawn as cubic curves and some cells get a sliver,
+# an extra node just next to one of their sides that reduceParallelWalls removes.
+#
+# The converter snaps nodes closer than 1/120 of the page size, so the page
+# (the viewBox) stays 120 x 120 mm and large tissues extend past the page.
+# Every case is converted in a fresh process, the reported memory is the
+# growth of its maximum resident set size during the conversion.
+
+layouts = ("hex", "voronoi", "brick")
+
+defaultSizes = (10, 100, 1000, 10000, 50000)
+
+cellColors = ("#0000f8", "#009000", "#ff0000")
+
+pageSize = 120.0
+
+# distance between the centres of neighbouring cells in mm
+spacing = 5.0
+
+def latticeNeighbours(i, j):
+    # the six neighbours of a point of a triangular lattice with every odd row shifted by half, counter clockwise from east
+    shift = j % 2
+    return [(i+1, j), (i+shift, j+1), (i-1+shift, j+1), (i-1, j), (i-1+shift, j-1), (i+shift, j-1)]
+
+def circumcentre(a, b, c):
+    d = 2.0*(a[0]*(b[1] - c[1]) + b[0]*(c[1] - a[1]) + c[0]*(a[1] - b[1]))
+    aa = a[0]*a[0] + a[1]*a[1]
+    bb = b[0]*b[0] + b[1]*b[1]
+    cc = c[0]*c[0] + c[1]*c[1]
+    x = (aa*(b[1] - c[1]) + bb*(c[1] - a[1]) + cc*(a[1] - b[1]))/d
+    y = (aa*(c[0] - b[0]) + bb*(a[0] - c[0]) + cc*(b[0] - a[0]))/d
+    return (x, y)
+
+def voronoiCells(cells, jitter, rng):
+    # With a small jitter the Delaunay triangulation is still the one of the
+    # lattice, so the Voronoi cell of a point is the ring of circumcentres of
+    # its six triangles. Every circumcentre is computed once, neighbouring
+    # cells share exactly the same vertices.
+    columns = max(1, int(round(math.sqrt(cells))))
+    rows = (cells + columns - 1)//columns
+    height = spacing*math.sqrt(3.0)/2.0
+    points = dict()
+    for j in range(rows+2):
+        for i in range(columns+2):
+            x = i*spacing + (j % 2)*spacing/2.0 + rng.uniform(-jitter, jitter)*spacing
+            y = j*height + rng.uniform(-jitter, jitter)*spacing
+            points[(i, j)] = (x, y)
+    centres = dict()
+    polygons = list()
+    for j in range(1, rows+1):
+        for i in range(1, columns+1):
+            if len(polygons) == cells:
+                break
+            neighbours = latticeNeighbours(i, j)
+            ring = list()
+            for k in range(6):
+                triangle = tuple(sorted([(i, j), neighbours[k], neighbours[(k+1) % 6]]))
+                if not (triangle in centres):
+                    centres[triangle] = circumcentre(*[points[p] for p in triangle])
+                ring.append(centres[triangle])
+            polygons.append(ring)
+    return polygons
+
+def brickCells(cells):
+    # bricks of 2 x 1 units, every odd row starts with a half brick
+    unit = spacing*0.6
+    columns = max(1, int(round(math.sqrt(cells/2.0))))
+    polygons = list()
+    row = 0
+    while len(polygons) < cells:
+        shift = row % 2
+        x = 0
+        while x < 2*columns and len(polygons) < cells:
+            end = min(x + (1 if (shift and x == 0) else 2), 2*columns)
+            # the joints of the rows above and below lie on every integer x
+            bottom = [(k*unit, row*unit) for k in range(x, end+1)]
+            top = [(k*unit, (row+1)*unit) for k in range(end, x-1, -1)]
+            polygons.append(bottom + top)
+            x = end
+        row += 1
+    return polygons
+
+def tissuePolygons(layout, cells, seed=1):
+    rng = random.Random(seed)
+    if layout == "hex":
+        return voronoiCells(cells, 0.0, rng)
+    if layout == "voronoi":
+        return voronoiCells(cells, 0.12, rng)
+    if layout == "brick":
+        return brickCells(cells)
+    raise ValueError("unknown layout " + layout + ", expected one of " + ", ".join(layouts))
+
+def pathData(ring, curves, sliver, rng):
+    ring = list(ring)
+    if sliver:
+        # an extra node just off the middle of the first side
+        (x1, y1), (x2, y2) = ring[0], ring[1]
+        length = math.hypot(x2 - x1, y2 - y1)
+        ring.insert(1, ((x1 + x2)/2.0 + 0.02*(y2 - y1)/length, (y1 + y2)/2.0 - 0.02*(x2 - x1)/length))
+    d = ["m %.6f,%.6f" % ring[0]]
+    command = "m"
+    for k in range(1, len(ring)):
+        dx = ring[k][0] - ring[k-1][0]
+        dy = ring[k][1] - ring[k-1][1]
+        if curves and rng.random() < 0.3:
+            # a slightly bent side, the converter only keeps its end point
+            bend = 0.1*rng.uniform(-1.0, 1.0)
+            d.append("c %.6f,%.6f %.6f,%.6f %.6f,%.6f" % (dx/3.0 - bend*dy, dy/3.0 + bend*dx, 2.0*dx/3.0 - bend*dy, 2.0*dy/3.0 + bend*dx, dx, dy))
+            command = "c"
+        elif command == "c":
+            d.append("l %.6f,%.6f" % (dx, dy))
+            command = "l"
+        else:
+            d.append("%.6f,%.6f" % (dx, dy))
+    d.append("z")
+    return " ".join(d)
+
+def generateSvg(fileName, layout, cells, curves=False, slivers=False, seed=1):
+    rng = random.Random(seed)
+    polygons = tissuePolygons(layout, cells, seed)
+    with open(fileName, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n')
+        f.write('<svg width="%gmm" height="%gmm" viewBox="0 0 %g %g" version="1.1" id="svg1"\n' % (pageSize, pageSize, pageSize, pageSize))
+        f.write('   xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"\n')
+        f.write('   xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"\n')
+        f.write('   xmlns="http://www.w3.org/2000/svg" xmlns:svg="http://www.w3.org/2000/svg">\n')
+        f.write('  <g inkscape:label="Layer 1" inkscape:groupmode="layer" id="layer1">\n')
+        for nr, ring in enumerate(polygons):
+            d = pathData(ring, curves, slivers and nr % 7 == 3, rng)
+            f.write('    <path style="fill:none;stroke:%s;stroke-width:0.26458333" d="%s" id="path%d" />\n' % (cellColors[nr % len(cellColors)], d, nr))
+        f.write('  </g>\n</svg>\n')
+    return len(polygons)
+
+def maxResidentBytes():
+    try:
+        import resource
+    except ImportError:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return usage if sys.platform == "darwin" else usage*1024
+
+def measureOne(svgFileName, template, scaleFactor, colormap, compact=False):
+    result = {"seconds": None, "peakMB": None, "counts": None, "error": None}
+    before = maxResidentBytes()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mesh = readsvg.convertSVG(svgFileName, template, scaleFactor, colormap, compact)
+        result["counts"] = mesh.counts()
+    except Exception as e:
+        result["error"] = type(e).__name__ + ': ' + str(e)
+    result["seconds"] = time.perf_counter() - start
+    result["peakMB"] = (maxResidentBytes() - before)/1e6
+    return result
+
+def runCase(directory, template, layout, cells, curves, slivers, scaleFactor=None, colormap=None, compact=False, repeat=1):
+    svgFileName = os.path.join(directory, "%s_%d%s%s" % (layout, cells, "_curves" if curves else "", "_slivers" if slivers else ""))
+    generateSvg(svgFileName + ".svg", layout, cells, curves, slivers)
+    case = {"layout": layout, "cells": cells, "curves": curves, "slivers": slivers}
+    best = None
+    for run in range(repeat):
+        # a fresh process per run, so the resident set size belongs to this conversion only
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(measureOne, svgFileName, template, scaleFactor, colormap, compact).result()
+        if best is None or (result["error"] is None and result["seconds"] < best["seconds"]):
+            best = result
+    case.update(best)
+    return case
+
+def runBenchmark(template, sizes=defaultSizes, layoutNames=layouts, curves=False, slivers=False, scaleFactor=None, colormap=None, compact=False, repeat=1, directory=None, progress=None):
+    results = list()
+    with tempfile.TemporaryDirectory() as workDirectory:
+        directory = directory or workDirectory
+        os.makedirs(directory, exist_ok=True)
+        for layout in layoutNames:
+            for cells in sizes:
+                case = runCase(directory, template, layout, cells, curves, slivers, scaleFactor, colormap, compact, repeat)
+                results.append(case)
+                if not (progress is None):
+                    progress(case)
+    return {"converterVersion": cache.converterVersion, "python": platform.python_version(), "machine": platform.machine(), \
+            "compact": compact, "scaleFactor": scaleFactor, "results": results}
+
+def caseKey(case):
+    return (case["layout"], case["cells"], case["curves"], case["slivers"])
+
+def compareResults(baseline, current, threshold):
+    # a case regresses when its time or memory grew by more than threshold (0.25 is 25%) relative to the baseline
+    baseCases = {caseKey(case): case for case in baseline["results"]}
+    comparisons = list()
+    for case in current["results"]:
+        base = baseCases.get(caseKey(case))
+        if base is None:
+            continue
+        comparison = {"case": case, "base": base, "regressions": list()}
+        if not (case["error"] is None) and base["error"] is None:
+            comparison["regressions"].append("fails")
+        for measure in ("seconds", "peakMB"):
+            if case[measure] is None or not base[measure]:
+                continue
+            ratio = case[measure]/base[measure]
+            comparison[measure] = ratio
+            if ratio > 1.0 + threshold:
+                comparison["regressions"].append(measure)
+        comparisons.append(comparison)
+    return comparisons
+
+def caseName(case):
+    return case["layout"] + " " + str(case["cells"]) + (" curves" if case["curves"] else "") + (" slivers" if case["slivers"] else "")
+
+def formatCase(case):
+    if not (case["error"] is None):
+        return caseName(case).ljust(28) + "  FAILED  " + case["error"]
+    counts = case["counts"]
+    return caseName(case).ljust(28) + ("  %8.3f  %8.1f  %7d  %7d  %7d" % (case["seconds"], case["peakMB"], counts["nodes"], counts["walls"], counts["cellWalls"]))
+
+def printComparison(comparisons, threshold):
+    print("case".ljust(28) + "   seconds      base   memory      base")
+    regressions = 0
+    for comparison in comparisons:
+        case = comparison["case"]
+        base = comparison["base"]
+        line = caseName(case).ljust(28)
+        for measure in ("seconds", "peakMB"):
+            if measure in comparison:
+                line += "  %8.3f  %8.3f" % (case[measure], base[measure])
+            else:
+                line += "  %8s  %8s" % ("-", "-")
+        if len(comparison["regressions"]) > 0:
+            regressions += 1
+            line += "  REGRESSION (" + ", ".join(comparison["regressions"]) + ")"
+        print(line)
+    print(str(len(comparisons)) + " cases compared, " + str(regressions) + " regressions over " + ("%g%%" % (threshold*100)))
+    return regressions
+
+# Start up time of the command line tool. Converting a small drawing should
+# not cost more time in imports than in the conversion itself, so the heavy
+# libraries are only loaded when they are used.
+
+heavyModules = ("numpy", "sympy", "shapely")
+
+def importTimes(arguments):
+    # cumulative import time in seconds per module, as reported by python -X importtime
+    process = subprocess.run([sys.executable, "-X", "importtime", "-m", "svg_to_vl"] + arguments, \
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    times = dict()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1])/1e6
+    return times
+
+def startupSeconds(arguments, repeat=5):
+    best = None
+    for run in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "svg_to_vl"] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+def checkStartup(budget=0.1, arguments=("--help",)):
+    # returns the problems found, an empty list when the start up is fine
+    arguments = list(arguments)
+    problems = list()
+    seconds = startupSeconds(arguments)
+    times = importTimes(arguments)
+    print("svg_to_vl " + " ".join(arguments) + (": %.1f ms, budget %.1f ms" % (seconds*1000, budget*1000)))
+    for name, cumulative in sorted(times.items(), key=lambda item: -item[1])[:10]:
+        print("  %8.1f ms  %s" % (cumulative*1000, name))
+    if seconds > budget:
+        problems.append("start up takes %.1f ms" % (seconds*1000))
+    for name in heavyModules:
+        if name in times:
+            problems.append(name + " is imported at start up")
+    for problem in problems:
+        print("PROBLEM: " + problem)
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m svg_to_vl.benchmark',
+                    description='measures how the svg to VirtualLeaf conversion scales with the number of cells on generated drawings.')
+    defaultTemplate = os.path.join(os.path.dirname(__file__), "example", "template.xml")
+    parser.add_argument("-t","--template-file", default=defaultTemplate)
+    parser.add_argument("-s","--scale-factor")
+    parser.add_argument("-c","--color-map")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in defaultSizes), help="comma separated numbers of cells (default: %(default)s)")
+    parser.add_argument("--layouts", default=",".join(layouts), help="comma separated layouts out of " + ", ".join(layouts))
+    parser.add_argument("--curves", action="store_true", help="draw some sides as cubic curves")
+    parser.add_argument("--slivers", action="store_true", help="add a sliver to every 7th cell")
+    parser.add_argument("--compact", action="store_true", help="use the array based mesh")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest one is kept")
+    parser.add_argument("--keep", default=None, help="directory for the generated svg and xml files, by default they are removed")
+    parser.add_argument("-o","--output", default=None, help="write the results as json, to be used as baseline later")
+    parser.add_argument("--compare", default=None, help="json baseline to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative growth of time or memory reported as regression (default: %(default)s)")
+    parser.add_argument("--startup", action="store_true", help="only check the start up time of the command line tool")
+    parser.add_argument("--startup-budget", type=float, default=100.0, help="start up time allowed in ms (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.startup:
+        if len(checkStartup(args.startup_budget/1000.0)) > 0:
+            return 1
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    layoutNames = args.layouts.split(",")
+    for layout in layoutNames:
+        if not (layout in layouts):
+            parser.error("unknown layout " + layout)
+    print("case".ljust(28) + "   seconds   peak MB    nodes    walls  cellWalls")
+    results = runBenchmark(args.template_file, sizes, layoutNames, args.curves, args.slivers, args.scale_factor, args.color_map, \
+                           args.compact, args.repeat, args.keep, progress=lambda case: print(formatCase(case), flush=True))
+    if not (args.output is None):
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if not (args.compare is None):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if printComparison(compareResults(baseline, results, args.threshold), args.threshold) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
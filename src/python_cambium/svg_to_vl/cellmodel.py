@@ -1,9 +1,9 @@
 from math import sqrt
 from math import hypot
+from math import floor
 import xml.etree.ElementTree as ET
-from shapely.geometry import Polygon
-from shapely.geometry.polygon import orient
-from sympy.logic.boolalg import false, true
+from . import geometry
+from . import halfedge
 
 class ColorSpec:
     
@@ -27,13 +27,17 @@ class Mesh:
 
     def __init__(self):
         self.walls=list()
+        self.wallMap=dict()
         self.cellWalls=list()
         self.nodes=list()
+        self.nodeGrid=dict()
+        self.nodeGridSize=None
         self.cells=list()
         self.colorSpecs=list()
         self.nodeNr=0
         self.wallNr=0
         self.cellNr=0
+        self.splitIterations=0
         self.mul=0.75
         self.pixelScale=5.
         self.setColormap("ffffff,1,2.251808,0.481961:0000f8,2,2.251808,0.481961:009000,3,2.251808,0.481961:ff0000,3,2.251808,0.481961")
@@ -49,24 +53,44 @@ class Mesh:
     def setScale(self, onePersentScale):
         self.mul=onePersentScale*self.pixelScale;
         
+    def nodeGridKey(self,x,y):
+        return (int(floor(x/self.mul)),int(floor(y/self.mul)))
+
+    def rebuildNodeGrid(self):
+        # uniform grid with cells of size mul, any node closer than mul is in one of the 9 surrounding grid cells
+        self.nodeGrid=dict()
+        self.nodeGridSize=self.mul
+        for node in self.nodes:
+            self.nodeGrid.setdefault(self.nodeGridKey(node.x,node.y),list()).append(node)
+
     def getNode(self,x,y):
-        for existing_node in self.nodes:
-            if existing_node.distance(x,y) < self.mul:
-                return existing_node 
+        if self.nodeGridSize != self.mul:
+            self.rebuildNodeGrid()
+        gridX,gridY = self.nodeGridKey(x,y)
+        found = None
+        for deltaX in (-1,0,1):
+            for deltaY in (-1,0,1):
+                for existing_node in self.nodeGrid.get((gridX+deltaX,gridY+deltaY),()):
+                    # the oldest node within reach wins, same as a linear scan over self.nodes
+                    if existing_node.distance(x,y) < self.mul and (found is None or existing_node.nr < found.nr):
+                        found = existing_node
+        if not (found is None):
+            return found
         node = Node(x,y,self.nodeNr)
         self.nodeNr+=1
         self.nodes.append(node)
+        self.nodeGrid.setdefault((gridX,gridY),list()).append(node)
         return node
     
     def getWall(self,node1,node2):
         if node1==node2:
             print("error")
-        for existing_wall in self.walls:
-            if existing_wall.isBetween(node1,node2):
-                return existing_wall 
+        existing_wall = self.wallMap.get(wallKey(node1,node2))
+        if not (existing_wall is None):
+            return existing_wall 
         wall = Wall(node1,node2,self.wallNr)
         self.wallNr+=1
-        self.walls.append(wall)
+        self.addWall(wall)
         return wall
     
     def getCell(self):
@@ -77,11 +101,17 @@ class Mesh:
 
     def addWall(self, wall):
         self.walls.append(wall)
+        self.wallMap[wallKey(wall.node1,wall.node2)] = wall
 
+    def removeWall(self, wall):
+        self.walls.remove(wall)
+        del self.wallMap[wallKey(wall.node1,wall.node2)]
     
-    def defineInnerCells(self):
+    def defineInnerCells(self, enclosed=()):
+        # the border walls of the enclosed cells lie inside another cell, not around an inner cell
+        enclosed = set(enclosed)
         for wall in self.walls:
-            if wall.isBorder():
+            if wall.isBorder() and not any(cell in enclosed for cell in wall.cells):
                 cell = self.getCell()
                 cell.setType("#ffffff")
                 cell.defineInnerCell(wall)
@@ -95,66 +125,98 @@ class Mesh:
                     print("not successful, defining an inner cell! around nr = " + str(cell.getNr()) + " pos(" + str(cell.firstNode.x) + "," + str(cell.firstNode.y) + ")")
         self.removeCircumverence()
         
+    def trianglesOfWall(self, wall):
+        # a triangle is a node connected to both ends of this wall by two shorter walls
+        triangles=list()
+        for firstWall in wall.node1.walls:
+            if firstWall == wall:
+                continue
+            if firstWall.getNode(1) == wall.node1:
+                tiangleNode = firstWall.getNode(2)
+            else:
+                tiangleNode = firstWall.getNode(1)
+            if tiangleNode == wall.node1 or tiangleNode == wall.node2:
+                continue
+            secondWall = self.wallMap.get(wallKey(tiangleNode,wall.node2))
+            if secondWall is None:
+                continue
+            if firstWall.length() < wall.length() and secondWall.length() < wall.length():
+                #triagle
+                area = firstWall.areaOfTriangle(secondWall)
+                if area < (4.*self.pixelScale*self.pixelScale):
+                    triangles.append([firstWall,secondWall,wall])
+        return triangles
+
     def wallsToSplit(self):
         wallsToSplit=list()
         for wall in self.walls:
-            connectedWalls=set()
-            connectedNodes=set()
-            for otherWall in self.walls:
-                if wall != otherWall and otherWall.isConnected(wall):
-                    connectedWalls.add(otherWall)
-                    connectedNodes.add(otherWall.node1)
-                    connectedNodes.add(otherWall.node2)
-            connectedNodes.remove(wall.node1)
-            connectedNodes.remove(wall.node2)
-            # now all remaining nodes are outside of this wall so if they are shared by two walls we have a triangle
-            for tiangleNode in connectedNodes:
-                nodeWalls=list(connectedWalls.intersection(tiangleNode.walls))
-                if len(nodeWalls) == 2 and nodeWalls[0].length() < wall.length() and nodeWalls[1].length() < wall.length():
-                    #triagle
-                    area = nodeWalls[0].areaOfTriangle(nodeWalls[1])
-                    if area < (4.*self.pixelScale*self.pixelScale):
-                        nodeWalls.append(wall)
-                        wallsToSplit.append(nodeWalls)
+            wallsToSplit.extend(self.trianglesOfWall(wall))
         return wallsToSplit
     
     def splitParallelWall(self, wall):
-           for cell in self.cells:
-               if (wall[2] in cell.walls):
+           # the cells are handled in creation order, which is the order of self.cells at this stage
+           for cell in sorted(dict.fromkeys(wall[2].cells), key=lambda x: x.nr):
+               if (wall[2] in cell.wallSet):
                    index = cell.walls.index(wall[2])
                    after=(index+1)%len(cell.walls);
                    if wall[1] in cell.walls[after].sharedNode(wall[2]).walls:
-                       cell.walls.remove(wall[2])
+                       cell.removeWall(wall[2])
                        wall[2].cells.remove(cell)
-                       cell.walls.insert(index,wall[1])
+                       cell.insertWall(index,wall[1])
                        wall[1].cells.append(cell)
-                       cell.walls.insert(index,wall[0])
+                       cell.insertWall(index,wall[0])
                        wall[0].cells.append(cell)
                    else:
-                       cell.walls.remove(wall[2])
+                       cell.removeWall(wall[2])
                        wall[2].cells.remove(cell)
-                       cell.walls.insert(index,wall[0])
+                       cell.insertWall(index,wall[0])
                        wall[0].cells.append(cell)
-                       cell.walls.insert(index,wall[1])
+                       cell.insertWall(index,wall[1])
                        wall[1].cells.append(cell)
            wall[2].node1.walls.remove(wall[2])
            wall[2].node2.walls.remove(wall[2])
-           self.walls.remove(wall[2])
+           del self.wallMap[wallKey(wall[2].node1,wall[2].node2)]
                          
     def splitParallelWalls(self, wallsToSplit):
+        removed=set()
         for wall in wallsToSplit:
             self.splitParallelWall(wall)
+            removed.add(wall[2])
+        self.walls = [wall for wall in self.walls if not (wall in removed)]
+        return removed
                           
     def reduceParallelWalls(self):
-        stopLoop = False
-        while (not stopLoop):
-            wallsToSplit=self.wallsToSplit()
-            if len(wallsToSplit) > 0:
-                self.splitParallelWalls(wallsToSplit)
-            else:
-                stopLoop=True
+        # every round splits the triangles found at the start of the round, in the order of self.walls.
+        # Only the walls sharing a node with a removed wall can gain or lose a triangle, so only those are checked again.
+        position = {wall: index for index, wall in enumerate(self.walls)}
+        triangles = dict()
+        toCheck = list(self.walls)
+        while len(toCheck) > 0:
+            for wall in toCheck:
+                found = self.trianglesOfWall(wall)
+                if len(found) > 0:
+                    triangles[wall] = found
+                else:
+                    triangles.pop(wall, None)
+            wallsToSplit=list()
+            for wall in sorted(triangles, key=position.get):
+                wallsToSplit.extend(triangles[wall])
+            if len(wallsToSplit) == 0:
+                break
+            self.splitIterations += 1
+            removed = self.splitParallelWalls(wallsToSplit)
+            touched = set()
+            for wall in removed:
+                triangles.pop(wall, None)
+                touched.update(wall.node1.walls)
+                touched.update(wall.node2.walls)
+            toCheck = [wall for wall in touched if not (wall in removed)]
         
              
+    def counts(self):
+        return {"nodes": len(self.nodes), "walls": len(self.walls), "cells": len(self.cells), \
+                "cellWalls": len(self.cellWalls), "splitIterations": self.splitIterations}
+
     def numberAll(self):
         nr = 0
         for wall in self.walls:
@@ -182,12 +244,14 @@ class Mesh:
             for wall in self.boundary_polygon.getWalls():
                 wall.getCells().remove(self.boundary_polygon)
             
-    def toXml(self):
-        docLeaf = ET.Element("leaf")
-        docNodes = ET.SubElement(docLeaf, "nodes", n = str(len(self.nodes)))
+    def nodesToXml(self):
+        docNodes = ET.Element("nodes", n = str(len(self.nodes)))
         for node in self.nodes:
             node.toXml(docNodes)
-        docCells = ET.SubElement(docLeaf, "cells" \
+        return docNodes
+
+    def cellsToXml(self):
+        docCells = ET.Element("cells" \
                                  , n = str(len(self.cells)) \
                                  , magnfication="1" \
                                  , nchem="0" \
@@ -195,6 +259,7 @@ class Mesh:
                                  , offsety="0" \
                                  , base_area="0" \
                                  )
+        self.defineGeometries()
         total_area = 0
         for cell in self.cells:
             geo = cell.toXml(docCells)
@@ -205,32 +270,51 @@ class Mesh:
         docCells.set("base_area", str(average_area))
         
         self.boundary_polygon.toBoundaryBolygon(docCells)
-        docWalls = ET.SubElement(docLeaf, "walls", n = str(len(self.walls)))
+        return docCells
+
+    def wallsToXml(self):
+        docWalls = ET.Element("walls", n = str(len(self.walls)))
 #        for wall in self.walls:
         for wall in self.cellWalls:
             wall.toXml(docWalls)
+        return docWalls
+
+    def xmlSections(self):
+        # the sections are only built when they are called, so a writer can keep one section in memory at a time
+        return {"nodes": self.nodesToXml, "cells": self.cellsToXml, "walls": self.wallsToXml}
+
+    def toXml(self):
+        docLeaf = ET.Element("leaf")
+        for section in self.xmlSections().values():
+            docLeaf.append(section())
         return docLeaf
     
+    def defineGeometries(self):
+        cells = list(self.cells)
+        if not (self.boundary_polygon is None):
+            cells.append(self.boundary_polygon)
+        geometries = geometry.cellGeometries([cell.getRing() for cell in cells])
+        for cell, geo in zip(cells, geometries):
+            cell.geometry = geo
+
     def defineCellWalls(self):
-        toDo = list(self.walls)
-        while len(toDo) > 0:
-            startWall = toDo[0]
-            if len(startWall.cells) < 2:
-                toDo.remove(startWall)
+        halfEdges = halfedge.HalfEdges(self.cells)
+        done = set()
+        for startWall in self.walls:
+            if startWall in done or len(startWall.cells) < 2:
                 continue
-            firstCellWall = CellWall(startWall.cells[0],startWall.cells[1],startWall.node1)
+            cell1 = startWall.cells[0]
+            cell2 = startWall.cells[1]
+            firstCellWall = CellWall(cell1,cell2,startWall.node1,halfEdges.sharedWalls(cell1,cell2))
 #            if (len(firstCellWall.walls)>1):
 #                print(len(firstCellWall.walls))
-            for wall in firstCellWall.walls:
-                if wall in toDo:
-                    toDo.remove(wall)
-                else:
-                    print()
+            done.update(firstCellWall.walls)
             self.cellWalls.append(firstCellWall)
         for wall in self.cellWalls:
             wall.addToCells()
         for cell in self.cells:
-            cell.addCloseWallGap()
+            cell.sortCellWalls()
+            cell.addCloseWallGap(halfEdges)
         self.numberAll()
         
 class Node:
@@ -255,6 +339,7 @@ class Node:
         return self.nr
         
     def getNextBorderNode(self, existing_walls):
+        # existing_walls should be a set, see Cell.wallSet
         potential_next_borders = [value for value in self.walls if (value not in existing_walls) and value.isBorder()]
         if len(potential_next_borders) == 1:
             wall_to_add = potential_next_borders[0]
@@ -278,6 +363,12 @@ class Node:
     def getTuple(self):
         return (self.x, self.y)
 
+def wallKey(node1,node2):
+    # unordered node pair, a wall from a to b is the same as the wall from b to a
+    if node1.nr < node2.nr:
+        return (node1.nr,node2.nr)
+    return (node2.nr,node1.nr)
+
 def findEndOfCellWall(currentNode,sharedWalls,walls):
     nextNode = None
     while nextNode != currentNode:
@@ -297,27 +388,26 @@ def findEndOfCellWall(currentNode,sharedWalls,walls):
             
 
 class CellWall:
-    def __init__(self, cell1, cell2, startNode):
+    def __init__(self, cell1, cell2, startNode, sharedWalls=None):
         self.cell1 = cell1
         self.cell2 = cell2
         self.startNode = startNode
         self.walls=list()
-        if cell2 is None:
-            sharedWalls = [value for value in self.cell1.walls if len(value.cells) == 1]      
-            currentNode=startNode
-            self.endNode = findEndOfCellWall(currentNode,sharedWalls,self.walls)
-            otherEnd = findEndOfCellWall(currentNode,sharedWalls,self.walls) 
+        if sharedWalls is None:
+            if cell2 is None:
+                sharedWalls = [value for value in self.cell1.walls if len(value.cells) == 1]      
+            else:
+                sharedWalls = [value for value in self.cell1.walls if value in self.cell2.wallSet]
+        # walking node by node over the shared walls, as findEndOfCellWall does on the list
+        nodeWalls = halfedge.wallsByNode(sharedWalls)
+        used = set()
+        currentNode=startNode
+        self.endNode = halfedge.walkWalls(currentNode,nodeWalls,used,self.walls)
+        if cell2 is None or len(used) < len(sharedWalls):
+            # now check if the startNode can be pushed back
+            otherEnd = halfedge.walkWalls(currentNode,nodeWalls,used,self.walls) 
             if otherEnd != currentNode:
                 self.startNode = otherEnd
-        else:
-            sharedWalls = [value for value in self.cell1.walls if value in self.cell2.walls]
-            currentNode=startNode
-            self.endNode = findEndOfCellWall(currentNode,sharedWalls,self.walls)
-            if len(sharedWalls) > 0:
-                # now check if the startNode can be pushed back
-                otherEnd = findEndOfCellWall(currentNode,sharedWalls,self.walls) 
-                if otherEnd != currentNode:
-                    self.startNode = otherEnd
                 
     def addToCells(self):
         self.cell1.addCellWall(self)
@@ -444,11 +534,13 @@ class Cell:
     def __init__(self, mesh,nr):
         self.nr=nr
         self.walls = list()
+        self.wallSet = set()
         self.cellWalls=list()
         self.mesh = mesh
         self.firstNode = None
         self.lastNode = None
         self.type = None
+        self.geometry = None
     
     def circumverence(self):
         size = 0.0
@@ -470,6 +562,9 @@ class Cell:
     
     def addCellWall(self, cellWall):
         self.cellWalls.append(cellWall)
+
+    def sortCellWalls(self):
+        # stable, so cell walls with the same key stay in the order they were added
         self.cellWalls.sort(key=lambda x: x.sortCellWall())
         
     def addNode(self, x, y):
@@ -497,8 +592,18 @@ class Cell:
              wall.addCell(self)
              self.lastNode = None
 
-    def findEndOfWall(self, startNode):
-            nodes = list()
+    def cellWallsByNode(self):
+            cellWallsByNode = dict()
+            for anyCellWall in self.cellWalls:
+                cellWallsByNode.setdefault(anyCellWall.endNode, list()).append(anyCellWall)
+                if anyCellWall.startNode != anyCellWall.endNode:
+                    cellWallsByNode.setdefault(anyCellWall.startNode, list()).append(anyCellWall)
+            return cellWallsByNode
+
+    def findEndOfWall(self, startNode, cellWallsByNode=None):
+            if cellWallsByNode is None:
+                cellWallsByNode = self.cellWallsByNode()
+            nodes = set()
             previousNode = None
             lastNode = startNode
             count = 0
@@ -506,57 +611,76 @@ class Cell:
                 count = count + 1
                 previousNode = lastNode;
                 lastNode = None
-                for anyCellWall in self.cellWalls:
+                # only the cell walls at previousNode can continue the wall, in the order of self.cellWalls
+                for anyCellWall in cellWallsByNode.get(previousNode, ()):
                     if not (anyCellWall.endNode in nodes or anyCellWall.startNode in nodes):
                         if anyCellWall.endNode == previousNode:
                             lastNode = anyCellWall.startNode
-                            nodes.append(previousNode)
+                            nodes.add(previousNode)
                             break
                         if anyCellWall.startNode == previousNode:
                             lastNode = anyCellWall.endNode
-                            nodes.append(previousNode)
+                            nodes.add(previousNode)
                             break
             return [previousNode, count]
 
                      
     def isClosed(self,startNode,endNode,count):
-            closed = false
+            closed = False
             if count < len(self.cellWalls):
-                return false
+                return False
             for anyCellWall in self.cellWalls:
                 if anyCellWall.endNode == endNode and anyCellWall.startNode == startNode:
-                    return true
+                    return True
                 if anyCellWall.startNode == endNode and anyCellWall.endNode == startNode:
-                    return true
-            return false
+                    return True
+            return False
         
         
-    def addCloseWallGap(self):
-            firstWall = self.cellWalls[0]
-            previousNodepreviousCellWall = None
-            startNode = firstWall.startNode
-            [endNode,count1] = self.findEndOfWall(startNode)
-            closed = self.isClosed(endNode,startNode,count1)
-            if not closed:
-                [startNode,count2] = self.findEndOfWall(firstWall.endNode)
-                closed = self.isClosed(startNode,endNode,count1+count2)
-                if closed:
-                    return false
+    def addCloseWallGap(self, halfEdges=None):
+            if len(self.cellWalls) == 0:
+                # a cell without any neighbour is closed by one wall all around
+                startNode = self.firstNode
             else:
-                return false
+                firstWall = self.cellWalls[0]
+                previousNodepreviousCellWall = None
+                cellWallsByNode = self.cellWallsByNode()
+                startNode = firstWall.startNode
+                [endNode,count1] = self.findEndOfWall(startNode,cellWallsByNode)
+                closed = self.isClosed(endNode,startNode,count1)
+                if not closed:
+                    [startNode,count2] = self.findEndOfWall(firstWall.endNode,cellWallsByNode)
+                    closed = self.isClosed(startNode,endNode,count1+count2)
+                    if closed:
+                        return False
+                else:
+                    return False
             # the cell is not closed we need to create a closing wall
-            cellWall = CellWall(self,None,startNode)
+            if halfEdges is None:
+                cellWall = CellWall(self,None,startNode)
+            else:
+                cellWall = CellWall(self,None,startNode,halfEdges.borderWalls(self))
             self.cellWalls.append(cellWall)
             self.mesh.cellWalls.append(cellWall)
             
 
     def appendWall(self,wall):
-        if wall not in self.walls:
+        if wall not in self.wallSet:
             self.walls.append(wall)
+            self.wallSet.add(wall)
             
     def appendFrontWall(self,wall):
-        if wall not in self.walls:
+        if wall not in self.wallSet:
             self.walls.insert(0, wall)
+            self.wallSet.add(wall)
+
+    def insertWall(self,index,wall):
+        self.walls.insert(index, wall)
+        self.wallSet.add(wall)
+
+    def removeWall(self,wall):
+        self.walls.remove(wall)
+        self.wallSet.discard(wall)
 
     def defineInnerCell(self,wall):
         self.appendWall(wall)
@@ -568,20 +692,20 @@ class Cell:
     def retryDefineInnerCell(self):
         if self.lastNode == None:
             return self
-        nextNode = self.lastNode.getNextBorderNode(self.walls)
+        nextNode = self.lastNode.getNextBorderNode(self.wallSet)
         while nextNode != None and nextNode != self.firstNode:
             self.addNodeO(nextNode)
-            nextNode = nextNode.getNextBorderNode(self.walls)
+            nextNode = nextNode.getNextBorderNode(self.wallSet)
         if nextNode == self.firstNode:
             self.addClosingWall()
         else:
-            nextNode = self.firstNode.getNextBorderNode(self.walls)
+            nextNode = self.firstNode.getNextBorderNode(self.wallSet)
             while nextNode != None and nextNode != self.lastNode:
                 wall = self.mesh.getWall(self.firstNode,nextNode)
                 self.appendFrontWall(wall)
                 self.firstNode = nextNode; 
                 wall.addCell(self)
-                nextNode = nextNode.getNextBorderNode(self.walls)
+                nextNode = nextNode.getNextBorderNode(self.wallSet)
             if nextNode == self.lastNode:
                 self.addClosingWall()
             else:
@@ -602,7 +726,9 @@ class Cell:
         return self.toXmlI("cell",cellNodes,border,cellType,self.nr,self.type == "#000000")
 
     def toXmlI(self,nodeName,cellNodes,border,cellType,nr,fixed):  
-        geo = self.getGeometry()   
+        geo = self.geometry
+        if geo is None:
+            geo = self.getGeometry()   
         if not geo:
             return  
         if geo[2]:
@@ -644,25 +770,18 @@ class Cell:
     def toBoundaryBolygon(self,cellNodes):
         self.toXmlI("boundary_polygon",cellNodes,0,self.mesh.colorSpecs[0],-1,False)
 
-    def getGeometry(self):
+    def getRing(self):
         nextNode = self.firstNode
-        coords = list()
-        coords.append(nextNode.getTuple())
+        ring = list()
+        ring.append(nextNode)
         for wall in self.walls:
             if wall.getNode(1) == nextNode:
                 nextNode=wall.getNode(2)
             else:
                 nextNode=wall.getNode(1)
             if  nextNode != self.firstNode:
-                coords.append(nextNode.getTuple())
-        try:
-            polygon = Polygon(coords)
-        except Exception as e:
-            return ()
-        counterclock = orient(polygon, sign=1.0)
-        reverse = polygon.exterior.coords[1] != counterclock.exterior.coords[1]
-        minx, miny, maxx, maxy = polygon.minimum_rotated_rectangle.bounds
-        width = maxx - minx
-        height = maxy - miny
-        diagonal = 0 #hypot(width, height)*1.2
-        return (polygon.area, diagonal, reverse)
+                ring.append(nextNode)
+        return ring
+
+    def getGeometry(self):
+        return geometry.cellGeometries([self.getRing()])[0]
@@ -0,0 +1,766 @@
+from math import sqrt
+from math import floor
+from array import array
+import xml.etree.ElementTree as ET
+import numpy as np
+from . import geometry
+from .cellmodel import ColorSpec
+
+# Array backed variant of cellmodel.Mesh for very large drawings.
+#
+# Instead of Node, Wall, Cell and CellWall objects the topology is kept as
+# struct-of-arrays with integer indices:
+#   nodes      nodeX, nodeY (float64)
+#   walls      wallNode1, wallNode2 (int32), the cells of a wall in wallCell1,
+#              wallCell2 (int32, -1 if absent), rarely more in wallCellsMore
+#   node->wall adjacency as singly linked lists of wall ends (2*wall+side)
+#              in nodeFirstEnd and endNext (int32)
+#   cells      rings of wall indices in ringWalls (int32) at cellStart, cellLength,
+#              together with cellFirstNode and cellType (int32)
+#   cell walls cellWallCell1, cellWallCell2, cellWallStart, cellWallEnd (int32)
+#              and their length
+# The stages are the same as in cellmodel.Mesh and produce the same xml.
+
+EMPTY = -1
+
+class CompactCell:
+    # the part of cellmodel.Cell used while reading a path
+
+    def __init__(self, mesh, nr):
+        self.mesh = mesh
+        self.nr = nr
+
+    def setType(self, type):
+        self.mesh.cellType[self.nr] = self.mesh.typeIndex(type)
+
+    def addNode(self, x, y):
+        return self.mesh.addNodeToCell(self.nr, self.mesh.getNode(x, y))
+
+    def addClosingWall(self):
+        self.mesh.addClosingWall(self.nr)
+
+
+class CompactMesh:
+
+    def __init__(self):
+        self.nodeX = array('d')
+        self.nodeY = array('d')
+        self.nodeFirstEnd = array('i')
+        self.nodeGrid = dict()
+        self.nodeGridSize = None
+        self.wallNode1 = array('i')
+        self.wallNode2 = array('i')
+        self.wallCell1 = array('i')
+        self.wallCell2 = array('i')
+        self.wallCellsMore = dict()
+        self.wallAlive = bytearray()
+        self.endNext = array('i')
+        self.ringWalls = array('i')
+        self.cellStart = array('q')
+        self.cellLength = array('i')
+        self.cellFirstNode = array('i')
+        self.cellType = array('i')
+        self.openRings = dict()
+        self.typeNames = list()
+        self.boundary_polygon = EMPTY
+        self.cellWallCell1 = array('i')
+        self.cellWallCell2 = array('i')
+        self.cellWallStart = array('i')
+        self.cellWallEnd = array('i')
+        self.cellWallLength = array('d')
+        self.cellWallSize = array('i')
+        self.cellWallKey = array('i')
+        self.cellCellWalls = None
+        self.splitIterations = 0
+        self.mul = 0.75
+        self.pixelScale = 5.
+        self.setColormap("ffffff,1,2.251808,0.481961:0000f8,2,2.251808,0.481961:009000,3,2.251808,0.481961:ff0000,3,2.251808,0.481961")
+
+    def setColormap(self, colormap):
+        self.colorSpecs = list()
+        self.colorSpecs.append(ColorSpec("000000,0"))
+        colors = colormap.split(':')
+        for color in colors:
+            self.colorSpecs.append(ColorSpec(color))
+
+    def setScale(self, onePersentScale):
+        self.mul = onePersentScale*self.pixelScale;
+
+    def typeIndex(self, type):
+        if not (type in self.typeNames):
+            self.typeNames.append(type)
+        return self.typeNames.index(type)
+
+    def counts(self):
+        cells = len(self.cellStart)
+        if self.boundary_polygon != EMPTY:
+            cells -= 1
+        return {"nodes": len(self.nodeX), "walls": sum(self.wallAlive), "cells": cells, \
+                "cellWalls": len(self.cellWallCell1), "splitIterations": self.splitIterations}
+
+    # array views
+
+    def nodeCoordinates(self):
+        coordinates = np.empty((len(self.nodeX), 2))
+        coordinates[:, 0] = np.frombuffer(self.nodeX, dtype=np.float64)
+        coordinates[:, 1] = np.frombuffer(self.nodeY, dtype=np.float64)
+        return coordinates
+
+    def wallNodes(self):
+        alive = np.frombuffer(bytes(self.wallAlive), dtype=np.uint8).astype(bool)
+        pairs = np.empty((len(self.wallNode1), 2), dtype=np.int32)
+        pairs[:, 0] = np.frombuffer(self.wallNode1, dtype=np.int32)
+        pairs[:, 1] = np.frombuffer(self.wallNode2, dtype=np.int32)
+        return pairs[alive]
+
+    def cellRings(self):
+        # CSR form of the cell rings: offsets and wall indices, in cell order
+        lengths = np.frombuffer(self.cellLength, dtype=np.int32).astype(np.int64)
+        offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        walls = np.empty(offsets[-1], dtype=np.int32)
+        for cell in range(len(lengths)):
+            walls[offsets[cell]:offsets[cell+1]] = self.ring(cell)
+        return offsets, walls
+
+    # nodes
+
+    def nodeGridKey(self, x, y):
+        return (int(floor(x/self.mul)), int(floor(y/self.mul)))
+
+    def rebuildNodeGrid(self):
+        self.nodeGrid = dict()
+        self.nodeGridSize = self.mul
+        for node in range(len(self.nodeX)):
+            self.nodeGrid.setdefault(self.nodeGridKey(self.nodeX[node], self.nodeY[node]), list()).append(node)
+
+    def getNode(self, x, y):
+        if self.nodeGridSize != self.mul:
+            self.rebuildNodeGrid()
+        gridX, gridY = self.nodeGridKey(x, y)
+        found = EMPTY
+        for deltaX in (-1, 0, 1):
+            for deltaY in (-1, 0, 1):
+                for node in self.nodeGrid.get((gridX+deltaX, gridY+deltaY), ()):
+                    if sqrt(pow(self.nodeX[node]-x, 2) + pow(self.nodeY[node]-y, 2)) < self.mul and (found == EMPTY or node < found):
+                        found = node
+        if found != EMPTY:
+            return found
+        node = len(self.nodeX)
+        self.nodeX.append(x)
+        self.nodeY.append(y)
+        self.nodeFirstEnd.append(EMPTY)
+        self.nodeGrid.setdefault((gridX, gridY), list()).append(node)
+        return node
+
+    def nodeWalls(self, node):
+        walls = list()
+        end = self.nodeFirstEnd[node]
+        while end != EMPTY:
+            walls.append(end >> 1)
+            end = self.endNext[end]
+        return walls
+
+    # walls
+
+    def otherNode(self, wall, node):
+        if self.wallNode1[wall] == node:
+            return self.wallNode2[wall]
+        return self.wallNode1[wall]
+
+    def findWall(self, node1, node2):
+        end = self.nodeFirstEnd[node1]
+        while end != EMPTY:
+            wall = end >> 1
+            if (self.wallNode1[wall] == node1 and self.wallNode2[wall] == node2) or \
+               (self.wallNode1[wall] == node2 and self.wallNode2[wall] == node1):
+                return wall
+            end = self.endNext[end]
+        return EMPTY
+
+    def getWall(self, node1, node2):
+        if node1 == node2:
+            print("error")
+        wall = self.findWall(node1, node2)
+        if wall != EMPTY:
+            return wall
+        wall = len(self.wallNode1)
+        self.wallNode1.append(node1)
+        self.wallNode2.append(node2)
+        self.wallCell1.append(EMPTY)
+        self.wallCell2.append(EMPTY)
+        self.wallAlive.append(1)
+        # link both ends of the wall in front of the adjacency lists of its nodes
+        self.endNext.append(self.nodeFirstEnd[node1])
+        self.nodeFirstEnd[node1] = 2*wall
+        self.endNext.append(self.nodeFirstEnd[node2])
+        self.nodeFirstEnd[node2] = 2*wall+1
+        return wall
+
+    def unlinkEnd(self, node, end):
+        previous = EMPTY
+        current = self.nodeFirstEnd[node]
+        while current != end:
+            previous = current
+            current = self.endNext[current]
+        if previous == EMPTY:
+            self.nodeFirstEnd[node] = self.endNext[end]
+        else:
+            self.endNext[previous] = self.endNext[end]
+
+    def removeWall(self, wall):
+        self.unlinkEnd(self.wallNode1[wall], 2*wall)
+        if self.wallNode2[wall] != self.wallNode1[wall]:
+            self.unlinkEnd(self.wallNode2[wall], 2*wall+1)
+        self.wallAlive[wall] = 0
+
+    def wallLength(self, wall):
+        deltax = self.nodeX[self.wallNode1[wall]]-self.nodeX[self.wallNode2[wall]];
+        deltay = self.nodeY[self.wallNode1[wall]]-self.nodeY[self.wallNode2[wall]];
+        return sqrt(deltax*deltax + deltay*deltay)
+
+    def wallCells(self, wall):
+        cells = list()
+        if self.wallCell1[wall] != EMPTY:
+            cells.append(self.wallCell1[wall])
+            if self.wallCell2[wall] != EMPTY:
+                cells.append(self.wallCell2[wall])
+                cells.extend(self.wallCellsMore.get(wall, ()))
+        return cells
+
+    def setWallCells(self, wall, cells):
+        self.wallCell1[wall] = cells[0] if len(cells) > 0 else EMPTY
+        self.wallCell2[wall] = cells[1] if len(cells) > 1 else EMPTY
+        if len(cells) > 2:
+            self.wallCellsMore[wall] = cells[2:]
+        else:
+            self.wallCellsMore.pop(wall, None)
+
+    def wallCellCount(self, wall):
+        if self.wallCell1[wall] == EMPTY:
+            return 0
+        if self.wallCell2[wall] == EMPTY:
+            return 1
+        return 2 + len(self.wallCellsMore.get(wall, ()))
+
+    def isBorder(self, wall):
+        return self.wallCell2[wall] == EMPTY
+
+    def addWallCell(self, wall, cell):
+        cells = self.wallCells(wall)
+        if not (cell in cells):
+            cells.append(cell)
+            self.setWallCells(wall, cells)
+
+    def appendWallCell(self, wall, cell):
+        cells = self.wallCells(wall)
+        cells.append(cell)
+        self.setWallCells(wall, cells)
+
+    def removeWallCell(self, wall, cell):
+        cells = self.wallCells(wall)
+        cells.remove(cell)
+        self.setWallCells(wall, cells)
+
+    # cells
+
+    def getCell(self):
+        cell = len(self.cellStart)
+        self.cellStart.append(len(self.ringWalls))
+        self.cellLength.append(0)
+        self.cellFirstNode.append(EMPTY)
+        self.cellType.append(self.typeIndex(None))
+        # rings under construction are kept as lists, with the last node they reached
+        self.openRings[cell] = [list(), set(), EMPTY]
+        return CompactCell(self, cell)
+
+    def ring(self, cell):
+        if cell in self.openRings:
+            return self.openRings[cell][0]
+        start = self.cellStart[cell]
+        return self.ringWalls[start:start+self.cellLength[cell]]
+
+    def storeRing(self, cell, walls):
+        self.cellStart[cell] = len(self.ringWalls)
+        self.cellLength[cell] = len(walls)
+        self.ringWalls.extend(walls)
+
+    def closeRing(self, cell):
+        self.storeRing(cell, self.openRings.pop(cell)[0])
+
+    def compactRings(self):
+        # rings that were rewritten leave their old copy behind
+        if len(self.ringWalls) > 2*sum(self.cellLength):
+            rings = [self.ring(cell) for cell in range(len(self.cellStart))]
+            self.ringWalls = array('i')
+            for cell, walls in enumerate(rings):
+                if not (cell in self.openRings):
+                    self.storeRing(cell, walls)
+
+    def appendRingWall(self, cell, wall):
+        openRing = self.openRings[cell]
+        if not (wall in openRing[1]):
+            openRing[0].append(wall)
+            openRing[1].add(wall)
+
+    def appendFrontRingWall(self, cell, wall):
+        openRing = self.openRings[cell]
+        if not (wall in openRing[1]):
+            openRing[0].insert(0, wall)
+            openRing[1].add(wall)
+
+    def addNodeToCell(self, cell, node):
+        openRing = self.openRings[cell]
+        if openRing[2] == EMPTY:
+            openRing[2] = node
+            self.cellFirstNode[cell] = node
+            return False
+        if len(openRing[0]) > 1 and node == self.cellFirstNode[cell]:
+            return True
+        if openRing[2] == node:
+            return False
+        wall = self.getWall(openRing[2], node)
+        self.appendRingWall(cell, wall)
+        self.addWallCell(wall, cell)
+        openRing[2] = node
+        return False
+
+    def addClosingWall(self, cell):
+        openRing = self.openRings[cell]
+        wall = self.getWall(openRing[2], self.cellFirstNode[cell])
+        self.appendRingWall(cell, wall)
+        self.addWallCell(wall, cell)
+        self.closeRing(cell)
+
+    def nextBorderNode(self, node, cellWalls):
+        potential = [wall for wall in self.nodeWalls(node) if not (wall in cellWalls) and self.isBorder(wall)]
+        if len(potential) == 1:
+            return self.otherNode(potential[0], node)
+        return EMPTY
+
+    def retryDefineInnerCell(self, cell):
+        if not (cell in self.openRings):
+            return True
+        openRing = self.openRings[cell]
+        nextNode = self.nextBorderNode(openRing[2], openRing[1])
+        while nextNode != EMPTY and nextNode != self.cellFirstNode[cell]:
+            self.addNodeToCell(cell, nextNode)
+            nextNode = self.nextBorderNode(nextNode, openRing[1])
+        if nextNode == self.cellFirstNode[cell]:
+            self.addClosingWall(cell)
+            return True
+        nextNode = self.nextBorderNode(self.cellFirstNode[cell], openRing[1])
+        while nextNode != EMPTY and nextNode != openRing[2]:
+            wall = self.getWall(self.cellFirstNode[cell], nextNode)
+            self.appendFrontRingWall(cell, wall)
+            self.cellFirstNode[cell] = nextNode
+            self.addWallCell(wall, cell)
+            nextNode = self.nextBorderNode(nextNode, openRing[1])
+        if nextNode == openRing[2]:
+            self.addClosingWall(cell)
+            return True
+        return False
+
+    def defineInnerCells(self, enclosed=()):
+        white = self.typeIndex("#ffffff")
+        # the border walls of the enclosed cells lie inside another cell, not around an inner cell
+        enclosed = set(cell.nr for cell in enclosed)
+        wall = 0
+        while wall < len(self.wallNode1):
+            if self.wallAlive[wall] and self.isBorder(wall) and not (self.wallCell1[wall] in enclosed):
+                cell = self.getCell().nr
+                self.cellType[cell] = white
+                self.appendRingWall(cell, wall)
+                self.addWallCell(wall, cell)
+                self.cellFirstNode[cell] = self.wallNode1[wall]
+                self.openRings[cell][2] = self.wallNode2[wall]
+                self.retryDefineInnerCell(cell)
+            wall += 1
+        another = False
+        for cell in range(len(self.cellStart)):
+            if not self.retryDefineInnerCell(cell):
+                another = True
+        if another:
+            for cell in range(len(self.cellStart)):
+                if not self.retryDefineInnerCell(cell):
+                    print("not successful, defining an inner cell! around nr = " + str(cell) + " pos(" + str(self.nodeX[self.cellFirstNode[cell]]) + "," + str(self.nodeY[self.cellFirstNode[cell]]) + ")")
+        # cells that could not be closed keep the walls they reached
+        for cell in list(self.openRings):
+            self.closeRing(cell)
+        self.removeCircumverence()
+
+    def circumverence(self, cell):
+        size = 0.0
+        for wall in self.ring(cell):
+            size += self.wallLength(wall)
+        return size
+
+    def removeCircumverence(self):
+        longest = 0.0
+        self.boundary_polygon = EMPTY
+        for cell in range(len(self.cellStart)):
+            size = self.circumverence(cell)
+            if size > longest:
+                longest = size
+                self.boundary_polygon = cell
+        if self.boundary_polygon != EMPTY:
+            for wall in self.ring(self.boundary_polygon):
+                self.removeWallCell(wall, self.boundary_polygon)
+
+    def cellNumbers(self):
+        # cell numbers in the xml, the boundary polygon is not counted
+        numbers = np.arange(len(self.cellStart), dtype=np.int64)
+        if self.boundary_polygon != EMPTY:
+            numbers[self.boundary_polygon+1:] -= 1
+            numbers[self.boundary_polygon] = EMPTY
+        return numbers
+
+    def cells(self):
+        return [cell for cell in range(len(self.cellStart)) if cell != self.boundary_polygon]
+
+    # sliver removal
+
+    def trianglesOfWall(self, wall):
+        triangles = list()
+        node1 = self.wallNode1[wall]
+        node2 = self.wallNode2[wall]
+        length = self.wallLength(wall)
+        for firstWall in self.nodeWalls(node1):
+            if firstWall == wall:
+                continue
+            tiangleNode = self.otherNode(firstWall, node1)
+            if tiangleNode == node1 or tiangleNode == node2:
+                continue
+            secondWall = self.findWall(tiangleNode, node2)
+            if secondWall == EMPTY:
+                continue
+            if self.wallLength(firstWall) < length and self.wallLength(secondWall) < length:
+                area = (0.5)*abs(self.nodeX[node1]*(self.nodeY[node2] - self.nodeY[tiangleNode]) + \
+                                 self.nodeX[node2]*(self.nodeY[tiangleNode] - self.nodeY[node1]) + \
+                                 self.nodeX[tiangleNode]*(self.nodeY[node1] - self.nodeY[node2]))
+                if area < (4.*self.pixelScale*self.pixelScale):
+                    triangles.append((firstWall, secondWall, wall))
+        return triangles
+
+    def sharedNode(self, wall, otherWall):
+        if self.wallNode1[wall] == self.wallNode1[otherWall] or self.wallNode2[wall] == self.wallNode1[otherWall]:
+            return self.wallNode1[otherWall]
+        if self.wallNode1[wall] == self.wallNode2[otherWall] or self.wallNode2[wall] == self.wallNode2[otherWall]:
+            return self.wallNode2[otherWall]
+        return EMPTY
+
+    def splitParallelWall(self, triangle):
+        firstWall, secondWall, wall = triangle
+        for cell in sorted(set(self.wallCells(wall))):
+            walls = list(self.ring(cell))
+            if not (wall in walls):
+                continue
+            index = walls.index(wall)
+            after = walls[(index+1)%len(walls)]
+            shared = self.sharedNode(after, wall)
+            if shared != EMPTY and secondWall in self.nodeWalls(shared):
+                walls[index:index+1] = [firstWall, secondWall]
+                self.removeWallCell(wall, cell)
+                self.appendWallCell(secondWall, cell)
+                self.appendWallCell(firstWall, cell)
+            else:
+                walls[index:index+1] = [secondWall, firstWall]
+                self.removeWallCell(wall, cell)
+                self.appendWallCell(firstWall, cell)
+                self.appendWallCell(secondWall, cell)
+            self.storeRing(cell, walls)
+        self.removeWall(wall)
+
+    def reduceParallelWalls(self):
+        # same rounds as cellmodel.Mesh.reduceParallelWalls, walls are checked again when a neighbour was removed
+        triangles = dict()
+        toCheck = [wall for wall in range(len(self.wallNode1)) if self.wallAlive[wall]]
+        while len(toCheck) > 0:
+            for wall in toCheck:
+                found = self.trianglesOfWall(wall)
+                if len(found) > 0:
+                    triangles[wall] = found
+                else:
+                    triangles.pop(wall, None)
+            wallsToSplit = list()
+            for wall in sorted(triangles):
+                wallsToSplit.extend(triangles[wall])
+            if len(wallsToSplit) == 0:
+                break
+            self.splitIterations += 1
+            removed = set()
+            for triangle in wallsToSplit:
+                self.splitParallelWall(triangle)
+                removed.add(triangle[2])
+            touched = set()
+            for wall in removed:
+                triangles.pop(wall, None)
+                touched.update(self.nodeWalls(self.wallNode1[wall]))
+                touched.update(self.nodeWalls(self.wallNode2[wall]))
+            toCheck = [wall for wall in touched if not (wall in removed)]
+        self.compactRings()
+
+    # cell walls
+
+    def findEndOfCellWall(self, currentNode, sharedWalls, walls):
+        nextNode = EMPTY
+        while nextNode != currentNode:
+            nextNode = currentNode
+            for index, wall in enumerate(sharedWalls):
+                if self.wallNode1[wall] == currentNode:
+                    currentNode = self.wallNode2[wall]
+                    del sharedWalls[index]
+                    walls.append(wall)
+                    break
+                elif self.wallNode2[wall] == currentNode:
+                    currentNode = self.wallNode1[wall]
+                    del sharedWalls[index]
+                    walls.append(wall)
+                    break
+        return currentNode
+
+    def addCellWall(self, cell1, cell2, startNode, sharedWalls):
+        walls = list()
+        currentNode = startNode
+        endNode = self.findEndOfCellWall(currentNode, sharedWalls, walls)
+        if cell2 == EMPTY or len(sharedWalls) > 0:
+            otherEnd = self.findEndOfCellWall(currentNode, sharedWalls, walls)
+            if otherEnd != currentNode:
+                startNode = otherEnd
+        total = 0
+        for wall in walls:
+            total = total+self.wallLength(wall)
+        self.cellWallCell1.append(cell1)
+        self.cellWallCell2.append(cell2)
+        self.cellWallStart.append(startNode)
+        self.cellWallEnd.append(endNode)
+        self.cellWallLength.append(total)
+        self.cellWallSize.append(len(walls))
+        # cellmodel.CellWall.sortCellWall starts from 10000
+        self.cellWallKey.append(min([10000] + walls))
+        return walls
+
+    def findEndOfWall(self, cellWalls, startNode):
+        nodes = set()
+        previousNode = EMPTY
+        lastNode = startNode
+        count = 0
+        while lastNode != EMPTY:
+            count = count + 1
+            previousNode = lastNode
+            lastNode = EMPTY
+            for cellWall in cellWalls:
+                if not (self.cellWallEnd[cellWall] in nodes or self.cellWallStart[cellWall] in nodes):
+                    if self.cellWallEnd[cellWall] == previousNode:
+                        lastNode = self.cellWallStart[cellWall]
+                        nodes.add(previousNode)
+                        break
+                    if self.cellWallStart[cellWall] == previousNode:
+                        lastNode = self.cellWallEnd[cellWall]
+                        nodes.add(previousNode)
+                        break
+        return previousNode, count
+
+    def isClosed(self, cellWalls, startNode, endNode, count):
+        if count < len(cellWalls):
+            return False
+        for cellWall in cellWalls:
+            if self.cellWallEnd[cellWall] == endNode and self.cellWallStart[cellWall] == startNode:
+                return True
+            if self.cellWallStart[cellWall] == endNode and self.cellWallEnd[cellWall] == startNode:
+                return True
+        return False
+
+    def addCloseWallGap(self, cell, cellWalls):
+        if len(cellWalls) == 0:
+            # a cell without any neighbour is closed by one wall all around
+            startNode = self.cellFirstNode[cell]
+        else:
+            firstWall = cellWalls[0]
+            startNode = self.cellWallStart[firstWall]
+            endNode, count1 = self.findEndOfWall(cellWalls, startNode)
+            if self.isClosed(cellWalls, endNode, startNode, count1):
+                return EMPTY
+            startNode, count2 = self.findEndOfWall(cellWalls, self.cellWallEnd[firstWall])
+            if self.isClosed(cellWalls, startNode, endNode, count1+count2):
+                return EMPTY
+        sharedWalls = [wall for wall in self.ring(cell) if self.wallCellCount(wall) == 1]
+        self.addCellWall(cell, EMPTY, startNode, sharedWalls)
+        return len(self.cellWallCell1)-1
+
+    def defineCellWalls(self):
+        done = bytearray(len(self.wallNode1))
+        for startWall in range(len(self.wallNode1)):
+            if done[startWall] or not self.wallAlive[startWall]:
+                continue
+            if self.wallCellCount(startWall) < 2:
+                continue
+            cell1 = self.wallCell1[startWall]
+            cell2 = self.wallCell2[startWall]
+            cell2Walls = set(self.ring(cell2))
+            sharedWalls = [wall for wall in self.ring(cell1) if wall in cell2Walls]
+            for wall in self.addCellWall(cell1, cell2, self.wallNode1[startWall], sharedWalls):
+                done[wall] = 1
+        # the cell walls of a cell sorted like cellmodel.Cell.addCellWall does, stable on creation order
+        count = len(self.cellWallCell1)
+        cellWallCells = np.concatenate([np.frombuffer(self.cellWallCell1, dtype=np.int32), np.frombuffer(self.cellWallCell2, dtype=np.int32)])
+        cellWallIndex = np.concatenate([np.arange(count), np.arange(count)])
+        keys = np.frombuffer(self.cellWallKey, dtype=np.int32)[cellWallIndex]
+        order = np.lexsort((cellWallIndex, keys, cellWallCells))
+        order = order[cellWallCells[order] != EMPTY]
+        sortedCells = cellWallCells[order]
+        sortedCellWalls = cellWallIndex[order]
+        bounds = np.searchsorted(sortedCells, np.arange(len(self.cellStart)+1))
+        self.cellCellWalls = list()
+        for cell in range(len(self.cellStart)):
+            cellWalls = sortedCellWalls[bounds[cell]:bounds[cell+1]].tolist()
+            if cell != self.boundary_polygon:
+                gap = self.addCloseWallGap(cell, cellWalls)
+                if gap != EMPTY:
+                    cellWalls.append(gap)
+            self.cellCellWalls.append(cellWalls)
+
+    # xml
+
+    def ringNodes(self, cell, walls):
+        nextNode = self.cellFirstNode[cell]
+        firstNode = nextNode
+        nodes = [nextNode]
+        for wall in walls:
+            if self.wallNode1[wall] == nextNode:
+                nextNode = self.wallNode2[wall]
+            else:
+                nextNode = self.wallNode1[wall]
+            if nextNode != firstNode:
+                nodes.append(nextNode)
+        return nodes
+
+    def nodesToXml(self):
+        docNodes = ET.Element("nodes", n = str(len(self.nodeX)))
+        wallNode1 = np.frombuffer(self.wallNode1, dtype=np.int32)
+        wallNode2 = np.frombuffer(self.wallNode2, dtype=np.int32)
+        alive = np.frombuffer(bytes(self.wallAlive), dtype=np.uint8).astype(bool)
+        border = alive & (np.frombuffer(self.wallCell2, dtype=np.int32) == EMPTY)
+        black = np.array([name == "#000000" for name in self.typeNames], dtype=bool)
+        cellBlack = black[np.frombuffer(self.cellType, dtype=np.int32)]
+        fixedWall = np.zeros(len(wallNode1), dtype=bool)
+        for cells in (self.wallCell1, self.wallCell2):
+            cells = np.frombuffer(cells, dtype=np.int32)
+            fixedWall |= (cells != EMPTY) & cellBlack[cells]
+        for wall, cells in self.wallCellsMore.items():
+            fixedWall[wall] |= any(cellBlack[cell] for cell in cells)
+        fixedWall &= alive
+        nodeBorder = np.zeros(len(self.nodeX), dtype=bool)
+        nodeFixed = np.zeros(len(self.nodeX), dtype=bool)
+        for ends in (wallNode1, wallNode2):
+            nodeBorder[ends[border]] = True
+            nodeFixed[ends[fixedWall]] = True
+        for nr, x, y, isBorder, isFixed in zip(range(len(self.nodeX)), self.nodeX, self.nodeY, nodeBorder.tolist(), nodeFixed.tolist()):
+            ET.SubElement(docNodes, "node", nr=str(nr), x = str(x), y = str(y), sam="false", boundary=str(isBorder).lower(), fixed=str(isFixed).lower())
+        return docNodes
+
+    def cellToXml(self, docCells, nodeName, cell, geo, border, cellType, nr, fixed, cellNumbers):
+        walls = list(self.ring(cell))
+        if geo[2]:
+            walls.reverse()
+        cellNode = ET.SubElement(docCells, nodeName \
+                                 , boundary=str(cellType.boundary()) \
+                                 , cell_type=cellType.cellType \
+                                 , target_area=str(geo[0]) \
+                                 , lambda_celllength="0" \
+                                 , at_boundary=str(border==0).lower() \
+                                 , dead="false" \
+                                 , target_length=str(geo[1]) \
+                                 , stiffness="1" \
+                                 , index=str(nr) \
+                                 , source="false" \
+                                 , pin_fixed=str(fixed).lower() \
+                                 , area=str(geo[0]) \
+                                 , fixed=str(fixed).lower() \
+                                 , div_counter="0" \
+                                 )
+        for node in self.ringNodes(cell, walls):
+            ET.SubElement(cellNode, "node" , n=str(node))
+        if nodeName == "cell":
+            for cellWall in self.cellCellWalls[cell]:
+                ET.SubElement(cellNode, "wall" , w=str(cellWall))
+        if (len(cellType.chems)>0):
+            chemEt = ET.SubElement(cellNode, "chem" , n=str(len(cellType.chems)))
+            for chem in cellType.chems:
+                ET.SubElement(chemEt, "val" , v=str(chem))
+
+    def cellsToXml(self):
+        cells = self.cells()
+        cellNumbers = self.cellNumbers()
+        docCells = ET.Element("cells" \
+                                 , n = str(len(cells)) \
+                                 , magnfication="1" \
+                                 , nchem="0" \
+                                 , offsetx="0" \
+                                 , offsety="0" \
+                                 , base_area="0" \
+                                 )
+        written = list(cells)
+        if self.boundary_polygon != EMPTY:
+            written.append(self.boundary_polygon)
+        rings = [self.ringNodes(cell, self.ring(cell)) for cell in written]
+        offsets = np.zeros(len(rings)+1, dtype=np.int64)
+        np.cumsum([len(ring) for ring in rings], out=offsets[1:])
+        ringNodes = np.fromiter((node for ring in rings for node in ring), dtype=np.int64, count=offsets[-1])
+        geometries = geometry.ringGeometries(np.frombuffer(self.nodeX, dtype=np.float64)[ringNodes], np.frombuffer(self.nodeY, dtype=np.float64)[ringNodes], offsets)
+        cellTypes = list()
+        for name in self.typeNames:
+            cellType = self.colorSpecs[0]
+            for colorSpec in self.colorSpecs:
+                if (colorSpec.isType(name)):
+                    cellType = colorSpec
+            cellTypes.append(cellType)
+        total_area = 0
+        for cell, geo in zip(cells, geometries):
+            if not geo:
+                raise ValueError("cell " + str(cell) + " is not a polygon")
+            border = 0
+            for wall in self.ring(cell):
+                if self.isBorder(wall):
+                    border = 1
+            fixed = self.typeNames[self.cellType[cell]] == "#000000"
+            self.cellToXml(docCells, "cell", cell, geo, border, cellTypes[self.cellType[cell]], cellNumbers[cell], fixed, cellNumbers)
+            total_area = total_area + geo[0]
+
+        average_area = total_area / len(cells)
+
+        docCells.set("base_area", str(average_area))
+
+        if self.boundary_polygon != EMPTY and geometries[-1]:
+            self.cellToXml(docCells, "boundary_polygon", self.boundary_polygon, geometries[-1], 0, self.colorSpecs[0], -1, False, cellNumbers)
+        return docCells
+
+    def wallsToXml(self):
+        cellNumbers = self.cellNumbers()
+        docWalls = ET.Element("walls", n = str(sum(self.wallAlive)))
+        for nr in range(len(self.cellWallCell1)):
+            cell2 = self.cellWallCell2[nr]
+            # an empty cell wall has the integer length 0, like cellmodel.CellWall.length
+            length = self.cellWallLength[nr] if self.cellWallSize[nr] > 0 else 0
+            wallNode = ET.SubElement(docWalls, "wall" \
+                                 , length=str(length) \
+                                 , c1=str(cellNumbers[self.cellWallCell1[nr]]) \
+                                 , c2=str(-1 if cell2 == EMPTY else cellNumbers[cell2]) \
+                                 , index=str(nr) \
+                                 , n1=str(self.cellWallStart[nr]) \
+                                 , n2=str(self.cellWallEnd[nr]) \
+                                 , wall_type="normal"  \
+                                 , viz_flux="0" \
+                                 )
+            ET.SubElement(wallNode, "transporters1")
+            ET.SubElement(wallNode, "transporters2")
+        return docWalls
+
+    def xmlSections(self):
+        return {"nodes": self.nodesToXml, "cells": self.cellsToXml, "walls": self.wallsToXml}
+
+    def toXml(self):
+        docLeaf = ET.Element("leaf")
+        for section in self.xmlSections().values():
+            docLeaf.append(section())
+        return docLeaf
@@ -0,0 +1,106 @@
+# Batched polygon measures for all cells of a mesh at once.
+# The rings are stored as flat coordinate arrays with one offset per cell,
+# a cell i owns the coordinates offsets[i]:offsets[i+1].
+# Everything is computed on the flat arrays, the memory grows with the number
+# of vertices and not with the number of cells times the longest ring.
+# Small meshes are measured in plain python with the same arithmetic, so a
+# small conversion does not have to load numpy.
+
+# number of vertices from which numpy is used
+smallRings = 20000
+
+# rings up to this many vertices are summed by np.add.reduceat, which adds
+# short segments one after the other; longer rings are summed in order by
+# position so the result does not depend on numpy's pairwise summation
+reduceatRing = 8
+
+def ringArrays(rings):
+    import numpy as np
+    lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    offsets = np.zeros(len(rings)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    xs = np.fromiter((node.x for ring in rings for node in ring), dtype=np.float64, count=offsets[-1])
+    ys = np.fromiter((node.y for ring in rings for node in ring), dtype=np.float64, count=offsets[-1])
+    return xs, ys, offsets
+
+def signedAreas(xs, ys, offsets):
+    # Shoelace formula evaluated exactly like GEOS does for a polygon shell
+    # (x shifted by the first vertex, summed vertex by vertex), so the areas
+    # are the same floats shapely used to report.
+    # The result is positive for clockwise rings.
+    import numpy as np
+    count = len(offsets)-1
+    total = np.zeros(count)
+    if len(xs) == 0:
+        return total
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    owner = np.repeat(np.arange(count), lengths)
+    position = np.arange(len(xs)) - starts[owner]
+    # previous and next vertex inside the ring of every vertex
+    previous = np.where(position == 0, offsets[1:][owner] - 1, np.arange(len(xs)) - 1)
+    following = np.where(position == lengths[owner] - 1, starts[owner], np.arange(len(xs)) + 1)
+    # the term of the first vertex of a ring is 0
+    terms = (xs - xs[starts[owner]])*(ys[previous] - ys[following])
+    del owner, position, previous, following
+    filled = lengths > 0
+    total[filled] = np.add.reduceat(terms, starts[filled])
+    # long rings: add the terms column by column, longest rings first
+    long = np.flatnonzero(lengths > reduceatRing)
+    if len(long) > 0:
+        long = long[np.argsort(-lengths[long], kind="stable")]
+        longLengths = lengths[long]
+        longStarts = starts[long]
+        sums = np.zeros(len(long))
+        for i in range(1, int(longLengths[0])):
+            active = np.searchsorted(-longLengths, -i, side="left")
+            sums[:active] += terms[longStarts[:active] + i]
+        total[long] = sums
+    return total/2.0
+
+def cellGeometries(rings, bounds=False):
+    # returns (area, diagonal, reverse) per ring of nodes, or () if the ring is not a polygon,
+    # with bounds=True the axis aligned (minx, miny, maxx, maxy) is appended
+    if sum(len(ring) for ring in rings) < smallRings:
+        return [ringGeometry([node.x for node in ring], [node.y for node in ring], bounds) for ring in rings]
+    xs, ys, offsets = ringArrays(rings)
+    return ringGeometries(xs, ys, offsets, bounds)
+
+def signedArea(x, y):
+    # signedAreas for a single ring, term by term in the same order
+    count = len(x)
+    total = 0.0
+    for i in range(1, count):
+        total += (x[i] - x[0])*(y[i-1] - y[(i+1)%count])
+    return total/2.0
+
+def ringGeometry(x, y, bounds=False):
+    if len(x) < 3:
+        return ()
+    area = signedArea(x, y)
+    geometry = (abs(area), 0, area > 0)
+    if bounds:
+        geometry = geometry + ((min(x), min(y), max(x), max(y)),)
+    return geometry
+
+def ringGeometries(xs, ys, offsets, bounds=False):
+    import numpy as np
+    areas = signedAreas(xs, ys, offsets)
+    lengths = np.diff(offsets)
+    if bounds and len(xs) > 0:
+        starts = np.minimum(offsets[:-1], len(xs)-1)
+        minx = np.minimum.reduceat(xs, starts)
+        miny = np.minimum.reduceat(ys, starts)
+        maxx = np.maximum.reduceat(xs, starts)
+        maxy = np.maximum.reduceat(ys, starts)
+    geometries = list()
+    for i in range(len(offsets)-1):
+        if lengths[i] < 3:
+            geometries.append(())
+            continue
+        # a clockwise ring has to be reversed to become counter clockwise
+        geometry = (abs(float(areas[i])), 0, bool(areas[i] > 0))
+        if bounds:
+            geometry = geometry + ((float(minx[i]), float(miny[i]), float(maxx[i]), float(maxy[i])),)
+        geometries.append(geometry)
+    return geometries
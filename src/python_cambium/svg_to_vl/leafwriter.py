@@ -0,0 +1,63 @@
+import os
+import xml.etree.ElementTree as ET
+
+# Streams a VirtualLeaf xml file section by section.
+# The template is read with iterparse, every top level element of the template
+# is written as soon as it is complete and then dropped. Sections with the same
+# tag as one of the generated sections (nodes, cells, walls) are replaced by
+# the generated one, which is only built at that moment.
+
+indent = "   "
+
+def writeSection(f, element):
+    element.tail = None
+    ET.indent(element, space=indent, level=1)
+    f.write(indent)
+    f.write(ET.tostring(element, encoding="unicode"))
+    f.write("\n")
+
+def quoteattr(value):
+    # same result as xml.sax.saxutils.quoteattr, which takes long to import
+    value = value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    value = value.replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', "&quot;") + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+def startTag(element):
+    attributes = "".join(" " + key + "=" + quoteattr(value) for key, value in element.attrib.items())
+    return "<" + element.tag + attributes + ">"
+
+def writeLeaf(fileName, template, sections):
+    # written next to the result first, so a failing conversion does not leave half a file behind
+    partFileName = fileName + ".part"
+    try:
+        streamLeaf(partFileName, template, sections)
+    except BaseException:
+        if os.path.exists(partFileName):
+            os.remove(partFileName)
+        raise
+    os.replace(partFileName, fileName)
+
+def streamLeaf(fileName, template, sections):
+    with open(fileName, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(template, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+                    f.write(startTag(root) + "\n")
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if element.tag in sections:
+                    writeSection(f, sections[element.tag]())
+                else:
+                    writeSection(f, element)
+                root.remove(element)
+        f.write("</" + root.tag + ">\n")
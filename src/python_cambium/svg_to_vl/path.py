@@ -7,195 +7,89 @@ def is_number(s):
     except ValueError:
         return False
 
+# SVG path data is read in a single pass: every command letter or number is
+# read once and the current point is tracked while going along, so only the
+# absolute vertices remain. Curves and arcs are replaced by their end point.
+
+commandPattern = re.compile(r'[\s,]*([MmZzLlHhVvCcSsQqTtAa])')
+numberPattern = re.compile(r'[\s,]*([+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)')
+flagPattern = re.compile(r'[\s,]*([01])')
+endPattern = re.compile(r'[\s,]*$')
+
+# number of arguments per command, the end point is always in the last two (one for H and V)
+argumentCounts = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+
+def readArguments(line, position, command):
+    arguments = list()
+    for index in range(argumentCounts[command]):
+        # the large-arc and sweep flags of an arc may be written without separators
+        if command == 'A' and (index == 3 or index == 4):
+            match = flagPattern.match(line, position)
+        else:
+            match = numberPattern.match(line, position)
+        if match is None:
+            raise ValueError("invalid path data at position " + str(position) + ": " + line[position:position+20])
+        arguments.append(float(match.group(1)))
+        position = match.end()
+    return arguments, position
+
+def absoluteVertices(line, start=(0.0, 0.0)):
+    x, y = start
+    subpathX, subpathY = start
+    command = None
+    coordinates = list()
+    position = 0
+    while endPattern.match(line, position) is None:
+        match = commandPattern.match(line, position)
+        if not (match is None):
+            command = match.group(1)
+            position = match.end()
+        elif command is None or command in 'Zz':
+            raise ValueError("invalid path data at position " + str(position) + ": " + line[position:position+20])
+        upper = command.upper()
+        relative = command != upper
+        arguments, position = readArguments(line, position, upper)
+        if upper == 'Z':
+            x, y = subpathX, subpathY
+            continue
+        if upper == 'H':
+            x = x + arguments[0] if relative else arguments[0]
+        elif upper == 'V':
+            y = y + arguments[0] if relative else arguments[0]
+        elif relative:
+            x = x + arguments[-2]
+            y = y + arguments[-1]
+        else:
+            x = arguments[-2]
+            y = arguments[-1]
+        coordinates.append((x, y))
+        if upper == 'M':
+            subpathX, subpathY = x, y
+            # coordinate pairs after a moveto are implicit lineto commands
+            command = 'l' if relative else 'L'
+    return coordinates
+
+def absoluteCoordinates(line, start=(0.0, 0.0)):
+    # the vertices as an (N,2) array
+    import numpy as np
+    return np.array(absoluteVertices(line, start), dtype=np.float64).reshape(-1, 2)
+
 
 class Path:
-    
+
     def __init__(self,line):
         self.line=line
-        self.splitValues()
-        self.addImplicits()
-        self.simplify()
-
-    def splitValues(self):
-        self.commandElements=list()
-        lastChar='0'
-        currentCommand = ''
-        self.commandElements = re.split(r',|\s', self.line)
-            
-    def addImplicits(self):
-        index = 0
-        while index < len(self.commandElements):
-            command = self.commandElements[index]
-            if is_number(command):
-                self.commandElements.insert(index, implicitCommand)
-                command = implicitCommand
-            implicitCommand=command
-            if command == 'L' or command == 'l' :
-                index += 2
-            if command == 'M' or command == 'm' :
-                if command.isupper():
-                    implicitCommand = 'L'
-                else:
-                    implicitCommand = 'l'
-                index += 2
-            if command == 'C' or command == 'c' :
-                index += 6
-            if command == 'S' or command == 's' :
-                index += 4
-            if command == 'Q' or command == 'q' :
-                index += 4
-            if command == 'T' or command == 't' :
-                index += 2
-            if command == 'A' or command == 'a' :
-                index += 6
-            if command == 'Z' or command == 'z' :
-                index += 0
-            if command == 'H' or command == 'h' :
-                index += 1
-            if command == 'V' or command == 'v' :
-                index += 1
-            index += 1 #the command itself
-            
+        self.coordinates=None
 
-
-    def simplify(self):
-        index = 0
-        length = len(self.commandElements)
-        self.simpleCommandElements=list()
-        while index < length:
-            command = self.commandElements[index]
-            if command == 'H' or command == 'h' :
-                self.simpleCommandElements.append(command)
-                self.simpleCommandElements.append(self.commandElements[index+1])
-                index += 1
-            if command == 'V' or command == 'v' :
-                self.simpleCommandElements.append(command)
-                self.simpleCommandElements.append(self.commandElements[index+1])
-                index += 1
-            if command == 'L' or command == 'l' :
-                self.simpleCommandElements.append(command)
-                self.simpleCommandElements.append(self.commandElements[index+1])
-                self.simpleCommandElements.append(self.commandElements[index+2])
-                index += 2
-            if command == 'M' or command == 'm' :
-                self.simpleCommandElements.append(command)
-                self.simpleCommandElements.append(self.commandElements[index+1])
-                self.simpleCommandElements.append(self.commandElements[index+2])
-                index += 2
-            if command == 'C' or command == 'c' :
-                if command == 'C':
-                    self.simpleCommandElements.append('L')
-                else:
-                    self.simpleCommandElements.append('l')
-                self.simpleCommandElements.append(self.commandElements[index+5])
-                self.simpleCommandElements.append(self.commandElements[index+6])
-                index += 6
-            if command == 'S' or command == 's' :
-                if command == 'S':
-                    self.simpleCommandElements.append('L')
-                else:
-                    self.simpleCommandElements.append('l')
-                self.simpleCommandElements.append(self.commandElements[index+3])
-                self.simpleCommandElements.append(self.commandElements[index+4])
-                index += 4
-            if command == 'Q' or command == 'q' :
-                if command == 'Q':
-                    self.simpleCommandElements.append('L')
-                else:
-                    self.simpleCommandElements.append('l')
-                self.simpleCommandElements.append(self.commandElements[index+3])
-                self.simpleCommandElements.append(self.commandElements[index+4])
-                index += 4
-            if command == 'T' or command == 't' :
-                if command == 'T':
-                    self.simpleCommandElements.append('L')
-                else:
-                    self.simpleCommandElements.append('l')
-                self.simpleCommandElements.append(self.commandElements[index+1])
-                self.simpleCommandElements.append(self.commandElements[index+2])
-                index += 2
-            if command == 'A' or command == 'a' :
-                if command == 'A':
-                    self.simpleCommandElements.append('L')
-                else:
-                    self.simpleCommandElements.append('l')
-                self.simpleCommandElements.append(self.commandElements[index+5])
-                self.simpleCommandElements.append(self.commandElements[index+6])
-                index += 6
-            if command == 'Z' or command == 'z' :
-                self.simpleCommandElements.append(command)
-                index += 0
-            index += 1 #the command itself
-                        
     def commands(self):
-        print(self.commandElements)
-        print(self.simpleCommandElements)
+        print(self.line)
         return self
-        
+
     def makeSimpleAbsolute(self,lastCoord):
-        index = 0
-        length = len(self.simpleCommandElements)
-        while index < length:
-            command = self.simpleCommandElements[index]
-            if command == 'H':
-                lastCoord[0] = float(self.simpleCommandElements[index+1])
-# unchanged                lastCoord[1] 
-                index += 1
-            if command == 'V':
-                lastCoord[1] = float(self.simpleCommandElements[index+1])
-# unchanged                lastCoord[0] 
-                index += 1
-            if command == 'L':
-                lastCoord[0] = float(self.simpleCommandElements[index+1])
-                lastCoord[1] = float(self.simpleCommandElements[index+2])
-                index += 2
-            if command == 'M':
-                lastCoord[0] = float(self.simpleCommandElements[index+1])
-                lastCoord[1] = float(self.simpleCommandElements[index+2])
-                index += 2
-            if command == 'Z':
-                index += 0
-            if command == 'l' :
-                lastCoord[0] = lastCoord[0] + float(self.simpleCommandElements[index+1])
-                lastCoord[1] = lastCoord[1] + float(self.simpleCommandElements[index+2])
-                self.simpleCommandElements[index]='L'
-                self.simpleCommandElements[index+1]=str(lastCoord[0])
-                self.simpleCommandElements[index+2]=str(lastCoord[1])
-                index += 2
-            if command == 'm' :
-                lastCoord[0] = lastCoord[0] + float(self.simpleCommandElements[index+1])
-                lastCoord[1] = lastCoord[1] + float(self.simpleCommandElements[index+2])
-                self.simpleCommandElements[index]='M'
-                self.simpleCommandElements[index+1]=str(lastCoord[0])
-                self.simpleCommandElements[index+2]=str(lastCoord[1])
-                index += 2
-            if command == 'z' :
-                self.simpleCommandElements[index]='Z'
-                index += 0
-            index += 1 #the command itself
+        self.coordinates = absoluteVertices(self.line, (lastCoord[0], lastCoord[1]))
         return self
-        
-    def getAbsCoordinates(self):
-        result = list()
-        index = 0
-        length = len(self.simpleCommandElements)
-        while index < length:
-            command = self.simpleCommandElements[index]
-            if command == 'L':
-                point = [float(self.simpleCommandElements[index+1]),float(self.simpleCommandElements[index+2])]
-                result.append(point);
-                index += 2
-            if command == 'M':
-                point = [float(self.simpleCommandElements[index+1]),float(self.simpleCommandElements[index+2])]
-                result.append(point);
-                index += 2
-            if command == 'Z':
-                index += 0
-            index += 1 #the command itself
-        return result
-        
-
-
-
-
 
+    def getAbsCoordinates(self):
+        if self.coordinates is None:
+            self.makeSimpleAbsolute([0.0, 0.0])
+        return [list(vertex) for vertex in self.coordinates]
@@ -1,7 +1,8 @@
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import re
+import contextlib
 from . import cellmodel
+from . import leafwriter
 from . import path
 from math import sqrt
 import argparse
@@ -24,23 +25,31 @@ def getStrokeFromStyle(style):
     style = re.split(';|:', style)
     return style[style.index('stroke')+1]
 
+def getStroke(node):
+    # drawings from other editors than inkscape may use a stroke attribute instead of a style
+    if not ('style' in node.attrib) and 'stroke' in node.attrib:
+        return node.attrib['stroke']
+    return getStrokeFromStyle(node.attrib['style'])
+
 def getCoordsFromPath(d):
     return  re.split('m |M | z| Z| ', d)
 
 
-def readNodesFromPath(mesh,node,curr):
+def readNodesFromPath(mesh,node,curr,transform=None):
     mcell=mesh.getCell()
-    mcell.setType(getStrokeFromStyle(node.attrib['style']))
+    mcell.setType(getStroke(node))
     d = node.attrib['d']
-    reset=[curr[0],curr[1]]
-    coordiv = path.Path(d).makeSimpleAbsolute(curr).getAbsCoordinates();
+    vertices = path.absoluteVertices(d, curr)
+    if transform is None:
+        coordiv = [[x*mesh.pixelScale, y*mesh.pixelScale] for x, y in vertices]
+    else:
+        from . import svgtransform
+        coordiv = (svgtransform.applyTransform(transform, vertices)*mesh.pixelScale).tolist()
     for coord in coordiv:
         # check if we already circular then we stop
-        if mcell.addNode(coord[0]*mesh.pixelScale,coord[1]*mesh.pixelScale):
+        if mcell.addNode(coord[0],coord[1]):
             break
     mcell.addClosingWall()
-    curr[0]=reset[0]
-    curr[1]=reset[1]
 
 
 def readNodesFromSvg(svgFileName, mesh):
@@ -56,36 +65,108 @@ def readNodesFromSvg(svgFileName, mesh):
         for y in x.findall('svg:path',namespaces):
             readNodesFromPath(mesh,y,curr)
 
+# Streaming reader: the svg is read with iterparse, the paths are taken at
+# any depth, with the transforms of their groups and their own transform
+# applied. Every element is dropped as soon as it is complete, so embedded
+# images or other content do not stay in memory.
+# The cells are numbered in the order of readNodesFromSvg: the paths directly
+# under the svg element first, then all other paths in document order. Those
+# are kept until the end as attribute copies, without children or text.
+
+svgNamespace = '{'+namespaces['svg']+'}'
+
+# elements whose content is not drawn as it is
+hiddenElements = {svgNamespace+name for name in ('defs', 'clipPath', 'mask', 'pattern', 'symbol', 'marker', 'metadata')}
+
+def streamNodesFromSvg(svgFileName, mesh):
+    from . import svgtransform
+    curr = [0.0, 0.0]
+    elements = list()
+    transforms = list()
+    hidden = 0
+    grouped = list()
+    for event, element in ET.iterparse(svgFileName+'.svg', events=('start', 'end')):
+        if event == 'start':
+            if len(elements) == 0:
+                viewBox = element.get("viewBox","0 0 100 100").split(' ');
+                mesh.setScale(((float(viewBox[2]) - float(viewBox[0])) / 120 + (float(viewBox[3]) - float(viewBox[1])) / 120)/2.)
+                transforms.append(svgtransform.parseTransform(None))
+            else:
+                transforms.append(transforms[-1] @ svgtransform.parseTransform(element.get('transform')))
+            if element.tag in hiddenElements:
+                hidden += 1
+            elements.append(element)
+            continue
+        elements.pop()
+        transform = transforms.pop()
+        if element.tag in hiddenElements:
+            hidden -= 1
+        elif element.tag == svgNamespace+'path' and hidden == 0:
+            if len(elements) == 1:
+                readNodesFromPath(mesh,element,curr,transform)
+            else:
+                grouped.append((ET.Element(element.tag, dict(element.attrib)), transform))
+        if len(elements) > 0:
+            # the parent only ever holds the element that is currently read
+            elements[-1].remove(element)
+    for element, transform in grouped:
+        readNodesFromPath(mesh,element,curr,transform)
+
 #template = '/home/ritchie/Desktop/leaf.blob.xml'
 #svgFileName= '/home/ritchie/Desktop/gall_temp/root_draw_plain'
 #svgFileName= '/home/ritchie/Desktop/test'
 
-def convertSVG(svgFileName,template,scaleFactor,colormap):
-    mesh = cellmodel.Mesh()
+def convertSVG(svgFileName,template,scaleFactor,colormap,compact=False,cache=None,profile=False,stream=False):
+    if not (cache is None):
+        # hashlib and shutil are only loaded when the cache is used
+        from . import cache as conversioncache
+        key = conversioncache.cacheKey(svgFileName, template, scaleFactor, colormap, stream, compact)
+        # a profile has to run all stages
+        if not profile and cache.lookup(key, svgFileName+'.xml'):
+            print ("virtual-leaf-file = "+svgFileName+'.xml'+" (cached)", end='\n')
+            return
+    if compact:
+        # numpy based, only loaded when it is used
+        from . import compactmesh
+        mesh = compactmesh.CompactMesh()
+    else:
+        mesh = cellmodel.Mesh()
     if not (scaleFactor is None):
         mesh.pixelScale = float(scaleFactor)
     if not (colormap is None):
         mesh.setColormap(colormap)
-    readNodesFromSvg(svgFileName, mesh)
-    mesh.reduceParallelWalls()
-    mesh.defineInnerCells()
-    mesh.defineCellWalls()
-    tree = mesh.toXml()
-    templateTree=ET.parse(template).getroot()
-    for node in templateTree:
-        for newNode in tree:
-            if node.tag == newNode.tag:
-                node.clear()
-                node.attrib = newNode.attrib
-                for child in newNode:
-                    node.append(child)
-    pretty=minidom.parseString(ET.tostring(templateTree, encoding='utf8', method='xml')).toprettyxml(indent = "   ")
-    with open(svgFileName+'.xml', "w") as f:
-        f.write(pretty)
+    if profile:
+        # tracemalloc is only loaded for a profile
+        from . import profiling
+        profiler = profiling.StageProfiler(mesh)
+        profiler.start()
+        stage = profiler.stage
+    else:
+        stage = lambda name: contextlib.nullcontext()
+    try:
+        with stage("readNodesFromSvg"):
+            if stream:
+                streamNodesFromSvg(svgFileName, mesh)
+            else:
+                readNodesFromSvg(svgFileName, mesh)
+        with stage("reduceParallelWalls"):
+            mesh.reduceParallelWalls()
+        with stage("defineInnerCells"):
+            mesh.defineInnerCells()
+        with stage("defineCellWalls"):
+            mesh.defineCellWalls()
+        sections = mesh.xmlSections()
+        if profile:
+            sections = profiler.wrapSections(sections)
+        with stage("writeLeaf"):
+            leafwriter.writeLeaf(svgFileName+'.xml', template, sections)
+    finally:
+        if profile:
+            profiler.stop()
+            profiler.writeJson(svgFileName+'.profile.json')
+            print (profiler.summary(), end='\n')
+            print ("profile = "+svgFileName+'.profile.json', end='\n')
+    if not (cache is None):
+        cache.store(key, svgFileName+'.xml')
     print ("virtual-leaf-file = "+svgFileName+'.xml', end='\n')
-
-
-
-
-
-
+    return mesh
@@ -5,9 +5,14 @@ Comprehensive objectification of the VirtualLeaf tissue XML format
 Author: Rami Ardati · 2025-05-09
 """
 from __future__ import annotations
+import copy
+import os
+import re
+from functools import cached_property
 from dataclasses import dataclass, field
-from typing import List, Dict, Union, Optional, Any
+from typing import List, Dict, Union, Optional, Any, Tuple, Sequence
 
+import numpy as np
 from lxml import etree, objectify
 
 
@@ -29,6 +34,136 @@ def _to_bool(s: str | None, default: bool = False) -> bool:
         return default
     return s.lower() in ("true", "1", "yes")
 
+
+def _new_element(parent, tag: str, **attrib: str):
+    """
+    A new element for *parent*'s tree: an objectify element (with its
+    ``py:pytype`` annotation) in objectified trees, a plain one otherwise.
+    """
+    if isinstance(parent, objectify.ObjectifiedElement):
+        return objectify.Element(tag, **attrib)
+    return parent.makeelement(tag, attrib)
+
+
+def _append_child(parent, elem) -> None:
+    """Append *elem* to *parent* with the indentation of its siblings."""
+    children = list(parent)
+    if children:
+        elem.tail = children[-1].tail
+        children[-1].tail = children[-2].tail if len(children) > 1 else parent.text
+    parent.append(elem)
+
+
+def _index(entries: List[Any], key: str, section: str) -> Dict[Any, Any]:
+    """Hash index of *entries* by their attribute *key*; duplicates raise."""
+    index: Dict[Any, Any] = {}
+    for entry in entries:
+        k = getattr(entry, key)
+        if k in index:
+            raise ValueError(f"duplicate {key} {k!r} in <{section}>")
+        index[k] = entry
+    return index
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ring helpers (remeshing, array write-back)
+# ─────────────────────────────────────────────────────────────────────────────
+def _ring_pieces(rings: List[List[int]], protected: np.ndarray
+                 ) -> Tuple[List[List[int]], List[Optional[List[Tuple[int, bool]]]]]:
+    """
+    Split every ring at its protected nodes into *chains* (node runs from one
+    protected node to the next).  A chain shared by two rings is stored once;
+    each ring becomes a list of ``(chain, reversed)`` pieces (``None`` for
+    degenerate rings of less than three nodes).
+    """
+    chains: List[List[int]] = []
+    first_edge: Dict[Tuple[int, int], Tuple[int, bool]] = {}
+    ring_pieces: List[Optional[List[Tuple[int, bool]]]] = []
+    for ring in rings:
+        if len(ring) < 3:                                   # left as it is
+            ring_pieces.append(None)
+            continue
+        stops = [i for i, n in enumerate(ring) if protected[n]]
+        pieces: List[Tuple[int, bool]] = []
+        for k, i in enumerate(stops):
+            j = stops[(k + 1) % len(stops)]
+            piece = ring[i:j + 1] if j > i else ring[i:] + ring[:j + 1]
+            if (piece[0], piece[1]) in first_edge:
+                pieces.append(first_edge[(piece[0], piece[1])])
+                continue
+            chain = len(chains)
+            chains.append(piece)
+            first_edge[(piece[0], piece[1])] = (chain, False)
+            first_edge[(piece[-1], piece[-2])] = (chain, True)
+            pieces.append((chain, False))
+        ring_pieces.append(pieces)
+    return chains, ring_pieces
+
+
+def _wall_length(ring: List[int], n1: int, n2: int, other: int,
+                 edge_owners: Dict[Tuple[int, int], set], coords: np.ndarray
+                 ) -> Optional[float]:
+    """
+    Length of the wall from *n1* to *n2* along *ring*, following the ring
+    edges that are also edges of the cell *other* (-1: the boundary).
+    """
+    if n1 not in ring:
+        return None
+    i, m = ring.index(n1), len(ring)
+    for step in (1, -1):
+        total, k = 0.0, i
+        while True:
+            u, v = ring[k], ring[(k + step) % m]
+            if other not in edge_owners.get((min(u, v), max(u, v)), ()):
+                break
+            total += float(np.hypot(*(coords[v] - coords[u])))
+            k = (k + step) % m
+            if v == n2:
+                return total
+            if k == i:
+                break
+    return None
+
+
+def _polygon_area(xy: np.ndarray) -> float:
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)))
+
+
+def _set_ring(owner, ring: Sequence[int]) -> None:
+    """Replace the ``<node n=…/>`` children of a cell (or boundary polygon)."""
+    old = owner.xpath("./node[@n]")
+    if not old:
+        return
+    position = owner.index(old[0])
+    tails = (old[0].tail, old[-1].tail)
+    for elem in old:
+        owner.remove(elem)
+    for k, n in enumerate(ring):
+        elem = owner.makeelement("node", n=str(n))
+        elem.tail = tails[0] if k < len(ring) - 1 else tails[1]
+        owner.insert(position + k, elem)
+
+
+def _column(values: List[str]) -> np.ndarray:
+    """Typed column of attribute strings: int64, float64, bool or object."""
+    for dtype in (np.int64, np.float64):
+        try:
+            return np.array(values, dtype=dtype)
+        except (ValueError, OverflowError):
+            pass
+    if all(v.lower() in ("true", "false") for v in values):
+        return np.array([v.lower() == "true" for v in values], dtype=bool)
+    return np.array(values, dtype=object)
+
+
+def _attr_str(value) -> str:
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, (float, np.floating)):
+        return str(float(value))
+    return str(value)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 0)  Leaf section
 # ─────────────────────────────────────────────────────────────────────────────
@@ -93,9 +228,16 @@ class ParameterSection:
         >>> len(doc.parameter)           # number of parameters
         >>> for p in doc.parameter: ...  # iterate over Parameter objects
         >>> doc.parameter.names()        # list the parameter names
+        >>> doc.parameter["maxt"]        # value by name (KeyError if absent)
+        >>> doc.parameter["maxt"] = 500  # set or create
+        >>> "maxt" in doc.parameter
+
+    Lookups go through a name → :class:`Parameter` index that every setter
+    keeps in sync; duplicate names in the file raise :class:`ValueError`.
     """
     elem: objectify.ObjectifiedElement = field(repr=False)
     parameters: List[Parameter] = field(init=False)
+    by_name: Dict[str, Parameter] = field(init=False, repr=False)
 
     # ─── Construction ────────────────────────────────────────────────────
     def __post_init__(self):
@@ -110,6 +252,7 @@ class ParameterSection:
                     vals = [float(tok) for tok in text[0].split()] if text else []
                 val = vals
             self.parameters.append(Parameter(par.attrib.get("name", ""), val, par))
+        self.by_name = _index(self.parameters, "name", "parameter")
 
     # ─── Python-container conveniences ───────────────────────────────────
     def __len__(self) -> int:
@@ -129,49 +272,68 @@ class ParameterSection:
         """
         return [p.name for p in self.parameters]
 
-    # (existing get_*/set_* helpers stay unchanged below)
-    # ──────────────────────────────────────────────────────────────────────
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def __getitem__(self, name: str) -> Union[int, float, str, List[float]]:
+        """Value of a scalar or array parameter; :class:`KeyError` if absent."""
+        return self.by_name[name].value
+
+    def __setitem__(self, name: str, value) -> None:
+        """Set (or create) a scalar parameter, or an array one for lists."""
+        if isinstance(value, (list, tuple)):
+            self.set_parameter_array(name, list(value))
+        else:
+            self.set_parameter(name, value)
+
+    # ─── get_*/set_* helpers ─────────────────────────────────────────────
     def get_parameter(self, name: str) -> Optional[Union[int, float, str]]:
-        for p in self.parameters:
-            if p.name == name and not isinstance(p.value, list):
-                return p.value
+        p = self.by_name.get(name)
+        if p is not None and not isinstance(p.value, list):
+            return p.value
         return None
 
     def set_parameter(self, name: str, value: Union[int, float, str]) -> None:
-        for p in self.parameters:
-            if p.name == name and not isinstance(p.value, list):
-                p.value = value
-                p.elem.attrib["val"] = str(value)
-                return
+        p = self.by_name.get(name)
+        if p is not None:
+            if isinstance(p.value, list):
+                raise TypeError(f"parameter {name!r} is an array, use set_parameter_array")
+            p.value = value
+            p.elem.attrib["val"] = str(value)
+            return
         # create new
-        new_par = objectify.Element("par", name=name, val=str(value))
-        self.elem.append(new_par)
+        new_par = _new_element(self.elem, "par", name=name, val=str(value))
+        _append_child(self.elem, new_par)
         self.parameters.append(Parameter(name, value, new_par))
+        self.by_name[name] = self.parameters[-1]
 
     def get_parameter_array(self, name: str) -> Optional[List[float]]:
-        for p in self.parameters:
-            if p.name == name and isinstance(p.value, list):
-                return p.value
+        p = self.by_name.get(name)
+        if p is not None and isinstance(p.value, list):
+            return p.value
         return None
 
     def set_parameter_array(self, name: str, values: List[float]) -> None:
-        for p in self.parameters:
-            if p.name == name and isinstance(p.value, list):
-                p.value[:] = values
-                # rebuild child list
-                va = p.elem.xpath("./valarray")
-                va_elem = va[0] if va else objectify.SubElement(p.elem, "valarray")
-                va_elem.clear()
-                for v in values:
-                    objectify.SubElement(va_elem, "val", v=f"{v:.6g}")
-                return
+        p = self.by_name.get(name)
+        if p is not None:
+            if not isinstance(p.value, list):
+                raise TypeError(f"parameter {name!r} is a scalar, use set_parameter")
+            p.value[:] = values
+            # rebuild child list
+            va = p.elem.xpath("./valarray")
+            va_elem = va[0] if va else objectify.SubElement(p.elem, "valarray")
+            va_elem.clear()
+            for v in values:
+                objectify.SubElement(va_elem, "val", v=f"{v:.6g}")
+            return
         # create new
-        par_elem = objectify.Element("par", name=name)
+        par_elem = _new_element(self.elem, "par", name=name)
         va_elem = objectify.SubElement(par_elem, "valarray")
         for v in values:
             objectify.SubElement(va_elem, "val", v=f"{v:.6g}")
-        self.elem.append(par_elem)
+        _append_child(self.elem, par_elem)
         self.parameters.append(Parameter(name, values, par_elem))
+        self.by_name[name] = self.parameters[-1]
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -190,13 +352,19 @@ class Node:
 
 @dataclass
 class NodeSection:
+    """
+    The ``<nodes>`` block; ``doc.nodes[nr]`` looks a node up by its number
+    through an nr → :class:`Node` index.  Nodes without an ``nr`` attribute
+    (as VirtualLeaf writes them) are numbered by their position.
+    """
     elem: objectify.ObjectifiedElement = field(repr=False)
     nodes: List[Node] = field(init=False)
+    by_nr: Dict[int, Node] = field(init=False, repr=False)
 
     def __post_init__(self):
         self.nodes = [
             Node(
-                nr=int(n.attrib.get("nr", 0)),
+                nr=int(n.attrib.get("nr", i)),
                 x=float(n.attrib["x"]),
                 y=float(n.attrib["y"]),
                 sam=_to_bool(n.attrib.get("sam")),
@@ -204,11 +372,21 @@ class NodeSection:
                 fixed=_to_bool(n.attrib.get("fixed")),
                 elem=n,
             )
-            for n in self.elem.xpath("./node")
+            for i, n in enumerate(self.elem.xpath("./node"))
         ]
+        self.by_nr = _index(self.nodes, "nr", "nodes")
 
     def get_by_nr(self, nr: int) -> Optional[Node]:
-        return next((n for n in self.nodes if n.nr == nr), None)
+        return self.by_nr.get(nr)
+
+    def __getitem__(self, nr: int) -> Node:
+        return self.by_nr[nr]
+
+    def __contains__(self, nr: int) -> bool:
+        return nr in self.by_nr
+
+    def __iter__(self):
+        return iter(self.nodes)
 
     def __len__(self) -> int:
         return len(self.nodes)
@@ -306,39 +484,208 @@ class Setting:
 
 @dataclass
 class SettingsSection:
+    """
+    The ``<settings>`` block, with mapping access (``doc.settings["show_nodes"]``)
+    through a name → :class:`Setting` index; duplicate names raise
+    :class:`ValueError`.
+    """
     elem: objectify.ObjectifiedElement = field(repr=False)
     settings: List[Setting] = field(init=False)
+    by_name: Dict[str, Setting] = field(init=False, repr=False)
 
     def __post_init__(self):
         self.settings = [
             Setting(k.attrib["name"], _to_float_if_num(k.attrib["val"]), k)
             for k in self.elem.xpath("./setting")
         ]
+        self.by_name = _index(self.settings, "name", "settings")
+
+    def __len__(self) -> int:
+        return len(self.settings)
+
+    def __iter__(self):
+        return iter(self.settings)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def __getitem__(self, name: str) -> Union[str, int, float]:
+        return self.by_name[name].value
+
+    def __setitem__(self, name: str, value: Union[str, int, float]) -> None:
+        self.set_setting(name, value)
 
     def get_setting(self, name: str) -> Optional[Union[str, int, float]]:
         """Get a setting value by its name."""
-        for s in self.settings:
-            if s.name == name:
-                return s.value
-        return None
+        s = self.by_name.get(name)
+        return None if s is None else s.value
 
     def set_setting(self, name: str, value: Union[str, int, float]) -> None:
         """Set a setting value by name, or create if it doesn't exist."""
         # Try to find existing setting
-        for s in self.settings:
-            if s.name == name:
-                s.value = value
-                s.elem.attrib["val"] = str(value)
-                return
+        s = self.by_name.get(name)
+        if s is not None:
+            s.value = value
+            s.elem.attrib["val"] = str(value)
+            return
 
         # Create new setting if not found
-        new_elem = objectify.Element("setting", name=name, val=str(value))
-        self.elem.append(new_elem)
+        new_elem = _new_element(self.elem, "setting", name=name, val=str(value))
+        _append_child(self.elem, new_elem)
         self.settings.append(Setting(name, value, new_elem))
+        self.by_name[name] = self.settings[-1]
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# 6)  High-level façade
+# 6)  Array views
+# ─────────────────────────────────────────────────────────────────────────────
+@dataclass
+class TissueArrays:
+    """
+    NumPy view of the tissue, read in one pass over the node, cell and wall
+    elements (no dataclass per element):
+
+    ``coords`` (N, 2) float64, ``sam``/``boundary``/``fixed`` (N,) bool,
+    the cell rings in CSR form (``ring_nodes[ring_offsets[k]:ring_offsets[k+1]]``
+    are the nodes of cell *k*), ``cell_table`` (attribute name → one typed
+    column per cell typed from the file, for the attributes every cell has;
+    assign a float array to store fractions in an integer column), and per wall
+    ``wall_nodes`` (n1, n2), ``wall_cells`` (c1, c2) and ``wall_length``.
+
+    Modify the arrays in place (or assign arrays of the same shape) and call
+    :meth:`write_back`; only the elements whose values changed are touched.
+    """
+    coords: np.ndarray
+    sam: np.ndarray
+    boundary: np.ndarray
+    fixed: np.ndarray
+    ring_offsets: np.ndarray
+    ring_nodes: np.ndarray
+    cell_table: Dict[str, np.ndarray]
+    wall_nodes: np.ndarray
+    wall_cells: np.ndarray
+    wall_length: np.ndarray
+    node_elems: List[Any] = field(repr=False)
+    cell_elems: List[Any] = field(repr=False)
+    wall_elems: List[Any] = field(repr=False)
+    _original: Dict[str, Any] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._original = self._snapshot()
+
+    @classmethod
+    def from_root(cls, root) -> "TissueArrays":
+        node_elems = list(root.find("nodes").iterchildren("node"))
+        xy, flags = [], []
+        for n in node_elems:
+            a = n.attrib
+            xy.append((a["x"], a["y"]))
+            flags.append((a.get("sam", "false").lower() == "true",
+                          a.get("boundary", "false").lower() == "true",
+                          a.get("fixed", "false").lower() == "true"))
+        flags = np.array(flags, dtype=bool).reshape(-1, 3)
+
+        cell_elems = list(root.find("cells").iterchildren("cell"))
+        sizes, ring, attribs = [], [], []
+        for c in cell_elems:
+            nodes = c.xpath("./node/@n")
+            sizes.append(len(nodes))
+            ring.extend(nodes)
+            attribs.append(c.attrib)
+        names = [k for k in attribs[0].keys() if all(k in a for a in attribs)] if attribs else []
+        table = {k: _column([a[k] for a in attribs]) for k in names}
+
+        walls = root.find("walls")
+        wall_elems = list(walls.iterchildren("wall")) if walls is not None else []
+        ends, pairs, lengths = [], [], []
+        for w in wall_elems:
+            a = w.attrib
+            ends.append((a["n1"], a["n2"]))
+            pairs.append((a["c1"], a["c2"]))
+            lengths.append(a.get("length", "nan"))
+
+        return cls(
+            coords=np.array(xy, dtype=np.float64).reshape(-1, 2),
+            sam=flags[:, 0].copy(), boundary=flags[:, 1].copy(), fixed=flags[:, 2].copy(),
+            ring_offsets=np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64),
+            ring_nodes=np.array(ring, dtype=np.int64),
+            cell_table=table,
+            wall_nodes=np.array(ends, dtype=np.int64).reshape(-1, 2),
+            wall_cells=np.array(pairs, dtype=np.int64).reshape(-1, 2),
+            wall_length=np.array(lengths, dtype=np.float64),
+            node_elems=node_elems, cell_elems=cell_elems, wall_elems=wall_elems,
+        )
+
+    def _snapshot(self) -> Dict[str, Any]:
+        names = ("coords", "sam", "boundary", "fixed", "ring_offsets", "ring_nodes",
+                 "wall_nodes", "wall_cells", "wall_length")
+        original = {name: getattr(self, name).copy() for name in names}
+        original["cell_table"] = {k: v.copy() for k, v in self.cell_table.items()}
+        return original
+
+    def ring(self, k: int) -> np.ndarray:
+        """Node indices of cell *k*."""
+        return self.ring_nodes[self.ring_offsets[k]:self.ring_offsets[k + 1]]
+
+    def write_back(self) -> int:
+        """
+        Apply the changed array entries to the XML elements; returns the
+        number of elements written.  Array shapes (node, cell and wall counts)
+        must not change, cell rings may change length through the CSR arrays.
+        """
+        o = self._original
+        for name in ("coords", "sam", "boundary", "fixed", "wall_nodes", "wall_cells", "wall_length"):
+            if getattr(self, name).shape != o[name].shape:
+                raise ValueError(f"{name} changed shape {o[name].shape} -> {getattr(self, name).shape}")
+        if len(self.ring_offsets) != len(o["ring_offsets"]):
+            raise ValueError("the number of cell rings changed")
+        touched = set()
+
+        # nodes
+        moved = np.flatnonzero((self.coords != o["coords"]).any(axis=1))
+        for i in moved:
+            a = self.node_elems[i].attrib
+            a["x"], a["y"] = _attr_str(self.coords[i, 0]), _attr_str(self.coords[i, 1])
+        touched.update(("node", int(i)) for i in moved)
+        for name in ("sam", "boundary", "fixed"):
+            changed = np.flatnonzero(getattr(self, name) != o[name])
+            for i in changed:
+                self.node_elems[i].attrib[name] = _attr_str(getattr(self, name)[i])
+            touched.update(("node", int(i)) for i in changed)
+
+        # cells: rings and attribute columns
+        old_rings = np.split(o["ring_nodes"], o["ring_offsets"][1:-1])
+        for k, elem in enumerate(self.cell_elems):
+            ring = self.ring(k)
+            if not np.array_equal(ring, old_rings[k]):
+                _set_ring(elem, ring.tolist())
+                touched.add(("cell", k))
+        for name, column in self.cell_table.items():
+            original = o["cell_table"].get(name)
+            changed = range(len(column)) if original is None or original.shape != column.shape \
+                else np.flatnonzero(column != original)
+            for k in changed:
+                self.cell_elems[k].attrib[name] = _attr_str(column[k])
+                touched.add(("cell", int(k)))
+
+        # walls
+        for name, keys in (("wall_nodes", ("n1", "n2")), ("wall_cells", ("c1", "c2"))):
+            changed = np.flatnonzero((getattr(self, name) != o[name]).any(axis=1))
+            for i in changed:
+                a = self.wall_elems[i].attrib
+                a[keys[0]], a[keys[1]] = (_attr_str(v) for v in getattr(self, name)[i].tolist())
+            touched.update(("wall", int(i)) for i in changed)
+        changed = np.flatnonzero((self.wall_length != o["wall_length"]) & ~np.isnan(self.wall_length))
+        for i in changed:
+            self.wall_elems[i].attrib["length"] = _attr_str(self.wall_length[i])
+        touched.update(("wall", int(i)) for i in changed)
+
+        self._original = self._snapshot()
+        return len(touched)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 7)  High-level façade
 # ─────────────────────────────────────────────────────────────────────────────
 class VirtualLeaf_XML:
     """
@@ -349,22 +696,247 @@ class VirtualLeaf_XML:
         .cells      – CellSection
         .walls      – WallSection
         .settings   – SettingsSection
+        .arrays     – TissueArrays (NumPy view, see :meth:`write_arrays`)
+
+    A section is built on first access and cached, so a script that only
+    edits parameters never wraps the nodes, cells and walls.  With
+    ``objectified=False`` the file is parsed with plain :mod:`lxml.etree`:
+    no objectify element classes, and new elements carry no ``py:pytype``
+    annotation (nothing to ``deannotate`` before saving).
     """
-    def __init__(self, path: str):
+    def __init__(self, path: str, objectified: bool = True):
         self.path = path
-        parser = objectify.makeparser(remove_blank_text=False)
-        self.tree = objectify.parse(path, parser)
+        if objectified:
+            parser = objectify.makeparser(remove_blank_text=False)
+            self.tree = objectify.parse(path, parser)
+        else:
+            self.tree = etree.parse(path, etree.XMLParser(remove_blank_text=False))
         self.root = self.tree.getroot()
 
         # Wrap the <leaf> element (the document root)
         self.leaf      = LeafSection(self.root)
 
-        # Existing sections
-        self.parameter = ParameterSection(self.root.find("parameter"))
-        self.nodes     = NodeSection(self.root.find("nodes"))
-        self.cells     = CellSection(self.root.find("cells"))
-        self.walls     = WallSection(self.root.find("walls"))
-        self.settings  = SettingsSection(self.root.find("settings"))
+    # ─── Sections, built on first access ─────────────────────────────────
+    @cached_property
+    def parameter(self) -> ParameterSection:
+        return ParameterSection(self.root.find("parameter"))
+
+    @cached_property
+    def nodes(self) -> NodeSection:
+        return NodeSection(self.root.find("nodes"))
+
+    @cached_property
+    def cells(self) -> CellSection:
+        return CellSection(self.root.find("cells"))
+
+    @cached_property
+    def walls(self) -> WallSection:
+        return WallSection(self.root.find("walls"))
+
+    @cached_property
+    def settings(self) -> SettingsSection:
+        return SettingsSection(self.root.find("settings"))
+
+    @cached_property
+    def arrays(self) -> TissueArrays:
+        return TissueArrays.from_root(self.root)
+
+    def write_arrays(self) -> int:
+        """
+        Write the modified :attr:`arrays` back to the tree (see
+        :meth:`TissueArrays.write_back`); the node, cell and wall sections
+        are rebuilt on their next access.  Returns the number of elements
+        written.
+        """
+        if "arrays" not in self.__dict__:
+            return 0
+        written = self.arrays.write_back()
+        if written:
+            for name in ("nodes", "cells", "walls"):
+                self.__dict__.pop(name, None)
+        return written
+
+    # ─── Remeshing ───────────────────────────────────────────────────────
+    def remesh(self, target_length: Optional[float] = None) -> None:
+        """
+        Split and merge wall segments toward *target_length*.
+
+        *target_length* defaults to the ``target_length`` attribute of
+        ``<nodes>`` (the node spacing VirtualLeaf itself uses) and falls back
+        to the ``target_length`` parameter.
+
+        Junctions (nodes with more than two neighbours), wall end points and
+        fixed or SAM nodes are kept.  Every run of nodes between them is
+        resampled once, so neighbouring cells keep sharing their nodes: the
+        run gets ``round(length / target_length)`` segments of equal length
+        along the old polyline, and an old node close to a new position is
+        reused instead of a new one.  ``<nodes>``, the cell rings,
+        ``boundary_polygon``, the wall end points and lengths and the cell
+        areas are rewritten, the node, cell and wall sections are rebuilt.
+        """
+        if target_length is None:
+            target_length = self.nodes.elem.attrib.get("target_length")
+        if target_length is None:
+            target_length = self.parameter.get_parameter("target_length")
+        if target_length is None or float(target_length) <= 0:
+            raise ValueError("remesh needs a positive target_length")
+        target_length = float(target_length)
+
+        node_elems = list(self.nodes.elem.xpath("./node"))
+        n_old = len(node_elems)
+        coords = np.array([(n.x, n.y) for n in self.nodes.nodes], dtype=float).reshape(-1, 2)
+        sam = np.array([n.sam for n in self.nodes.nodes], dtype=bool)
+        fixed = np.array([n.fixed for n in self.nodes.nodes], dtype=bool)
+        boundary = np.array([n.boundary for n in self.nodes.nodes], dtype=bool)
+
+        # rings of the cells and of the boundary polygon (label -1)
+        owners = [c.elem for c in self.cells.cells]
+        labels = [int(c.elem.attrib.get("index", c.id)) for c in self.cells.cells]
+        rings = [list(c.vertices) for c in self.cells.cells]
+        poly = self.cells.elem.find("boundary_polygon")
+        if poly is not None:
+            owners.append(poly)
+            labels.append(-1)
+            rings.append([int(v.attrib["n"]) for v in poly.xpath("./node[@n]")])
+        wall_elems = list(self.walls.elem.xpath("./wall"))
+
+        # ─── protected nodes ─────────────────────────────────────────────
+        a = np.concatenate([np.asarray(r, dtype=int) for r in rings] + [np.zeros(0, int)])
+        b = np.concatenate([np.roll(np.asarray(r, dtype=int), -1) for r in rings] + [np.zeros(0, int)])
+        edges = np.unique(np.sort(np.stack([a, b], axis=1), axis=1), axis=0)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        degree = np.bincount(edges.ravel(), minlength=n_old)
+        protected = (degree != 2) | sam | fixed
+        for w in wall_elems:
+            protected[int(w.attrib["n1"])] = True
+            protected[int(w.attrib["n2"])] = True
+        for ring in rings:
+            if len(ring) < 3:
+                protected[ring] = True
+            elif not protected[ring].any():                  # a closed loop
+                protected[min(ring)] = True
+
+        chains, ring_pieces = _ring_pieces(rings, protected)
+
+        # ─── resample all chains at once ─────────────────────────────────
+        sizes = np.array([len(c) for c in chains], dtype=int)
+        flat = np.concatenate([np.asarray(c, dtype=int) for c in chains] + [np.zeros(0, int)])
+        start = np.cumsum(sizes) - sizes
+        end = start + sizes - 1
+        xy = coords[flat]
+        seg = np.hypot(*(xy[1:] - xy[:-1]).T)
+        seg[end[:-1]] = 0.0                                  # no step between chains
+        s = np.concatenate([[0.0], np.cumsum(seg)])
+        length = s[end] - s[start]
+
+        count = np.maximum(1, np.rint(length / target_length)).astype(int)
+        loop = flat[start] == flat[end]
+        count[loop] = np.maximum(count[loop], 3)
+        # two chains between the same nodes must not collapse onto one edge
+        ends = np.sort(np.stack([flat[start], flat[end]], axis=1), axis=1)
+        _, inverse, multiplicity = np.unique(ends, axis=0, return_inverse=True, return_counts=True)
+        twins = (multiplicity[inverse.ravel()] > 1) & ~loop
+        count[twins] = np.maximum(count[twins], 2)
+        for pieces in ring_pieces:
+            while pieces and sum(count[c] for c, _ in pieces) < 3:
+                count[max(pieces, key=lambda p: length[p[0]])[0]] += 1
+
+        inner = count - 1
+        chain_of = np.repeat(np.arange(len(chains)), inner)
+        j = np.arange(int(inner.sum())) - np.repeat(np.cumsum(inner) - inner, inner) + 1
+        step = length / count
+        station = s[start][chain_of] + j * step[chain_of]
+        right = np.clip(np.searchsorted(s, station), 1, max(len(s) - 1, 1))
+        left = right - 1
+        nearest = np.where(station - s[left] <= s[right] - station, left, right)
+        reuse = (np.abs(s[nearest] - station) < step[chain_of] / 3) & (length[chain_of] > 0)
+        along = lambda v: np.interp(station, s, v) if len(s) > 1 else np.zeros(len(station))
+        placed = np.stack([along(xy[:, 0]), along(xy[:, 1])], axis=1)
+        placed = np.where((length[chain_of] > 0)[:, None], placed, xy[start][chain_of])
+        fresh = ~reuse
+        ids = np.where(reuse, flat[nearest], n_old + np.cumsum(fresh) - 1)
+
+        keep = protected.copy()
+        keep[flat[nearest[reuse]]] = True
+        renumber = np.concatenate([np.cumsum(keep) - 1,
+                                   np.count_nonzero(keep) + np.arange(np.count_nonzero(fresh))])
+        new_coords = np.concatenate([coords[keep], placed[fresh]])
+
+        offsets = np.cumsum(inner) - inner
+        new_chains = [
+            renumber[np.concatenate([[flat[start[c]]], ids[offsets[c]:offsets[c] + inner[c]], [flat[end[c]]]])].tolist()
+            for c in range(len(chains))
+        ]
+        new_rings = []
+        for ring, pieces in zip(rings, ring_pieces):
+            if pieces is None:
+                new_rings.append(renumber[np.asarray(ring, dtype=int)].tolist())
+                continue
+            new_ring: List[int] = []
+            for c, rev in pieces:
+                nodes = new_chains[c][::-1] if rev else new_chains[c]
+                new_ring.extend(nodes[:-1])
+            new_rings.append(new_ring)
+
+        # ─── <nodes> ─────────────────────────────────────────────────────
+        on_border = np.zeros(len(chains), dtype=bool)
+        if poly is not None and ring_pieces[-1]:
+            on_border[[c for c, _ in ring_pieces[-1]]] = True
+        else:
+            on_border = boundary[flat[start]] & boundary[flat[end]]
+        first, last = flat[start], flat[end]
+        nodes_elem = self.nodes.elem
+        inner_tail = node_elems[0].tail if node_elems else None
+        last_tail = node_elems[-1].tail if node_elems else None
+        for elem, k in zip(node_elems, keep):
+            if not k:
+                nodes_elem.remove(elem)
+        for c, (x, y) in zip(chain_of[fresh], placed[fresh]):
+            elem = copy.deepcopy(node_elems[first[c]])
+            elem.attrib["x"] = str(float(x))
+            elem.attrib["y"] = str(float(y))
+            elem.attrib["sam"] = "true" if sam[first[c]] and sam[last[c]] else "false"
+            elem.attrib["boundary"] = "true" if on_border[c] else "false"
+            elem.attrib["fixed"] = "true" if fixed[first[c]] and fixed[last[c]] else "false"
+            nodes_elem.append(elem)
+        remaining = list(nodes_elem.xpath("./node"))
+        for nr, elem in enumerate(remaining):
+            if "nr" in elem.attrib:
+                elem.attrib["nr"] = str(nr)
+            elem.tail = inner_tail
+        if remaining:
+            remaining[-1].tail = last_tail
+        if "n" in nodes_elem.attrib:
+            nodes_elem.attrib["n"] = str(len(remaining))
+
+        # ─── cell rings, boundary polygon and areas ──────────────────────
+        for owner, ring in zip(owners, new_rings):
+            _set_ring(owner, ring)
+            if "area" in owner.attrib and len(ring) >= 3:
+                owner.attrib["area"] = str(_polygon_area(new_coords[ring]))
+
+        # ─── walls ───────────────────────────────────────────────────────
+        edge_owners: Dict[Tuple[int, int], set] = {}
+        for label, ring in zip(labels, new_rings):
+            for u, v in zip(ring, ring[1:] + ring[:1]):
+                edge_owners.setdefault((min(u, v), max(u, v)), set()).add(label)
+        ring_of = dict(zip(labels, new_rings))
+        for w in wall_elems:
+            n1 = int(renumber[int(w.attrib["n1"])])
+            n2 = int(renumber[int(w.attrib["n2"])])
+            w.attrib["n1"], w.attrib["n2"] = str(n1), str(n2)
+            c1, c2 = int(w.attrib.get("c1", -1)), int(w.attrib.get("c2", -1))
+            if c1 not in ring_of:
+                c1, c2, n1, n2 = c2, c1, n2, n1
+            if c1 in ring_of and "length" in w.attrib:
+                wall_length = _wall_length(ring_of[c1], n1, n2, c2, edge_owners, new_coords)
+                if wall_length is not None:
+                    w.attrib["length"] = str(wall_length)
+
+        self.nodes = NodeSection(nodes_elem)
+        self.cells = CellSection(self.cells.elem)
+        self.walls = WallSection(self.walls.elem)
+        self.__dict__.pop("arrays", None)
 
     def save(self, outfile: Optional[str] = None):
         print(f"Saving to {outfile or self.path}")
@@ -381,4 +953,294 @@ class VirtualLeaf_XML:
             f"VirtualLeaf_XML('{self.path}', "
             f"leaf='{self.leaf.name}', date='{self.leaf.date}', simtime={self.leaf.simtime}, "
             f"{len(self.nodes)} nodes, {len(self.cells)} cells, {len(self.walls)} walls)"
-        )
\ No newline at end of file
+        )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 8)  Parameter-only fast path
+# ─────────────────────────────────────────────────────────────────────────────
+_CHUNK = 1 << 16
+
+
+def _block_span(buf: bytes, tag: bytes, last: bool = False) -> Optional[Tuple[int, int]]:
+    """Byte range of the (first or last) ``<tag>…</tag>`` element in *buf*."""
+    opening = list(re.finditer(b"<" + tag + rb"[\s/>]", buf))
+    if not opening:
+        return None
+    start = opening[-1 if last else 0].start()
+    close = buf.find(b">", start)
+    if close < 0:
+        return None
+    if buf[close - 1:close] == b"/":                        # <tag .../>
+        return start, close + 1
+    end = buf.find(b"</" + tag + b">", close)
+    return None if end < 0 else (start, end + len(tag) + 3)
+
+
+def _copy_range(src, dst, start: int, stop: int) -> None:
+    src.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = src.read(min(remaining, 1 << 20))
+        if not chunk:
+            break
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+class LeafMLParameters:
+    """
+    Parameter-only access to a LeafML file, for sweeps that change a few
+    ``<par>`` and ``<setting>`` values of a large tissue::
+
+        >>> p = LeafMLParameters("data/leaves/grid.xml")
+        >>> p.parameter["maxt"] = 500
+        >>> p.settings["save_movie_frames"] = "false"
+        >>> p.write("grid_variant.xml")
+
+    Only the head of the file up to ``</parameter>`` and its tail from the
+    last ``<settings>`` on are read; the two blocks are parsed from those
+    byte ranges and wrapped in a :class:`ParameterSection` and a
+    :class:`SettingsSection`.  :meth:`write` splices the two blocks back in
+    and copies everything in between (nodes, cells, walls, nodesets) byte
+    for byte, nothing of the tissue is ever parsed.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self.size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            head = b""
+            span = None
+            while span is None:
+                chunk = f.read(_CHUNK)
+                if not chunk:
+                    break
+                head += chunk
+                span = _block_span(head, b"parameter")
+            if span is None:
+                raise ValueError(f"no <parameter> block in {self.path}")
+            self.parameter_span = span
+            parameter = head[span[0]:span[1]]
+
+            # <settings> closes the file, read backwards until it is found
+            tail_start = self.size
+            tail = b""
+            settings_span = None
+            while tail_start > span[1]:
+                tail_start = max(span[1], tail_start - _CHUNK)
+                f.seek(tail_start)
+                tail = f.read(self.size - tail_start)
+                settings_span = _block_span(tail, b"settings", last=True)
+                if settings_span is not None or b"</nodes>" in tail:
+                    break
+        if settings_span is not None:
+            self.settings_span = (tail_start + settings_span[0], tail_start + settings_span[1])
+            settings = etree.fromstring(tail[settings_span[0]:settings_span[1]])
+        else:
+            # no <settings>: a new block goes in front of </leaf>
+            closing = tail.rfind(b"</leaf>")
+            at = tail_start + closing if closing >= 0 else self.size
+            self.settings_span = (at, at)
+            settings = etree.Element("settings")
+        self.parameter = ParameterSection(etree.fromstring(parameter))
+        self.settings = SettingsSection(settings)
+
+    def write(self, outfile: Optional[str] = None) -> None:
+        """Write the file with the edited blocks (in place by default)."""
+        outfile = str(outfile or self.path)
+        parameter = etree.tostring(self.parameter.elem, encoding="unicode", with_tail=False).encode()
+        settings = b""
+        if len(self.settings) or self.settings_span[0] != self.settings_span[1]:
+            settings = etree.tostring(self.settings.elem, encoding="unicode", with_tail=False).encode()
+            if self.settings_span[0] == self.settings_span[1]:
+                settings = b"  " + settings + b"\n"
+        temp = outfile + "." + str(os.getpid()) + ".part"
+        try:
+            with open(self.path, "rb") as src, open(temp, "wb") as dst:
+                _copy_range(src, dst, 0, self.parameter_span[0])
+                dst.write(parameter)
+                _copy_range(src, dst, self.parameter_span[1], self.settings_span[0])
+                dst.write(settings)
+                _copy_range(src, dst, self.settings_span[1], self.size)
+            os.replace(temp, outfile)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        if outfile == self.path:
+            self.__init__(self.path)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 9)  Compiled templates
+# ─────────────────────────────────────────────────────────────────────────────
+# quoted values may contain '>'; the attributes are matched one after the
+# other, so a 'val=' inside another attribute's value is never taken
+_ENTRY = re.compile(rb"""<(par|setting)\b((?:[^>"']+|"[^"]*"|'[^']*')*)>""")
+_ATTR = re.compile(rb"""\s+([\w:.-]+)\s*=\s*(["'])(.*?)\2""", re.S)
+_ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&apos;",
+            "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def _value_kind(text: str) -> type:
+    if text.lower() in ("true", "false"):
+        return bool
+    return type(_to_float_if_num(text))
+
+
+def _format_value(name: str, kind: type, value) -> str:
+    """*value* as attribute text; its type must fit the template value."""
+    if kind is bool:
+        if isinstance(value, (bool, np.bool_)):
+            return "true" if value else "false"
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower()
+    elif isinstance(value, (bool, np.bool_)):
+        pass
+    elif kind in (int, float):
+        # a "1" in the template may well be a float parameter
+        if isinstance(value, (int, np.integer)):
+            return str(int(value))
+        if isinstance(value, (float, np.floating)):
+            return repr(float(value))
+    elif isinstance(value, (str, os.PathLike)):
+        return os.fspath(value)
+    expected = "number" if kind in (int, float) else kind.__name__
+    raise TypeError(f"{name!r} expects a {expected} value, got {value!r}")
+
+
+def _render_chunk(template: "LeafMLTemplate", jobs: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    for outfile, values in jobs:
+        template.write(outfile, values)
+    return [outfile for outfile, _ in jobs]
+
+
+class LeafMLTemplate:
+    """
+    A LeafML file compiled once for mass variant generation::
+
+        >>> t = LeafMLTemplate("data/leaves/grid.xml",
+        ...                    parameters=["maxt", "rseed"], settings=["show_nodes"])
+        >>> t.render({"maxt": 500, "rseed": 3})            # bytes of a variant
+        >>> t.render_many([{"rseed": s} for s in range(10000)], "sweep", workers=8)
+
+    The file is read into memory once and the byte spans of the ``val``
+    attributes of the chosen ``<par>``/``<setting>`` entries are recorded.
+    Rendering joins the pre-encoded pieces between those spans with the new
+    values, nothing is parsed or serialised.  Values are checked against the
+    type of the template value (bool for true/false, a number, or str) and
+    escaped; fields left out keep their value.
+    Field names must be unique over the parameters and settings.
+    """
+
+    def __init__(self, path: str, parameters: Sequence[str] = (), settings: Sequence[str] = ()):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        wanted = {"par": list(parameters), "setting": list(settings)}
+        both = set(wanted["par"]) & set(wanted["setting"])
+        if both:
+            raise ValueError(f"fields both parameter and setting: {sorted(both)}")
+
+        blocks = {"par": _block_span(data, b"parameter"), "setting": _block_span(data, b"settings", last=True)}
+        spans: List[Tuple[int, int, str]] = []
+        self.kinds: Dict[str, type] = {}
+        self.defaults: Dict[str, str] = {}
+        self.quotes: Dict[str, str] = {}
+        for tag, names in wanted.items():
+            if not names:
+                continue
+            if blocks[tag] is None:
+                raise KeyError(f"no <{'parameter' if tag == 'par' else 'settings'}> block in {self.path}")
+            start, stop = blocks[tag]
+            found: Dict[str, Tuple[int, int, str]] = {}
+            for entry in _ENTRY.finditer(data, start, stop):
+                if entry.group(1).decode() != tag:
+                    continue
+                attrs = {m.group(1): m for m in _ATTR.finditer(entry.group(2))}
+                if b"name" not in attrs:
+                    continue
+                name = attrs[b"name"].group(3).decode()
+                if name not in names:
+                    continue
+                if name in found:
+                    raise ValueError(f"duplicate {tag} {name!r} in {self.path}")
+                if b"val" not in attrs:
+                    raise TypeError(f"{tag} {name!r} has no val attribute (array parameters are not template fields)")
+                val = attrs[b"val"]
+                offset = entry.start(2)
+                found[name] = (offset + val.start(3), offset + val.end(3), val.group(2).decode())
+            for name in names:
+                if name not in found:
+                    raise KeyError(f"{tag} {name!r} not found in {self.path}")
+                begin, end, quote = found[name]
+                text = data[begin:end].decode()
+                self.kinds[name] = _value_kind(text)
+                self.defaults[name] = text
+                self.quotes[name] = quote
+                spans.append((begin, end, name))
+
+        spans.sort()
+        self.fields: List[str] = [name for _, _, name in spans]
+        self.pieces: List[bytes] = []
+        previous = 0
+        for begin, end, _ in spans:
+            self.pieces.append(data[previous:begin])
+            previous = end
+        self.pieces.append(data[previous:])
+
+    def _escape(self, name: str, text: str) -> bytes:
+        quote = self.quotes[name]
+        escaped = "".join(_ESCAPES.get(ch, ch) if ch in "&<>\n\r\t" or ch == quote else ch for ch in text)
+        return escaped.encode()
+
+    def render(self, values: Dict[str, Any]) -> bytes:
+        """The bytes of one variant; unknown field names raise KeyError."""
+        unknown = set(values) - set(self.kinds)
+        if unknown:
+            raise KeyError(f"not template fields: {sorted(unknown)}")
+        parts = [self.pieces[0]]
+        for name, piece in zip(self.fields, self.pieces[1:]):
+            if name in values:
+                parts.append(self._escape(name, _format_value(name, self.kinds[name], values[name])))
+            else:
+                parts.append(self.defaults[name].encode())
+            parts.append(piece)
+        return b"".join(parts)
+
+    def write(self, outfile: str, values: Dict[str, Any]) -> None:
+        with open(outfile, "wb") as f:
+            f.write(self.render(values))
+
+    def render_many(self, variants: Sequence[Dict[str, Any]], outdir: str,
+                    names: Optional[Sequence[str]] = None, workers: Optional[int] = None
+                    ) -> List[str]:
+        """
+        Write every variant into *outdir* (``<stem>_00000.xml``, … unless
+        *names* are given), in *workers* processes (``1``: in this process).
+        All values are validated before anything is written.  Returns the
+        file names in the order of *variants*.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        for values in variants:
+            unknown = set(values) - set(self.kinds)
+            if unknown:
+                raise KeyError(f"not template fields: {sorted(unknown)}")
+            for name, value in values.items():
+                _format_value(name, self.kinds[name], value)
+        if names is not None and len(names) != len(variants):
+            raise ValueError(f"{len(names)} names for {len(variants)} variants")
+        os.makedirs(outdir, exist_ok=True)
+        if names is None:
+            stem = os.path.splitext(os.path.basename(self.path))[0]
+            names = [f"{stem}_{i:05d}.xml" for i in range(len(variants))]
+        jobs = [(os.path.join(outdir, name), values) for name, values in zip(names, variants)]
+        if workers == 1 or len(jobs) < 2:
+            return _render_chunk(self, jobs)
+        workers = workers or os.cpu_count() or 1
+        size = -(-len(jobs) // workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_chunk, self, jobs[i:i + size]) for i in range(0, len(jobs), size)]
+            return [outfile for future in futures for outfile in future.result()]